@@ -1,3 +1,5 @@
+import base64
+import gzip
 import json
 import numpy as np
 import pandas as pd
@@ -11,13 +13,15 @@ from aimodelshare.aws import run_function_on_lambda, get_aws_client
 from aimodelshare.aimsonnx import _get_layer_names, layer_mapping
 
 
-def get_leaderboard(apiurl, verbose=3, columns=None, submission_type="competition",token=None):
+def _post_leaderboard_request(apiurl, verbose, columns, submission_type, token, **extra):
+    """POST a get_leaderboard request to the eval Lambda; returns the decoded JSON body, or None without credentials."""
     if token == None:
         if all(["username" in os.environ, 
                "password" in os.environ]):
             pass
         else:
-            return print("'get_leaderboard()' unsuccessful. Please provide credentials with set_credentials().")
+            print("'get_leaderboard()' unsuccessful. Please provide credentials with set_credentials().")
+            return None
     else:
         pass
         
@@ -35,6 +39,7 @@ def get_leaderboard(apiurl, verbose=3, columns=None, submission_type="competitio
                "submission_type": submission_type,
                "verbose": verbose,
                "columns": columns}
+    post_dict.update(extra)
     if token == None:
         token=os.environ.get("AWS_TOKEN")
     else:
@@ -45,11 +50,149 @@ def get_leaderboard(apiurl, verbose=3, columns=None, submission_type="competitio
 
     leaderboard_json = requests.post(apiurl_eval,headers=headers,data=json.dumps(post_dict)) 
 
-    leaderboard_pd = pd.DataFrame(json.loads(leaderboard_json.text))
+    return json.loads(leaderboard_json.text)
+
+
+LEADERBOARD_FORMATS = ("json", "columnar")
+# "envelope" marker of eval Lambda responses that wrap the table (versioned,
+# scoped or columnar requests); bare to_dict() tables never carry it.
+LEADERBOARD_ENVELOPE = 1
+
+
+def _check_format(format):
+    if format not in LEADERBOARD_FORMATS:
+        raise ValueError(f"Unsupported leaderboard format {format!r}; use one of {LEADERBOARD_FORMATS}.")
+    # Only ask for the columnar format; eval Lambdas without it ignore the field
+    return {"format": format} if format != "json" else {}
+
+
+def _decode_leaderboard(payload):
+    """DataFrame of an eval Lambda encode_leaderboard() payload (columnar wire format)."""
+    table = json.loads(gzip.decompress(base64.b64decode(payload)))
+    index = pd.Index(table["index"])
+    data = {}
+    for name in table["columns"]:
+        column = table["data"][name]
+        if "codes" in column:
+            codes = np.asarray(column["codes"], dtype=np.int64)
+            values = np.empty(len(codes), dtype=object)
+            values[codes >= 0] = np.asarray(column["categories"], dtype=object)[codes[codes >= 0]]
+            values[codes < 0] = np.nan
+            data[name] = pd.Series(values, index=index, dtype=object)
+        else:
+            data[name] = pd.Series(column["values"], index=index, dtype=column["dtype"])
+    return pd.DataFrame(data, index=index, columns=table["columns"])
+
+
+def _is_envelope(body):
+    """True if a get_leaderboard response is an envelope rather than a bare to_dict() table."""
+    return body.get("envelope") == LEADERBOARD_ENVELOPE
+
+
+def _leaderboard_frame(body):
+    """
+    Leaderboard DataFrame of a get_leaderboard response: a plain to_dict() table,
+    or one wrapped under "leaderboard" in an envelope (see LEADERBOARD_ENVELOPE).
+    """
+    if not _is_envelope(body):
+        return pd.DataFrame(body)
+    if body.get("format") == "columnar":
+        return _decode_leaderboard(body["leaderboard"])
+    return pd.DataFrame(body["leaderboard"])
+
+
+def _scope_leaderboard(leaderboard, username=None, top_k=None):
+    """Client-side scope_leaderboard of the eval Lambda, for Lambdas deployed before scoped queries."""
+    if leaderboard.empty or "username" not in leaderboard.columns:
+        return leaderboard, 0, 0
+    ranked_users = leaderboard["username"].drop_duplicates().tolist()
+    user_rank = ranked_users.index(username) + 1 if username in ranked_users else 0
+
+    keep = np.zeros(len(leaderboard), dtype=bool)
+    if top_k is not None:
+        keep[:int(top_k)] = True
+    if username is not None:
+        keep |= (leaderboard["username"] == username).to_numpy()
+    return leaderboard[keep], user_rank, len(ranked_users)
+
+
+def get_leaderboard(apiurl, verbose=3, columns=None, submission_type="competition",token=None,
+                    username=None, top_k=None, format="json"):
+    """
+    Get the competition leaderboard, ranked best first.
+
+    With `username` and/or `top_k` only the rows needed for one user are
+    transferred: the first `top_k` rows and every row of `username`. The
+    returned frame's ``attrs`` then hold ``"user_rank"`` (1-based rank of the
+    user's best model among distinct users, 0 if none) and ``"users"``
+    (number of distinct users).
+
+    `format="columnar"` asks for the compact wire format (gzip'd columnar
+    JSON with typed numeric and dictionary-encoded text columns) instead of
+    ``DataFrame.to_dict()`` JSON; the result is the same table.
+    """
+    scope = {}
+    if username is not None:
+        scope["username"] = username
+    if top_k is not None:
+        scope["top_k"] = int(top_k)
+
+    leaderboard = _post_leaderboard_request(apiurl, verbose, columns, submission_type, token,
+                                            **scope, **_check_format(format))
+    if leaderboard is None:
+        return None
+    leaderboard_pd = _leaderboard_frame(leaderboard)
+    if not scope:
+        return leaderboard_pd
+
+    if _is_envelope(leaderboard) and "user_rank" in leaderboard:
+        user_rank, users = leaderboard["user_rank"], leaderboard["users"]
+    else:
+        # Eval Lambda without scoped queries: it sent the whole table
+        leaderboard_pd, user_rank, users = _scope_leaderboard(leaderboard_pd, username, top_k)
+    leaderboard_pd.attrs["user_rank"] = int(user_rank)
+    leaderboard_pd.attrs["users"] = int(users)
 
     return leaderboard_pd
 
 
+def get_leaderboard_if_changed(apiurl, known_version=None, verbose=3, columns=None, submission_type="competition", token=None,
+                               format="json"):
+    """
+    Conditional get_leaderboard: only downloads the table when it changed.
+
+    The leaderboard version is the newest submitted model version, so it grows
+    by one with every submission.
+
+    Parameters:
+    -----------
+    `known_version` : ``int`` or None
+        leaderboard version of the caller's copy (None: always download)
+    `format` : ``str``
+        wire format, "json" or "columnar" (see get_leaderboard)
+
+    Returns:
+    --------
+    (leaderboard, version) : ``(pandas.DataFrame or None, int or None)``
+        leaderboard is None when the version still equals known_version.
+        Eval Lambdas deployed before versioning always return the table, with
+        version None. (None, None) without credentials.
+    """
+    # -1 matches no version, so the Lambda always returns the table (with its version)
+    body = _post_leaderboard_request(apiurl, verbose, columns, submission_type, token,
+                                     known_version=-1 if known_version is None else int(known_version),
+                                     **_check_format(format))
+    if body is None:
+        return None, None
+    if not _is_envelope(body) or "leaderboard_version" not in body:
+        return _leaderboard_frame(body), None
+
+    version = int(body["leaderboard_version"])
+    if body.get("not_modified"):
+        return None, version
+    return _leaderboard_frame(body), version
+
+
 
 def stylize_leaderboard(leaderboard, naming_convention="keras"):
 
@@ -171,4 +314,5 @@ def consolidate_leaderboard(data, naming_convention="keras"):
 
 
 __all__ = [get_leaderboard,
+    get_leaderboard_if_changed,
     stylize_leaderboard]
@@ -55,7 +55,7 @@ def fetch_user_history(username, token):
     default_team = "Team-Unassigned"
     try:
         playground = Competition(ORIGINAL_PLAYGROUND_URL)
-        df = playground.get_leaderboard(token=token)
+        df = playground.get_leaderboard(token=token, username=username)
         if df is None or df.empty:
             return default_acc, default_team
         if "username" in df.columns and "accuracy" in df.columns:
@@ -0,0 +1,252 @@
+"""
+Incremental per-user and per-team aggregates of a competition leaderboard.
+
+The model building game answers the same questions for every user on every
+click: a user's best, latest and number of submissions, their team, their rank,
+and the team/individual summary tables. Answering them straight from the
+leaderboard DataFrame means a ``groupby``, a ``pd.to_datetime`` and a sort over
+every row per request.
+
+A :class:`LeaderboardIndex` parses timestamps once, keeps the aggregates per
+user and per team, and keeps users and teams in sorted rank lists, so a rank or
+KPI lookup is a dict access plus a binary search. New rows (a merged submission,
+the tail of a refreshed leaderboard) are added incrementally; only the changed
+user and team move in the rank lists.
+
+Semantics match the pandas code it replaces:
+
+- best / average / submissions ignore rows without an accuracy;
+- the latest row is the one with the newest valid timestamp, or the last row in
+  leaderboard order when a user has no valid timestamp;
+- ranks are by best accuracy, descending (ties by name).
+"""
+
+import bisect
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+def _parse_timestamps(values: Iterable[Any]) -> List[Optional[int]]:
+    """Timestamps as comparable integers (ns), None where missing or unparseable."""
+    values = list(values)
+    try:
+        parsed = list(pd.to_datetime(pd.Series(values, dtype=object), errors="coerce"))
+    except (TypeError, ValueError):
+        # Mixed formats / time zones: fall back to one value at a time
+        parsed = []
+        for value in values:
+            try:
+                parsed.append(pd.to_datetime(value, errors="coerce"))
+            except (TypeError, ValueError):
+                parsed.append(pd.NaT)
+    return [None if pd.isna(ts) else int(ts.value) for ts in parsed]
+
+
+def _float_or_none(value: Any) -> Optional[float]:
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if np.isnan(value) else value
+
+
+def _is_missing(value: Any) -> bool:
+    return value is None or (isinstance(value, float) and np.isnan(value))
+
+
+class _UserEntry:
+    __slots__ = ("best", "submissions", "rows", "latest_ts", "latest_score", "latest_team")
+
+    def __init__(self):
+        self.best: Optional[float] = None
+        self.submissions = 0
+        self.rows = 0
+        self.latest_ts: Optional[int] = None
+        self.latest_score: Optional[float] = None
+        self.latest_team: Any = None
+
+
+class _TeamEntry:
+    __slots__ = ("best", "total", "submissions")
+
+    def __init__(self):
+        self.best: Optional[float] = None
+        self.total = 0.0
+        self.submissions = 0
+
+
+class _RankList:
+    """Names sorted by score, descending; ties by name."""
+
+    def __init__(self):
+        self._keys: List[Tuple[float, str]] = []
+
+    def update(self, name: str, old: Optional[float], new: float) -> None:
+        if old is not None:
+            del self._keys[bisect.bisect_left(self._keys, (-old, name))]
+        bisect.insort(self._keys, (-new, name))
+
+    def rank(self, name: str, score: Optional[float]) -> int:
+        """1-based rank, or 0 if ``name`` is not ranked."""
+        return 0 if score is None else bisect.bisect_left(self._keys, (-score, name)) + 1
+
+    def __iter__(self):
+        return ((name, -neg_score) for neg_score, name in self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+
+class LeaderboardIndex:
+    """
+    Aggregates of one leaderboard, updated incrementally as rows are added.
+
+    Build one with :meth:`from_frame`; add rows with :meth:`add_rows`, or
+    :meth:`refreshed` for a newer copy of the same leaderboard. Methods are safe
+    to call from concurrent sessions.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._users: Dict[str, _UserEntry] = {}
+        self._teams: Dict[Any, _TeamEntry] = {}
+        self._user_ranks = _RankList()
+        self._team_ranks = _RankList()
+        self._versions: set = set()
+        self._all_versioned = True
+        self._user_summary: Optional[pd.DataFrame] = None
+        self._team_summary: Optional[pd.DataFrame] = None
+        self.has_accuracy = False
+        self.has_team = False
+
+    @classmethod
+    def from_frame(cls, leaderboard_df: Optional[pd.DataFrame]) -> "LeaderboardIndex":
+        index = cls()
+        if leaderboard_df is not None:
+            index.add_rows(leaderboard_df)
+        return index
+
+    def add_rows(self, rows: pd.DataFrame) -> None:
+        """Add leaderboard rows (in leaderboard order)."""
+        if rows is None or rows.empty or "username" not in rows.columns:
+            return
+        n = len(rows)
+        usernames = rows["username"].tolist()
+        scores = rows["accuracy"].tolist() if "accuracy" in rows.columns else [None] * n
+        teams = rows["Team"].tolist() if "Team" in rows.columns else [None] * n
+        timestamps = _parse_timestamps(rows["timestamp"]) if "timestamp" in rows.columns else [None] * n
+        versions = rows["version"].tolist() if "version" in rows.columns else [None] * n
+        with self._lock:
+            self.has_accuracy = self.has_accuracy or "accuracy" in rows.columns
+            self.has_team = self.has_team or "Team" in rows.columns
+            for username, score, team, ts, version in zip(usernames, scores, teams, timestamps, versions):
+                self._add(username, _float_or_none(score), team, ts, version)
+            self._user_summary = None
+            self._team_summary = None
+
+    def _add(self, username: Any, score: Optional[float], team: Any, ts: Optional[int], version: Any) -> None:
+        version = _float_or_none(version)
+        if version is None:
+            self._all_versioned = False
+        else:
+            self._versions.add(version)
+        if score is not None and not _is_missing(team):
+            team_entry = self._teams.get(team)
+            if team_entry is None:
+                team_entry = self._teams[team] = _TeamEntry()
+            team_entry.total += score
+            team_entry.submissions += 1
+            if team_entry.best is None or score > team_entry.best:
+                self._team_ranks.update(team, team_entry.best, score)
+                team_entry.best = score
+        if _is_missing(username):
+            return
+
+        user = self._users.get(username)
+        if user is None:
+            user = self._users[username] = _UserEntry()
+        user.rows += 1
+        # A valid timestamp beats none; among rows without one, the last wins
+        if ts is not None or user.latest_ts is None:
+            if user.latest_ts is None or ts is None or ts >= user.latest_ts:
+                user.latest_ts = ts
+                user.latest_score = score
+                user.latest_team = team
+        if score is not None:
+            user.submissions += 1
+            if user.best is None or score > user.best:
+                self._user_ranks.update(username, user.best, score)
+                user.best = score
+
+    def refreshed(self, leaderboard_df: Optional[pd.DataFrame]) -> "LeaderboardIndex":
+        """
+        Index of ``leaderboard_df``, a newer copy of this index's leaderboard.
+
+        When every row of both carries a submission version and all indexed
+        versions are still present, only the rows with new versions are added
+        (to this index, which is returned). Otherwise a new index is built.
+        """
+        if leaderboard_df is None or "version" not in leaderboard_df.columns:
+            return LeaderboardIndex.from_frame(leaderboard_df)
+        versions = pd.to_numeric(leaderboard_df["version"], errors="coerce")
+        with self._lock:
+            if not self._all_versioned or versions.isna().any() or not self._versions.issubset(set(versions)):
+                return LeaderboardIndex.from_frame(leaderboard_df)
+            self.add_rows(leaderboard_df[~versions.isin(self._versions)])
+        return self
+
+    def user_stats(self, username: str) -> Optional[Dict[str, Any]]:
+        """
+        ``{"best_score", "last_score", "submission_count", "rank", "team"}`` of
+        a user, or None if they have no rows. Scores are None without accuracy;
+        "submission_count" counts all of the user's rows.
+        """
+        with self._lock:
+            user = self._users.get(username)
+            if user is None:
+                return None
+            return {
+                "best_score": user.best,
+                "last_score": user.latest_score,
+                "submission_count": user.rows,
+                "rank": self._user_ranks.rank(username, user.best),
+                "team": user.latest_team,
+            }
+
+    def user_rank(self, username: str) -> int:
+        """1-based rank of a user by best accuracy, or 0 if unranked."""
+        with self._lock:
+            user = self._users.get(username)
+            return self._user_ranks.rank(username, user.best if user else None)
+
+    def user_team(self, username: str) -> Any:
+        """Team of the user's latest row, or None."""
+        with self._lock:
+            user = self._users.get(username)
+            return user.latest_team if user else None
+
+    def individual_summary(self) -> pd.DataFrame:
+        """Engineer / Best_Score / Submissions by rank, indexed from 1. Do not modify."""
+        with self._lock:
+            if self._user_summary is None:
+                rows = [(name, best, self._users[name].submissions) for name, best in self._user_ranks]
+                summary = pd.DataFrame(rows, columns=["Engineer", "Best_Score", "Submissions"])
+                summary.index = summary.index + 1
+                self._user_summary = summary
+            return self._user_summary
+
+    def team_summary(self) -> pd.DataFrame:
+        """Team / Best_Score / Avg_Score / Submissions by rank, indexed from 1. Do not modify."""
+        with self._lock:
+            if self._team_summary is None:
+                rows = [
+                    (team, best, self._teams[team].total / self._teams[team].submissions, self._teams[team].submissions)
+                    for team, best in self._team_ranks
+                ]
+                summary = pd.DataFrame(rows, columns=["Team", "Best_Score", "Avg_Score", "Submissions"])
+                summary.index = summary.index + 1
+                self._team_summary = summary
+            return self._team_summary
@@ -44,10 +44,8 @@ from sklearn.impute import SimpleImputer
 from sklearn.compose import ColumnTransformer
 from sklearn.pipeline import Pipeline
 from sklearn.preprocessing import OneHotEncoder
-from sklearn.linear_model import LogisticRegression
 from sklearn.tree import DecisionTreeClassifier
 from sklearn.ensemble import RandomForestClassifier
-from sklearn.neighbors import KNeighborsClassifier
 
 # --- AI Model Share Imports ---
 try:
@@ -63,45 +61,47 @@ except ImportError:
 
 
 # -------------------------------------------------------------------------
-# CACHE CONFIGURATION (Optimized: Thread-Safe SQLite)
+# CACHE CONFIGURATION (Pooled, read-only SQLite)
 # -------------------------------------------------------------------------
-import sqlite3
-
-CACHE_DB_FILE = "prediction_cache.sqlite"
-
-def get_cached_prediction(key):
-    """
-    Lightning-fast lookup from SQLite database.
-    THREAD-SAFE FIX: Opens a new connection for every lookup.
-    """
-    # 1. Check if DB exists
-    if not os.path.exists(CACHE_DB_FILE):
-        return None
+# Lookups, pooling, the in-memory mode, lazy training and counters all live in
+# the prediction_cache module shared by every model building app.
+from aimodelshare.moral_compass.prediction_cache import (
+    LAZY_TRAINING,
+    LAZY_TRAINING_MAX_POLLS,
+    MODEL_TYPES as CACHE_MODEL_TYPES,
+    expect_app_models,
+    get_cached_metrics,
+    get_cached_prediction,
+    lazy_train_prediction,
+    lazy_training_pending,
+    load_prepared_data,
+    preload_cache,
+    tune_model,
+)
+
+# Lookups pass this app's name, so the model fingerprints it expects (see
+# expect_app_models below) never decide what another app in the process is served.
+CACHE_APP = __name__
+
+
+def train_missing_prediction(model_name, complexity, data_size, features, sample_key):
+    """
+    Cache-miss fallback used when LAZY_TRAINING is enabled. ``sample_key`` is
+    the X_TRAIN_SAMPLES_MAP label of the data size. Waits a few seconds for
+    the job; returns None when disabled, the pool is saturated, the job fails
+    or exceeds its CPU cap, or it is still running (see training_pending).
+    """
+    return lazy_train_prediction(
+        _train_cache_miss, model_name, complexity, data_size, features,
+        X_TRAIN_SAMPLES_MAP.get(sample_key), Y_TRAIN_SAMPLES_MAP.get(sample_key), X_TEST_RAW,
+        app=CACHE_APP,
+    )
 
-    try:
-        # Use a context manager ('with') to ensure the connection 
-        # is ALWAYS closed, releasing file locks immediately.
-        # timeout=10 ensures we don't wait forever if the file is busy.
-        with sqlite3.connect(CACHE_DB_FILE, timeout=10.0) as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT value FROM cache WHERE key=?", (key,))
-            result = cursor.fetchone()
-            
-            if result:
-                return result[0] 
-            else:
-                return None
-            
-    except sqlite3.OperationalError as e:
-        # Handle locking errors gracefully
-        print(f"⚠️ CACHE LOCK ERROR: {e}. Falling back to training.", flush=True)
-        return None
-        
-    except Exception as e:
-        print(f"⚠️ DB READ ERROR: {e}", flush=True)
-        return None
+def training_pending(model_name, complexity, data_size, features):
+    """True while this app's lazy training job for the configuration is running."""
+    return lazy_training_pending(_train_cache_miss, model_name, complexity, data_size, features, app=CACHE_APP)
 
-print("✅ App configured for Thread-Safe SQLite Cache.")
+print("✅ App configured for pooled read-only SQLite Cache.")
 
 
 LEADERBOARD_CACHE_SECONDS = int(os.environ.get("LEADERBOARD_CACHE_SECONDS", "45"))
@@ -476,25 +476,19 @@ ENABLE_AUTO_RESUBMIT_AFTER_READY = False  # Future feature flag for auto-resubmi
 
 MODEL_TYPES = {
     "The Balanced Generalist": {
-        "model_builder": lambda: LogisticRegression(
-            max_iter=500, random_state=42, class_weight="balanced"
-        ),
+        "model_builder": CACHE_MODEL_TYPES["The Balanced Generalist"],
         "card": "A fast, reliable, well-rounded model. Good starting point; less prone to overfitting."
     },
     "The Rule-Maker": {
-        "model_builder": lambda: DecisionTreeClassifier(
-            random_state=42, class_weight="balanced"
-        ),
+        "model_builder": CACHE_MODEL_TYPES["The Rule-Maker"],
         "card": "Learns simple 'if/then' rules. Easy to interpret, but can miss subtle patterns."
     },
     "The 'Nearest Neighbor'": {
-        "model_builder": lambda: KNeighborsClassifier(),
+        "model_builder": CACHE_MODEL_TYPES["The 'Nearest Neighbor'"],
         "card": "Looks at the closest past examples. 'You look like these others; I'll predict like they behave.'"
     },
     "The Deep Pattern-Finder": {
-        "model_builder": lambda: RandomForestClassifier(
-            random_state=42, class_weight="balanced"
-        ),
+        "model_builder": CACHE_MODEL_TYPES["The Deep Pattern-Finder"],
         "card": "An ensemble of many decision trees. Powerful, can capture deep patterns; watch complexity."
     }
 }
@@ -581,6 +575,7 @@ INIT_FLAGS = {
     "leaderboard": False,
     "default_preprocessor": False,
     "warm_mini": False,
+    "prediction_cache_ram": False,
     "errors": []
 }
 
@@ -633,10 +628,10 @@ def safe_int(value, default=1):
     except (ValueError, TypeError):
         return default
 
-def load_and_prep_data(use_cache=True):
+def _load_csv_split(use_cache=True):
     """
-    Load, sample, and prepare raw COMPAS dataset.
-    NOW PRE-SAMPLES ALL DATA SIZES and creates warm mini dataset.
+    Download (or read the cached) COMPAS CSV, derive the features and split it.
+    Fallback for when no prepared data artifact is available.
     """
     url = "https://raw.githubusercontent.com/propublica/compas-analysis/master/compas-scores-two-years.csv"
 
@@ -683,9 +678,21 @@ def load_and_prep_data(use_cache=True):
     X = df[feature_columns].copy()
     y = df[target_column].copy()
 
-    X_train_raw, X_test_raw, y_train, y_test = train_test_split(
-        X, y, test_size=0.25, random_state=42, stratify=y
-    )
+    return train_test_split(X, y, test_size=0.25, random_state=42, stratify=y)
+
+def load_and_prep_data(use_cache=True):
+    """
+    Load, sample, and prepare raw COMPAS dataset.
+    NOW PRE-SAMPLES ALL DATA SIZES and creates warm mini dataset.
+    Uses the prepared data artifact built with the prediction cache when
+    present (the cache's exact rows and samples, no CSV parse), else the CSV.
+    """
+    prepared = load_prepared_data()
+    if prepared is not None:
+        feature_columns = sorted(list(set(ALL_NUMERIC_COLS + ALL_CATEGORICAL_COLS)))
+        X_train_raw, X_test_raw, y_train, y_test = prepared.split(feature_columns)
+    else:
+        X_train_raw, X_test_raw, y_train, y_test = _load_csv_split(use_cache)
 
     # Pre-sample all data sizes
     global X_TRAIN_SAMPLES_MAP, Y_TRAIN_SAMPLES_MAP, X_TRAIN_WARM, Y_TRAIN_WARM
@@ -695,8 +702,11 @@ def load_and_prep_data(use_cache=True):
 
     for label, frac in DATA_SIZE_MAP.items():
         if frac < 1.0:
-            X_train_sampled = X_train_raw.sample(frac=frac, random_state=42)
-            y_train_sampled = y_train.loc[X_train_sampled.index]
+            if prepared is not None:
+                X_train_sampled, y_train_sampled = prepared.sample(frac, feature_columns)
+            else:
+                X_train_sampled = X_train_raw.sample(frac=frac, random_state=42)
+                y_train_sampled = y_train.loc[X_train_sampled.index]
             X_TRAIN_SAMPLES_MAP[label] = X_train_sampled
             Y_TRAIN_SAMPLES_MAP[label] = y_train_sampled
 
@@ -716,11 +726,12 @@ def _background_initializer():
     
     Initialization sequence:
     1. Competition object connection
-    2. Dataset cached download and core split
+    2. Dataset core split (prepared data artifact, else cached CSV download)
     3. Warm mini dataset creation
     4. Progressive sampling: small -> medium -> large -> full
     5. Leaderboard prefetch
     6. Default preprocessor fit on small sample
+    7. Prediction cache preload into memory (PREDICTION_CACHE_MODE=ram only)
     """
     global playground, X_TRAIN_RAW, X_TEST_RAW, Y_TRAIN, Y_TEST
     
@@ -816,6 +827,16 @@ def _background_initializer():
             INIT_FLAGS["errors"].append(f"Default preprocessor failed: {str(e)}")
         print(f"✗ Default preprocessor failed: {e}")
     
+    try:
+        # Step 7: Load the prediction cache into RAM (lookups use SQLite until done)
+        if preload_cache():
+            with INIT_LOCK:
+                INIT_FLAGS["prediction_cache_ram"] = True
+    except Exception as e:
+        with INIT_LOCK:
+            INIT_FLAGS["errors"].append(f"La precàrrega de la memòria cau de prediccions ha fallat: {str(e)}")
+        print(f"✗ Prediction cache preload failed: {e}")
+    
 
 def _fit_default_preprocessor():
     """
@@ -1099,30 +1120,29 @@ def _ensure_dense(X):
         return X.toarray()
     return X
 
-def tune_model_complexity(model, level):
-    """
-    Map a 1–10 slider value to model hyperparameters.
-    Levels 1–3: Conservative / simple
-    Levels 4–7: Balanced
-    Levels 8–10: Aggressive / risk of overfitting
-    """
-    level = int(level)
-    if isinstance(model, LogisticRegression):
-        c_map = {1: 0.01, 2: 0.025, 3: 0.05, 4: 0.1, 5: 0.25, 6: 0.5, 7: 1.0, 8: 2.0, 9: 5.0, 10: 10.0}
-        model.C = c_map.get(level, 1.0)
-        model.max_iter = max(getattr(model, "max_iter", 0), 500)
-    elif isinstance(model, RandomForestClassifier):
-        depth_map = {1: 3, 2: 5, 3: 7, 4: 9, 5: 11, 6: 15, 7: 20, 8: 25, 9: None, 10: None}
-        est_map = {1: 20, 2: 30, 3: 40, 4: 60, 5: 80, 6: 100, 7: 120, 8: 150, 9: 180, 10: 220}
-        model.max_depth = depth_map.get(level, 10)
-        model.n_estimators = est_map.get(level, 100)
-    elif isinstance(model, DecisionTreeClassifier):
-        depth_map = {1: 2, 2: 3, 3: 4, 4: 5, 5: 6, 6: 8, 7: 10, 8: 12, 9: 15, 10: None}
-        model.max_depth = depth_map.get(level, 6)
-    elif isinstance(model, KNeighborsClassifier):
-        k_map = {1: 100, 2: 75, 3: 60, 4: 50, 5: 40, 6: 30, 7: 25, 8: 15, 9: 7, 10: 3}
-        model.n_neighbors = k_map.get(level, 25)
-    return model
+# The slider-to-hyperparameter mapping shared with precompute_cache.py
+tune_model_complexity = tune_model
+
+
+# Only serve cache entries trained with the shared models and complexity
+# mapping; entries of any other model settings are treated as cache misses.
+expect_app_models(CACHE_APP)
+
+
+def _train_cache_miss(model_name, complexity, features, X_train, y_train, X_test):
+    """Fit one configuration and predict the test set (runs in a lazy-training worker)."""
+    numeric_cols = [f for f in features if f in ALL_NUMERIC_COLS]
+    categorical_cols = [f for f in features if f not in ALL_NUMERIC_COLS]
+    preprocessor, selected_cols = build_preprocessor(numeric_cols, categorical_cols)
+    X_train_processed = preprocessor.fit_transform(X_train[selected_cols])
+    X_test_processed = preprocessor.transform(X_test[selected_cols])
+
+    model = tune_model_complexity(MODEL_TYPES[model_name]["model_builder"](), complexity)
+    if isinstance(model, (DecisionTreeClassifier, RandomForestClassifier)):
+        X_train_processed = _ensure_dense(X_train_processed)
+        X_test_processed = _ensure_dense(X_test_processed)
+    model.fit(X_train_processed, y_train)
+    return model.predict(X_test_processed)
 
 # --- New Helper Functions for HTML Generation ---
 
@@ -1898,15 +1918,28 @@ def run_experiment(
         feature_key = ",".join(sanitized_features)
         cache_key = f"{model_name_key}|{complexity_level}|{data_size_str}|{feature_key}"
         
-        # 2. Check Cache
-        cached_predictions = get_cached_prediction(cache_key)
+        # 2. Check Cache (by integer key; the string key above is only logged)
+        cached_predictions = get_cached_prediction(model_name_key, complexity_level, data_size_str, feature_set, app=CACHE_APP)
+        if cached_predictions is None and LAZY_TRAINING:
+            # Opt-in fallback: train this configuration once on the bounded worker pool.
+            # Each call waits only a few seconds; the status is refreshed between polls
+            # so no request thread is held for the whole fit.
+            for _ in range(LAZY_TRAINING_MAX_POLLS):
+                cached_predictions = train_missing_prediction(model_name_key, complexity_level, data_size_str, feature_set, data_size_str)
+                if cached_predictions is not None or not training_pending(model_name_key, complexity_level, data_size_str, feature_set):
+                    break
+                yield {
+                    submission_feedback_display: gr.update(value=get_status_html(2, "Training Model", "⏳ Training this configuration for the first time..."), visible=True),
+                    login_error: gr.update(visible=False)
+                }
+        cached_metrics = get_cached_metrics(model_name_key, complexity_level, data_size_str, feature_set, app=CACHE_APP) if cached_predictions is not None else None
         
         # Initialize submission variables
         predictions = None
         tuned_model = None
         preprocessor = None
         
-        if cached_predictions:
+        if cached_predictions is not None:
             # === FAST PATH (Zero CPU) ===
             _log(f"⚡ CACHE HIT: {cache_key}")
             yield { 
@@ -1914,12 +1947,8 @@ def run_experiment(
                 login_error: gr.update(visible=False)
             }
 
-            # --- DECOMPRESSION STEP (Vital) ---
-            # If string "01010...", convert to [0, 1, 0, 1...]
-            if isinstance(cached_predictions, str):
-                predictions = [int(c) for c in cached_predictions]
-            else:
-                predictions = cached_predictions
+            # The reader decodes bit-packed BLOBs straight to a NumPy 0/1 array.
+            predictions = cached_predictions
 
             # Pass None to submit_model to skip training overhead validation
             tuned_model = None
@@ -1956,15 +1985,19 @@ def run_experiment(
             progress(0.6, desc="Computing Preview Score...")
             
             # We need to calculate accuracy for the preview card
-            from sklearn.metrics import accuracy_score
-            # Ensure predictions are in correct format (list or array)
-            if isinstance(predictions, list):
-                # Cached predictions are lists
-                preds_array = np.array(predictions)
+            # Precomputed with the cache entry; scored here only for caches built without labels
+            if cached_metrics is not None and cached_metrics.accuracy is not None:
+                preview_score = cached_metrics.accuracy
             else:
-                preds_array = predictions
+                from sklearn.metrics import accuracy_score
+                # Ensure predictions are in correct format (list or array)
+                if isinstance(predictions, list):
+                    # Cached predictions are lists
+                    preds_array = np.array(predictions)
+                else:
+                    preds_array = predictions
                 
-            preview_score = accuracy_score(Y_TEST, preds_array)
+                preview_score = accuracy_score(Y_TEST, preds_array)
             
             preview_kpi_meta = {
                 "was_preview": True, "preview_score": preview_score, "ready_at_run_start": ready,
@@ -2054,13 +2087,17 @@ def run_experiment(
         # 1. FETCH BASELINE
         baseline_leaderboard_df = _get_leaderboard_with_optional_token(playground, token)
         
-        from sklearn.metrics import accuracy_score
-        # Ensure correct type for local accuracy calc
-        if isinstance(predictions, list):
-            local_accuracy_preds = np.array(predictions)
+        # Precomputed with the cache entry; scored here only for caches built without labels
+        if cached_metrics is not None and cached_metrics.accuracy is not None:
+            local_test_accuracy = cached_metrics.accuracy
         else:
-            local_accuracy_preds = predictions
-        local_test_accuracy = accuracy_score(Y_TEST, local_accuracy_preds)
+            from sklearn.metrics import accuracy_score
+            # Ensure correct type for local accuracy calc
+            if isinstance(predictions, list):
+                local_accuracy_preds = np.array(predictions)
+            else:
+                local_accuracy_preds = predictions
+            local_test_accuracy = accuracy_score(Y_TEST, local_accuracy_preds)
 
         # 2. SUBMIT & CAPTURE ACCURACY
         def _submit():
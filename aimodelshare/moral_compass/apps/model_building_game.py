@@ -44,10 +44,8 @@ from sklearn.impute import SimpleImputer
 from sklearn.compose import ColumnTransformer
 from sklearn.pipeline import Pipeline
 from sklearn.preprocessing import OneHotEncoder
-from sklearn.linear_model import LogisticRegression
 from sklearn.tree import DecisionTreeClassifier
 from sklearn.ensemble import RandomForestClassifier
-from sklearn.neighbors import KNeighborsClassifier
 
 # --- AI Model Share Imports ---
 try:
@@ -56,6 +54,7 @@ except ImportError:
     raise ImportError(
         "The 'aimodelshare' library is required. Install with: pip install aimodelshare"
     )
+from aimodelshare.moral_compass.apps.leaderboard_index import LeaderboardIndex
 
 # -------------------------------------------------------------------------
 # Configuration & Caching Infrastructure
@@ -63,63 +62,111 @@ except ImportError:
 
 
 # -------------------------------------------------------------------------
-# CACHE CONFIGURATION (Optimized: Thread-Safe SQLite)
+# CACHE CONFIGURATION (Pooled, read-only SQLite)
 # -------------------------------------------------------------------------
-import sqlite3
+# Lookups, pooling, the in-memory mode, lazy training and counters all live in
+# the prediction_cache module shared by every model building app.
+from aimodelshare.moral_compass.prediction_cache import (
+    LAZY_TRAINING,
+    LAZY_TRAINING_MAX_POLLS,
+    MODEL_TYPES as CACHE_MODEL_TYPES,
+    complexity_sweep,
+    expect_app_models,
+    get_cached_group_metrics,
+    get_cached_metrics,
+    get_cached_prediction,
+    lazy_train_prediction,
+    lazy_training_pending,
+    load_prepared_data,
+    preload_cache,
+    tune_model,
+)
+
+# Lookups pass this app's name, so the model fingerprints it expects (see
+# expect_app_models below) never decide what another app in the process is served.
+CACHE_APP = __name__
+
+
+def train_missing_prediction(model_name, complexity, data_size, features, sample_key):
+    """
+    Cache-miss fallback used when LAZY_TRAINING is enabled. ``sample_key`` is
+    the X_TRAIN_SAMPLES_MAP label of the data size. Waits a few seconds for
+    the job; returns None when disabled, the pool is saturated, the job fails
+    or exceeds its CPU cap, or it is still running (see training_pending).
+    """
+    return lazy_train_prediction(
+        _train_cache_miss, model_name, complexity, data_size, features,
+        X_TRAIN_SAMPLES_MAP.get(sample_key), Y_TRAIN_SAMPLES_MAP.get(sample_key), X_TEST_RAW,
+        app=CACHE_APP,
+    )
 
-CACHE_DB_FILE = "prediction_cache.sqlite"
+def training_pending(model_name, complexity, data_size, features):
+    """True while this app's lazy training job for the configuration is running."""
+    return lazy_training_pending(_train_cache_miss, model_name, complexity, data_size, features, app=CACHE_APP)
 
-def get_cached_prediction(key):
+def render_complexity_sweep(model_name, complexity, features, data_size, submission_count=0):
     """
-    Lightning-fast lookup from SQLite database.
-    THREAD-SAFE FIX: Opens a new connection for every lookup.
+    Sweep chart for the current model, features and data size: the accuracy of
+    the complexity levels the player's rank unlocks (the slider's maximum, see
+    compute_rank_settings) from one cache range query, without submitting.
     """
-    # 1. Check if DB exists
-    if not os.path.exists(CACHE_DB_FILE):
-        return None
+    if Y_TEST is None or not features:
+        return _build_complexity_sweep_html({}, complexity)
+    cap = compute_rank_settings(
+        safe_int(submission_count, 0), DEFAULT_MODEL, 1, DEFAULT_FEATURE_SET, DEFAULT_DATA_SIZE
+    )["complexity_max"]
+    accuracies = complexity_sweep(model_name or DEFAULT_MODEL, data_size or DEFAULT_DATA_SIZE, features, Y_TEST, app=CACHE_APP)
+    return _build_complexity_sweep_html({level: acc for level, acc in accuracies.items() if level <= cap}, complexity)
 
-    try:
-        # Use a context manager ('with') to ensure the connection 
-        # is ALWAYS closed, releasing file locks immediately.
-        # timeout=10 ensures we don't wait forever if the file is busy.
-        with sqlite3.connect(CACHE_DB_FILE, timeout=10.0) as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT value FROM cache WHERE key=?", (key,))
-            result = cursor.fetchone()
-            
-            if result:
-                return result[0] 
-            else:
-                return None
-            
-    except sqlite3.OperationalError as e:
-        # Handle locking errors gracefully
-        print(f"⚠️ CACHE LOCK ERROR: {e}. Falling back to training.", flush=True)
-        return None
-        
-    except Exception as e:
-        print(f"⚠️ DB READ ERROR: {e}", flush=True)
-        return None
-
-print("✅ App configured for Thread-Safe SQLite Cache.")
+print("✅ App configured for pooled read-only SQLite Cache.")
 
 
 LEADERBOARD_CACHE_SECONDS = int(os.environ.get("LEADERBOARD_CACHE_SECONDS", "45"))
+# Expired copies younger than this are served while one refresh runs in the background
+LEADERBOARD_STALE_SECONDS = int(os.environ.get("LEADERBOARD_STALE_SECONDS", "300"))
+LEADERBOARD_FETCH_WAIT_SECONDS = float(os.environ.get("LEADERBOARD_FETCH_WAIT_SECONDS", "30"))
+# Background refresher keeping the cached leaderboards warm; its interval drops to
+# the minimum while submissions arrive and doubles (up to the maximum) while idle
+LEADERBOARD_PREFETCH = os.environ.get("LEADERBOARD_PREFETCH", "true").lower() == "true"
+LEADERBOARD_PREFETCH_MIN_SECONDS = float(os.environ.get("LEADERBOARD_PREFETCH_MIN_SECONDS", "10"))
+LEADERBOARD_PREFETCH_MAX_SECONDS = float(os.environ.get("LEADERBOARD_PREFETCH_MAX_SECONDS", "120"))
 MAX_LEADERBOARD_ENTRIES = os.environ.get("MAX_LEADERBOARD_ENTRIES")
 MAX_LEADERBOARD_ENTRIES = int(MAX_LEADERBOARD_ENTRIES) if MAX_LEADERBOARD_ENTRIES else None
 DEBUG_LOG = os.environ.get("DEBUG_LOG", "false").lower() == "true"
 
 # In-memory caches (per container instance)
 # Each cache has its own lock for thread safety under concurrent requests
-_cache_lock = threading.Lock()  # Protects _leaderboard_cache
+_cache_lock = threading.Lock()  # Protects _leaderboard_cache and _leaderboard_refreshes
 _user_stats_lock = threading.Lock()  # Protects _user_stats_cache
 _auth_lock = threading.Lock()  # Protects get_aws_token() credential injection
 
 # Auth-aware leaderboard cache: separate entries for authenticated vs anonymous
-# Structure: {"anon": {"data": df, "timestamp": float}, "auth": {"data": df, "timestamp": float}}
+# Structure: {"anon": {"data": df, "timestamp": float, "version": int|None, "index": LeaderboardIndex|None}, "auth": {...}}
+# "version" is the server's leaderboard version (newest submitted model version)
+# of "data", or None when unknown; it makes refreshes conditional downloads.
+# "index" holds the per-user/per-team aggregates of "data" (built on first use,
+# then updated incrementally as rows arrive), shared by all sessions.
 _leaderboard_cache: Dict[str, Dict[str, Any]] = {
-    "anon": {"data": None, "timestamp": 0.0},
-    "auth": {"data": None, "timestamp": 0.0},
+    "anon": {"data": None, "timestamp": 0.0, "version": None, "index": None},
+    "auth": {"data": None, "timestamp": 0.0, "version": None, "index": None},
+}
+# In-flight leaderboard refresh per cache key (single-flight); set when it finishes
+_leaderboard_refreshes: Dict[str, threading.Event] = {}
+# Leaderboard prefetcher state and freshness counters (see leaderboard_freshness()).
+# Protected by _cache_lock. The prefetcher only refreshes the anonymous scope:
+# user tokens are never kept in module state, so no background call runs with
+# a user's credentials after their request.
+_leaderboard_prefetch: Dict[str, Any] = {
+    "thread": None,
+    "interval": LEADERBOARD_PREFETCH_MIN_SECONDS,
+    "last_submission": 0.0,
+    "rounds": 0,
+    "refreshes": 0,
+    "failures": 0,
+    "changes": 0,
+    "served_fresh": 0,
+    "served_stale": 0,
+    "served_after_wait": 0,
 }
 _user_stats_cache: Dict[str, Dict[str, Any]] = {}
 USER_STATS_TTL = LEADERBOARD_CACHE_SECONDS
@@ -217,13 +264,74 @@ def _get_leaderboard_with_optional_token(playground_instance: Optional["Competit
         _log(f"Leaderboard fetch failed after retries: {e}")
         return None
 
-def _fetch_leaderboard(token: Optional[str]) -> Optional[pd.DataFrame]:
+def _refresh_leaderboard(cache_key: str, token: Optional[str], known_version: Optional[int], done: threading.Event) -> Optional[pd.DataFrame]:
+    """
+    Download the leaderboard of one cache scope and store it in _leaderboard_cache.
+
+    Runs as the single in-flight refresh of ``cache_key`` (see _fetch_leaderboard);
+    sets ``done`` and clears the in-flight marker when finished. A failed
+    download keeps the previous copy (and its timestamp) so it can still be
+    served stale, and returns None.
+    """
+    try:
+        _log(f"Fetching fresh leaderboard ({cache_key}, known version {known_version})...")
+        try:
+            playground_id = "https://cf3wdpkg0d.execute-api.us-east-1.amazonaws.com/prod/m"
+            playground_instance = Competition(playground_id)
+            
+            def _fetch():
+                return playground_instance.get_leaderboard_if_changed(known_version, token=token, format="columnar")
+            
+            df, version = _retry_with_backoff(_fetch, description="leaderboard fetch")
+        except Exception as e:
+            _log(f"Leaderboard fetch failed ({cache_key}): {e}")
+            return None
+
+        if df is None and version is not None:
+            _log(f"Leaderboard unchanged ({cache_key}, version {version})")
+            with _cache_lock:
+                _leaderboard_cache[cache_key]["timestamp"] = time.time()
+                return _leaderboard_cache[cache_key]["data"]
+        if df is None:
+            return None
+        if not df.empty and MAX_LEADERBOARD_ENTRIES:
+            df = df.head(MAX_LEADERBOARD_ENTRIES)
+        _log(f"Leaderboard fetched ({cache_key}): {len(df)} entries, version {version}")
+
+        with _cache_lock:
+            previous_index = _leaderboard_cache[cache_key]["index"]
+        index = previous_index.refreshed(df) if previous_index is not None else None
+
+        with _cache_lock:
+            _leaderboard_cache[cache_key]["data"] = df
+            _leaderboard_cache[cache_key]["timestamp"] = time.time()
+            _leaderboard_cache[cache_key]["version"] = version
+            _leaderboard_cache[cache_key]["index"] = index
+        return df
+    finally:
+        with _cache_lock:
+            if _leaderboard_refreshes.get(cache_key) is done:
+                del _leaderboard_refreshes[cache_key]
+        done.set()
+
+def _fetch_leaderboard(token: Optional[str], max_age: float = LEADERBOARD_CACHE_SECONDS) -> Optional[pd.DataFrame]:
     """
     Fetch leaderboard with auth-aware caching (TTL: LEADERBOARD_CACHE_SECONDS).
     
     Concurrency Note: Cache is keyed by auth scope ("anon" vs "auth") to prevent
     cross-user data leakage. Authenticated users share a single "auth" cache entry
     to avoid unbounded cache growth. Protected by _cache_lock.
+
+    At most one refresh per scope is in flight (single-flight): when the copy
+    expires, the first caller starts the refresh and everybody else reuses it.
+    A copy younger than LEADERBOARD_STALE_SECONDS is returned immediately while
+    the refresh runs in the background (stale-while-revalidate); without one,
+    callers wait for the refresh (at most LEADERBOARD_FETCH_WAIT_SECONDS when
+    they did not start it).
+
+    Refreshes are conditional: when the cached copy's leaderboard version is
+    known, the table is only downloaded if a model was submitted since.
+    ``max_age=0`` forces that check and never returns a stale copy.
     """
     # Determine cache key based on authentication status
     cache_key = "auth" if token else "anon"
@@ -231,57 +339,275 @@ def _fetch_leaderboard(token: Optional[str]) -> Optional[pd.DataFrame]:
     
     with _cache_lock:
         cache_entry = _leaderboard_cache[cache_key]
-        if (
-            cache_entry["data"] is not None
-            and now - cache_entry["timestamp"] < LEADERBOARD_CACHE_SECONDS
-        ):
+        age = now - cache_entry["timestamp"]
+        if cache_entry["data"] is not None and age < max_age:
             _log(f"Leaderboard cache hit ({cache_key})")
+            _leaderboard_prefetch["served_fresh"] += 1
             return cache_entry["data"]
+        stale = cache_entry["data"] if max_age > 0 and age < LEADERBOARD_STALE_SECONDS else None
+        known_version = cache_entry["version"] if cache_entry["data"] is not None else None
+        done = _leaderboard_refreshes.get(cache_key)
+        leader = done is None
+        if leader:
+            done = _leaderboard_refreshes[cache_key] = threading.Event()
+        _leaderboard_prefetch["served_stale" if stale is not None else "served_after_wait"] += 1
+
+    if leader and stale is None:
+        return _refresh_leaderboard(cache_key, token, known_version, done)
+    if leader:
+        _log(f"Serving stale leaderboard ({cache_key}, {age:.0f}s old) while refreshing")
+        threading.Thread(
+            target=_refresh_leaderboard,
+            args=(cache_key, token, known_version, done),
+            name=f"leaderboard-refresh-{cache_key}",
+            daemon=True,
+        ).start()
+        return stale
+    if stale is not None:
+        _log(f"Serving stale leaderboard ({cache_key}) while another refresh runs")
+        return stale
+
+    _log(f"Waiting for in-flight leaderboard refresh ({cache_key})")
+    done.wait(LEADERBOARD_FETCH_WAIT_SECONDS)
+    with _cache_lock:
+        return _leaderboard_cache[cache_key]["data"]
 
-    _log(f"Fetching fresh leaderboard ({cache_key})...")
-    df = None
-    try:
-        playground_id = "https://cf3wdpkg0d.execute-api.us-east-1.amazonaws.com/prod/m"
-        playground_instance = Competition(playground_id)
-        
-        def _fetch():
-            return playground_instance.get_leaderboard(token=token) if token else playground_instance.get_leaderboard()
-        
-        df = _retry_with_backoff(_fetch, description="leaderboard fetch")
-        if df is not None and not df.empty and MAX_LEADERBOARD_ENTRIES:
-            df = df.head(MAX_LEADERBOARD_ENTRIES)
-        _log(f"Leaderboard fetched ({cache_key}): {len(df) if df is not None else 0} entries")
-    except Exception as e:
-        _log(f"Leaderboard fetch failed ({cache_key}): {e}")
-        df = None
+def _prefetch_leaderboard_scope(cache_key: str, token: Optional[str]) -> bool:
+    """
+    One prefetcher refresh of a cache scope, through the single-flight marker
+    (skipped when a refresh is already in flight).
 
+    Returns:
+        True if the leaderboard changed (new version, or new row count for
+        eval APIs without versions).
+    """
     with _cache_lock:
-        _leaderboard_cache[cache_key]["data"] = df
-        _leaderboard_cache[cache_key]["timestamp"] = time.time()
-    return df
+        if _leaderboard_refreshes.get(cache_key) is not None:
+            return False
+        done = _leaderboard_refreshes[cache_key] = threading.Event()
+        cache_entry = _leaderboard_cache[cache_key]
+        known_version = cache_entry["version"] if cache_entry["data"] is not None else None
+        before = (cache_entry["version"], len(cache_entry["data"]) if cache_entry["data"] is not None else -1)
+
+    df = _refresh_leaderboard(cache_key, token, known_version, done)
+
+    with _cache_lock:
+        cache_entry = _leaderboard_cache[cache_key]
+        after = (cache_entry["version"], len(cache_entry["data"]) if cache_entry["data"] is not None else -1)
+        _leaderboard_prefetch["refreshes"] += 1
+        if df is None:
+            _leaderboard_prefetch["failures"] += 1
+            return False
+        if after != before:
+            _leaderboard_prefetch["changes"] += 1
+        return after != before
+
+def _next_prefetch_interval(interval: float, active: bool) -> float:
+    """Prefetch interval after a round: the minimum while active, else doubled up to the maximum."""
+    if active:
+        return LEADERBOARD_PREFETCH_MIN_SECONDS
+    return min(interval * 2, LEADERBOARD_PREFETCH_MAX_SECONDS)
+
+def _leaderboard_prefetch_round(interval: float) -> float:
+    """
+    Refresh the anon scope; returns the next interval. The auth scope is only
+    refreshed by user requests, with the requesting user's own token.
+    """
+    round_start = time.time()
+    changed = _prefetch_leaderboard_scope("anon", None)
+
+    with _cache_lock:
+        # Submissions made through this process since the last round count as activity
+        active = changed or _leaderboard_prefetch["last_submission"] >= round_start - interval
+        interval = _next_prefetch_interval(interval, active)
+        _leaderboard_prefetch["interval"] = interval
+        _leaderboard_prefetch["rounds"] += 1
+    return interval
+
+def _leaderboard_prefetch_loop():
+    interval = LEADERBOARD_PREFETCH_MIN_SECONDS
+    while True:
+        time.sleep(interval)
+        try:
+            interval = _leaderboard_prefetch_round(interval)
+        except Exception as e:
+            _log(f"Leaderboard prefetch round failed: {e}")
+
+def start_leaderboard_prefetcher() -> bool:
+    """
+    Start the background leaderboard refresher of this process (once), unless
+    LEADERBOARD_PREFETCH is disabled.
+
+    It refreshes the anonymous cached leaderboard every LEADERBOARD_PREFETCH_MIN_SECONDS
+    while submissions arrive, backing off to LEADERBOARD_PREFETCH_MAX_SECONDS
+    when idle. Together with stale-while-revalidate in _fetch_leaderboard, user
+    requests then only wait for a download when no copy exists yet (or right
+    after their own submission).
+
+    Returns:
+        True if the prefetcher is running.
+    """
+    if not LEADERBOARD_PREFETCH:
+        return False
+    with _cache_lock:
+        if _leaderboard_prefetch["thread"] is None:
+            _leaderboard_prefetch["thread"] = threading.Thread(
+                target=_leaderboard_prefetch_loop, name="leaderboard-prefetch", daemon=True
+            )
+            _leaderboard_prefetch["thread"].start()
+    return True
+
+def leaderboard_freshness() -> Dict[str, Any]:
+    """
+    Freshness metrics of the cached leaderboards: age (seconds) and version per
+    scope, the prefetch interval, prefetch rounds/refreshes/failures/changes,
+    and how many requests were served fresh, stale, or after waiting for a download.
+    """
+    now = time.time()
+    with _cache_lock:
+        stats = {key: value for key, value in _leaderboard_prefetch.items() if key != "thread"}
+        stats["prefetching"] = _leaderboard_prefetch["thread"] is not None
+        for cache_key, cache_entry in _leaderboard_cache.items():
+            has_data = cache_entry["data"] is not None
+            stats[f"{cache_key}_age"] = now - cache_entry["timestamp"] if has_data else None
+            stats[f"{cache_key}_version"] = cache_entry["version"]
+    return stats
+
+def _leaderboard_index(leaderboard_df: Optional[pd.DataFrame]) -> LeaderboardIndex:
+    """
+    Aggregates of a leaderboard: the shared, incrementally maintained index when
+    ``leaderboard_df`` is a cached leaderboard, otherwise one built for it.
+    """
+    with _cache_lock:
+        for cache_entry in _leaderboard_cache.values():
+            if leaderboard_df is not None and cache_entry["data"] is leaderboard_df:
+                if cache_entry["index"] is None:
+                    cache_entry["index"] = LeaderboardIndex.from_frame(leaderboard_df)
+                return cache_entry["index"]
+    return LeaderboardIndex.from_frame(leaderboard_df)
+
+def _merge_leaderboard_row(leaderboard_df: Optional[pd.DataFrame], row: Dict[str, Any]) -> pd.DataFrame:
+    """
+    Append one submission row to a leaderboard copy, unless it is already in it
+    (same version, or for rows without a version, the same user and timestamp).
+    """
+    new_row = pd.DataFrame([row])
+    if leaderboard_df is None or leaderboard_df.empty:
+        return new_row
+    if isinstance(row.get("version"), int):
+        if "version" in leaderboard_df.columns:
+            versions = pd.to_numeric(leaderboard_df["version"], errors="coerce")
+            if (versions == row["version"]).any():
+                return leaderboard_df
+    elif {"username", "timestamp"} <= set(leaderboard_df.columns):
+        same = (leaderboard_df["username"] == row.get("username")) & (leaderboard_df["timestamp"] == row.get("timestamp"))
+        if same.any():
+            return leaderboard_df
+    return pd.concat([leaderboard_df, new_row], ignore_index=True)
+
+def _record_submission(token: Optional[str], row: Dict[str, Any]) -> Tuple[pd.DataFrame, bool]:
+    """
+    Merge the leaderboard row of a just-submitted model into the cached
+    leaderboard of the token's scope, so every session sees it without a download.
+
+    The row's "version" is the new leaderboard version. When it directly
+    follows the cached copy's version, nobody else submitted in between and the
+    merged copy is the current leaderboard.
+
+    Returns:
+        (merged leaderboard, True if it is known to be current)
+    """
+    cache_key = "auth" if token else "anon"
+    with _cache_lock:
+        cache_entry = _leaderboard_cache[cache_key]
+        cached_version = cache_entry["version"]
+        merged = _merge_leaderboard_row(cache_entry["data"], row)
+        current = cached_version is not None and row.get("version") == cached_version + 1
+        if merged is not cache_entry["data"] and cache_entry["index"] is not None:
+            cache_entry["index"].add_rows(pd.DataFrame([row]))
+        cache_entry["data"] = merged
+        _leaderboard_prefetch["last_submission"] = time.time()
+        if current:
+            cache_entry["version"] = row["version"]
+    return merged, current
+
+def _leaderboard_after_submission(token: Optional[str], row: Dict[str, Any]) -> Tuple[pd.DataFrame, int, bool]:
+    """
+    Leaderboard including a just-submitted model, with as few downloads as possible.
+
+    1. The row is merged into the cached leaderboard (_record_submission).
+    2. If other submissions landed since the cached copy was fetched, one
+       conditional fetch brings it up to date.
+    3. Only if the competition's eval API predates leaderboard versions does
+       this poll, up to LEADERBOARD_POLL_TRIES times, until the row appears.
+
+    A row without a version (the submit result had none) cannot be matched by
+    version, so it is confirmed like in step 3, by polling until the user's
+    rows change against the cached copy (_user_rows_changed: count, best score,
+    latest timestamp or latest accuracy). It is merged only if that times out.
+
+    Returns:
+        (leaderboard, number of fetches, True if confirmed by the server)
+    """
+    cache_key = "auth" if token else "anon"
+    versioned = isinstance(row.get("version"), int)
+    if versioned:
+        merged, current = _record_submission(token, row)
+        if current:
+            return merged, 0, True
+    else:
+        with _cache_lock:
+            before = _leaderboard_cache[cache_key]["data"]
+        username = row.get("username")
+        own_rows = before[before["username"] == username] if before is not None and "username" in before.columns else None
+        baseline = (
+            0 if own_rows is None else len(own_rows),
+            float(own_rows["accuracy"].max()) if own_rows is not None and len(own_rows) and "accuracy" in own_rows.columns else 0.0,
+            _get_user_latest_ts(before, username),
+            _get_user_latest_accuracy(before, username),
+        )
+
+    fetches = 0
+    confirmed = False
+    refreshed = None
+    for _ in range(LEADERBOARD_POLL_TRIES):
+        refreshed = _fetch_leaderboard(token, max_age=0)
+        fetches += 1
+        if refreshed is None:
+            break
+        if not versioned:
+            if _user_rows_changed(refreshed, username, *baseline):
+                confirmed = True
+                break
+            time.sleep(LEADERBOARD_POLL_SLEEP)
+            continue
+        with _cache_lock:
+            version = _leaderboard_cache[cache_key]["version"]
+        if version is not None:
+            confirmed = version >= row["version"]
+            break
+        if "version" in refreshed.columns and (pd.to_numeric(refreshed["version"], errors="coerce") == row["version"]).any():
+            confirmed = True
+            break
+        time.sleep(LEADERBOARD_POLL_SLEEP)
+
+    if confirmed and not versioned:
+        # The server's own row replaces the estimate
+        return refreshed, fetches, True
+    # The fetch replaced the cached copy; keep the row in it until the server lists it
+    merged, _ = _record_submission(token, row)
+    return merged, fetches, confirmed
 
 def _get_or_assign_team(username: str, leaderboard_df: Optional[pd.DataFrame]) -> Tuple[str, bool]:
-    """Get existing team from leaderboard or assign random team."""
+    """Get existing team (of the user's latest submission) from leaderboard or assign random team."""
     # TEAM_NAMES is defined in configuration section below
     try:
         if leaderboard_df is not None and not leaderboard_df.empty and "Team" in leaderboard_df.columns:
-            user_submissions = leaderboard_df[leaderboard_df["username"] == username]
-            if not user_submissions.empty:
-                if "timestamp" in user_submissions.columns:
-                    try:
-                        user_submissions = user_submissions.copy()
-                        user_submissions["timestamp"] = pd.to_datetime(
-                            user_submissions["timestamp"], errors="coerce"
-                        )
-                        user_submissions = user_submissions.sort_values("timestamp", ascending=False)
-                        _log(f"Sorted {len(user_submissions)} submissions by timestamp for {username}")
-                    except Exception as ts_err:
-                        _log(f"Timestamp sort error: {ts_err}")
-                existing_team = user_submissions.iloc[0]["Team"]
-                if pd.notna(existing_team) and str(existing_team).strip():
-                    normalized = _normalize_team_name(existing_team)
-                    _log(f"Found existing team for {username}: {normalized}")
-                    return normalized, False
+            existing_team = _leaderboard_index(leaderboard_df).user_team(username)
+            if pd.notna(existing_team) and str(existing_team).strip():
+                normalized = _normalize_team_name(existing_team)
+                _log(f"Found existing team for {username}: {normalized}")
+                return normalized, False
         new_team = _normalize_team_name(random.choice(TEAM_NAMES))
         _log(f"Assigning new team to {username}: {new_team}")
         return new_team, True
@@ -350,31 +676,15 @@ def _compute_user_stats(username: str, token: str) -> Dict[str, Any]:
 
     try:
         if leaderboard_df is not None and not leaderboard_df.empty:
-            user_submissions = leaderboard_df[leaderboard_df["username"] == username]
-            if not user_submissions.empty:
-                stats["submission_count"] = len(user_submissions)
-                if "accuracy" in user_submissions.columns:
-                    stats["best_score"] = float(user_submissions["accuracy"].max())
-                    if "timestamp" in user_submissions.columns:
-                        try:
-                            user_submissions = user_submissions.copy()
-                            user_submissions["timestamp"] = pd.to_datetime(
-                                user_submissions["timestamp"], errors="coerce"
-                            )
-                            recent = user_submissions.sort_values("timestamp", ascending=False).iloc[0]
-                            stats["last_score"] = float(recent["accuracy"])
-                        except:
-                            stats["last_score"] = stats["best_score"]
-                    else:
-                        stats["last_score"] = stats["best_score"]
-            
-            if "accuracy" in leaderboard_df.columns:
-                user_bests = leaderboard_df.groupby("username")["accuracy"].max()
-                ranked = user_bests.sort_values(ascending=False)
-                try:
-                    stats["rank"] = int(ranked.index.get_loc(username) + 1)
-                except KeyError:
-                    stats["rank"] = 0
+            user_stats = _leaderboard_index(leaderboard_df).user_stats(username)
+            if user_stats is not None:
+                stats["submission_count"] = user_stats["submission_count"]
+                if user_stats["best_score"] is not None:
+                    stats["best_score"] = user_stats["best_score"]
+                    stats["last_score"] = (
+                        user_stats["last_score"] if user_stats["last_score"] is not None else user_stats["best_score"]
+                    )
+                    stats["rank"] = user_stats["rank"]
     except Exception as e:
         _log(f"Error computing stats for {username}: {e}")
 
@@ -414,6 +724,38 @@ def _build_attempts_tracker_html(current_count, limit=10):
         <p style='margin:0; color:{text_color}; font-weight:600; font-size:1rem;'>{icon} {label}</p>
     </div>"""
     
+def _build_complexity_sweep_html(accuracies, current_level):
+    """
+    Generate HTML for the complexity sweep chart: one bar per cached complexity
+    level, scaled between the worst and best accuracy, current level highlighted.
+
+    Args:
+        accuracies: {complexity level: test accuracy}
+        current_level: Slider value to highlight
+
+    Returns:
+        str: HTML string for the chart (a hint when there is nothing to show)
+    """
+    if not accuracies:
+        return ("<p style='text-align:center; color:#6b7280; font-size:0.9rem; margin:8px 0;'>"
+                "📈 The complexity sweep appears here once these settings are in the cache.</p>")
+    low, high = min(accuracies.values()), max(accuracies.values())
+    bars = []
+    for level in sorted(accuracies):
+        acc = accuracies[level]
+        height = 20 + 80 * ((acc - low) / (high - low) if high > low else 1.0)
+        color = "#2563eb" if level == int(current_level or 0) else "#93c5fd"
+        bars.append(
+            f"<div title='Complexity {level}: {acc:.1%}' style='flex:1; display:flex; flex-direction:column; justify-content:flex-end; align-items:center;'>"
+            f"<div style='width:80%; height:{height:.0f}%; background:{color}; border-radius:3px 3px 0 0;'></div>"
+            f"<span style='font-size:0.7rem; color:#374151;'>{level}</span></div>"
+        )
+    best = max(accuracies, key=accuracies.get)
+    return f"""<div style='padding:8px; margin:8px 0; background:#f9fafb; border-radius:8px; border:1px solid #e5e7eb;'>
+        <p style='margin:0 0 6px 0; color:#374151; font-weight:600; font-size:0.9rem;'>📈 Accuracy by complexity (best: {best}, {accuracies[best]:.1%})</p>
+        <div style='display:flex; gap:2px; height:90px; align-items:stretch;'>{''.join(bars)}</div>
+    </div>"""
+    
 def check_attempt_limit(submission_count: int, limit: int = None) -> Tuple[bool, str]:
     """Check if submission count exceeds limit."""
     # ATTEMPT_LIMIT is defined in configuration section below
@@ -466,9 +808,10 @@ MY_PLAYGROUND_ID = "https://cf3wdpkg0d.execute-api.us-east-1.amazonaws.com/prod/
 ATTEMPT_LIMIT = 10
 
 # --- Leaderboard Polling Configuration ---
-# After a real authenticated submission, we poll the leaderboard to detect eventual consistency.
-# This prevents the "stuck on first preview KPI" issue where the leaderboard hasn't updated yet.
-# Increased from 12 to 60 to better tolerate backend latency and cold starts.
+# After a real authenticated submission, the new row is merged into the cached
+# leaderboard locally (see _leaderboard_after_submission). Polling the leaderboard
+# for eventual consistency only happens against eval APIs without leaderboard
+# versions, or when the submit result carries no version. Increased from 12 to 60 to better tolerate backend latency and cold starts.
 # If polling times out, optimistic fallback logic will provide provisional UI updates.
 LEADERBOARD_POLL_TRIES = 60  # Number of polling attempts (increased to handle backend latency/cold starts)
 LEADERBOARD_POLL_SLEEP = 1.0  # Sleep duration between polls (seconds)
@@ -476,25 +819,19 @@ ENABLE_AUTO_RESUBMIT_AFTER_READY = False  # Future feature flag for auto-resubmi
 
 MODEL_TYPES = {
     "The Balanced Generalist": {
-        "model_builder": lambda: LogisticRegression(
-            max_iter=500, random_state=42, class_weight="balanced"
-        ),
+        "model_builder": CACHE_MODEL_TYPES["The Balanced Generalist"],
         "card": "A fast, reliable, well-rounded model. Good starting point; less prone to overfitting."
     },
     "The Rule-Maker": {
-        "model_builder": lambda: DecisionTreeClassifier(
-            random_state=42, class_weight="balanced"
-        ),
+        "model_builder": CACHE_MODEL_TYPES["The Rule-Maker"],
         "card": "Learns simple 'if/then' rules. Easy to interpret, but can miss subtle patterns."
     },
     "The 'Nearest Neighbor'": {
-        "model_builder": lambda: KNeighborsClassifier(),
+        "model_builder": CACHE_MODEL_TYPES["The 'Nearest Neighbor'"],
         "card": "Looks at the closest past examples. 'You look like these others; I'll predict like they behave.'"
     },
     "The Deep Pattern-Finder": {
-        "model_builder": lambda: RandomForestClassifier(
-            random_state=42, class_weight="balanced"
-        ),
+        "model_builder": CACHE_MODEL_TYPES["The Deep Pattern-Finder"],
         "card": "An ensemble of many decision trees. Powerful, can capture deep patterns; watch complexity."
     }
 }
@@ -581,6 +918,7 @@ INIT_FLAGS = {
     "leaderboard": False,
     "default_preprocessor": False,
     "warm_mini": False,
+    "prediction_cache_ram": False,
     "errors": []
 }
 
@@ -633,10 +971,10 @@ def safe_int(value, default=1):
     except (ValueError, TypeError):
         return default
 
-def load_and_prep_data(use_cache=True):
+def _load_csv_split(use_cache=True):
     """
-    Load, sample, and prepare raw COMPAS dataset.
-    NOW PRE-SAMPLES ALL DATA SIZES and creates warm mini dataset.
+    Download (or read the cached) COMPAS CSV, derive the features and split it.
+    Fallback for when no prepared data artifact is available.
     """
     url = "https://raw.githubusercontent.com/propublica/compas-analysis/master/compas-scores-two-years.csv"
 
@@ -683,9 +1021,21 @@ def load_and_prep_data(use_cache=True):
     X = df[feature_columns].copy()
     y = df[target_column].copy()
 
-    X_train_raw, X_test_raw, y_train, y_test = train_test_split(
-        X, y, test_size=0.25, random_state=42, stratify=y
-    )
+    return train_test_split(X, y, test_size=0.25, random_state=42, stratify=y)
+
+def load_and_prep_data(use_cache=True):
+    """
+    Load, sample, and prepare raw COMPAS dataset.
+    NOW PRE-SAMPLES ALL DATA SIZES and creates warm mini dataset.
+    Uses the prepared data artifact built with the prediction cache when
+    present (the cache's exact rows and samples, no CSV parse), else the CSV.
+    """
+    prepared = load_prepared_data()
+    if prepared is not None:
+        feature_columns = sorted(list(set(ALL_NUMERIC_COLS + ALL_CATEGORICAL_COLS)))
+        X_train_raw, X_test_raw, y_train, y_test = prepared.split(feature_columns)
+    else:
+        X_train_raw, X_test_raw, y_train, y_test = _load_csv_split(use_cache)
 
     # Pre-sample all data sizes
     global X_TRAIN_SAMPLES_MAP, Y_TRAIN_SAMPLES_MAP, X_TRAIN_WARM, Y_TRAIN_WARM
@@ -695,8 +1045,11 @@ def load_and_prep_data(use_cache=True):
 
     for label, frac in DATA_SIZE_MAP.items():
         if frac < 1.0:
-            X_train_sampled = X_train_raw.sample(frac=frac, random_state=42)
-            y_train_sampled = y_train.loc[X_train_sampled.index]
+            if prepared is not None:
+                X_train_sampled, y_train_sampled = prepared.sample(frac, feature_columns)
+            else:
+                X_train_sampled = X_train_raw.sample(frac=frac, random_state=42)
+                y_train_sampled = y_train.loc[X_train_sampled.index]
             X_TRAIN_SAMPLES_MAP[label] = X_train_sampled
             Y_TRAIN_SAMPLES_MAP[label] = y_train_sampled
 
@@ -716,11 +1069,12 @@ def _background_initializer():
     
     Initialization sequence:
     1. Competition object connection
-    2. Dataset cached download and core split
+    2. Dataset core split (prepared data artifact, else cached CSV download)
     3. Warm mini dataset creation
     4. Progressive sampling: small -> medium -> large -> full
-    5. Leaderboard prefetch
+    5. Leaderboard prefetch, then the background leaderboard refresher
     6. Default preprocessor fit on small sample
+    7. Prediction cache preload into memory (PREDICTION_CACHE_MODE=ram only)
     """
     global playground, X_TRAIN_RAW, X_TEST_RAW, Y_TRAIN, Y_TEST
     
@@ -797,11 +1151,13 @@ def _background_initializer():
     try:
         # Step 5: Leaderboard prefetch (best-effort, unauthenticated)
         # Concurrency Note: Do NOT use os.environ for ambient token - prefetch
-        # anonymously to warm the cache for initial page loads.
+        # anonymously to warm the cache for initial page loads, then keep the
+        # cached leaderboards warm in the background.
         if playground is not None:
-            _ = _get_leaderboard_with_optional_token(playground, None)
+            _ = _fetch_leaderboard(None)
             with INIT_LOCK:
                 INIT_FLAGS["leaderboard"] = True
+            start_leaderboard_prefetcher()
     except Exception as e:
         with INIT_LOCK:
             INIT_FLAGS["errors"].append(f"Leaderboard prefetch failed: {str(e)}")
@@ -816,6 +1172,16 @@ def _background_initializer():
             INIT_FLAGS["errors"].append(f"Default preprocessor failed: {str(e)}")
         print(f"✗ Default preprocessor failed: {e}")
     
+    try:
+        # Step 7: Load the prediction cache into RAM (lookups use SQLite until done)
+        if preload_cache():
+            with INIT_LOCK:
+                INIT_FLAGS["prediction_cache_ram"] = True
+    except Exception as e:
+        with INIT_LOCK:
+            INIT_FLAGS["errors"].append(f"Prediction cache preload failed: {str(e)}")
+        print(f"✗ Prediction cache preload failed: {e}")
+    
 
 def _fit_default_preprocessor():
     """
@@ -1099,30 +1465,29 @@ def _ensure_dense(X):
         return X.toarray()
     return X
 
-def tune_model_complexity(model, level):
-    """
-    Map a 1–10 slider value to model hyperparameters.
-    Levels 1–3: Conservative / simple
-    Levels 4–7: Balanced
-    Levels 8–10: Aggressive / risk of overfitting
-    """
-    level = int(level)
-    if isinstance(model, LogisticRegression):
-        c_map = {1: 0.01, 2: 0.025, 3: 0.05, 4: 0.1, 5: 0.25, 6: 0.5, 7: 1.0, 8: 2.0, 9: 5.0, 10: 10.0}
-        model.C = c_map.get(level, 1.0)
-        model.max_iter = max(getattr(model, "max_iter", 0), 500)
-    elif isinstance(model, RandomForestClassifier):
-        depth_map = {1: 3, 2: 5, 3: 7, 4: 9, 5: 11, 6: 15, 7: 20, 8: 25, 9: None, 10: None}
-        est_map = {1: 20, 2: 30, 3: 40, 4: 60, 5: 80, 6: 100, 7: 120, 8: 150, 9: 180, 10: 220}
-        model.max_depth = depth_map.get(level, 10)
-        model.n_estimators = est_map.get(level, 100)
-    elif isinstance(model, DecisionTreeClassifier):
-        depth_map = {1: 2, 2: 3, 3: 4, 4: 5, 5: 6, 6: 8, 7: 10, 8: 12, 9: 15, 10: None}
-        model.max_depth = depth_map.get(level, 6)
-    elif isinstance(model, KNeighborsClassifier):
-        k_map = {1: 100, 2: 75, 3: 60, 4: 50, 5: 40, 6: 30, 7: 25, 8: 15, 9: 7, 10: 3}
-        model.n_neighbors = k_map.get(level, 25)
-    return model
+# The slider-to-hyperparameter mapping shared with precompute_cache.py
+tune_model_complexity = tune_model
+
+
+# Only serve cache entries trained with the shared models and complexity
+# mapping; entries of any other model settings are treated as cache misses.
+expect_app_models(CACHE_APP)
+
+
+def _train_cache_miss(model_name, complexity, features, X_train, y_train, X_test):
+    """Fit one configuration and predict the test set (runs in a lazy-training worker)."""
+    numeric_cols = [f for f in features if f in ALL_NUMERIC_COLS]
+    categorical_cols = [f for f in features if f not in ALL_NUMERIC_COLS]
+    preprocessor, selected_cols = build_preprocessor(numeric_cols, categorical_cols)
+    X_train_processed = preprocessor.fit_transform(X_train[selected_cols])
+    X_test_processed = preprocessor.transform(X_test[selected_cols])
+
+    model = tune_model_complexity(MODEL_TYPES[model_name]["model_builder"](), complexity)
+    if isinstance(model, (DecisionTreeClassifier, RandomForestClassifier)):
+        X_train_processed = _ensure_dense(X_train_processed)
+        X_test_processed = _ensure_dense(X_test_processed)
+    model.fit(X_train_processed, y_train)
+    return model.predict(X_test_processed)
 
 # --- New Helper Functions for HTML Generation ---
 
@@ -1395,24 +1760,11 @@ def generate_competitive_summary(leaderboard_df, team_name, username, last_submi
             0.0, 0, 0.0
         )
 
-    # Team summary
+    # Team and individual summaries, from the (shared, incrementally updated) leaderboard index
+    leaderboard_index = _leaderboard_index(leaderboard_df)
     if "Team" in leaderboard_df.columns:
-        team_summary_df = (
-            leaderboard_df.groupby("Team")["accuracy"]
-            .agg(Best_Score="max", Avg_Score="mean", Submissions="count")
-            .reset_index()
-            .sort_values("Best_Score", ascending=False)
-            .reset_index(drop=True)
-        )
-        team_summary_df.index = team_summary_df.index + 1
-
-    # Individual summary
-    user_bests = leaderboard_df.groupby("username")["accuracy"].max()
-    user_counts = leaderboard_df.groupby("username")["accuracy"].count()
-    individual_summary_df = pd.DataFrame(
-        {"Engineer": user_bests.index, "Best_Score": user_bests.values, "Submissions": user_counts.values}
-    ).sort_values("Best_Score", ascending=False).reset_index(drop=True)
-    individual_summary_df.index = individual_summary_df.index + 1
+        team_summary_df = leaderboard_index.team_summary()
+    individual_summary_df = leaderboard_index.individual_summary()
 
     # Get stats for KPI card
     new_rank = 0
@@ -1420,33 +1772,14 @@ def generate_competitive_summary(leaderboard_df, team_name, username, last_submi
     this_submission_score = 0.0
 
     try:
-        # All submissions for this user
-        user_rows = leaderboard_df[leaderboard_df["username"] == username].copy()
-
-        if not user_rows.empty:
-            # Attempt robust timestamp parsing
-            if "timestamp" in user_rows.columns:
-                parsed_ts = pd.to_datetime(user_rows["timestamp"], errors="coerce")
-
-                if parsed_ts.notna().any():
-                    # At least one valid timestamp → use parsed ordering
-                    user_rows["__parsed_ts"] = parsed_ts
-                    user_rows = user_rows.sort_values("__parsed_ts", ascending=False)
-                    this_submission_score = float(user_rows.iloc[0]["accuracy"])
-                else:
-                    # All timestamps invalid → assume append order, take last as "latest"
-                    this_submission_score = float(user_rows.iloc[-1]["accuracy"])
-            else:
-                # No timestamp column → fallback to last row
-                this_submission_score = float(user_rows.iloc[-1]["accuracy"])
-
-        # Rank & best accuracy (unchanged logic, but make sure we use the same best row)
-        my_rank_row = None
-        # Build individual summary before this block (already done above)
-        my_rank_row = individual_summary_df[individual_summary_df["Engineer"] == username]
-        if not my_rank_row.empty:
-            new_rank = my_rank_row.index[0]
-            new_best_accuracy = float(my_rank_row["Best_Score"].iloc[0])
+        user_stats = leaderboard_index.user_stats(username)
+        if user_stats is not None:
+            # Latest submission: newest valid timestamp, else last row in leaderboard order
+            if user_stats["last_score"] is not None:
+                this_submission_score = user_stats["last_score"]
+            if user_stats["best_score"] is not None:
+                new_rank = user_stats["rank"]
+                new_best_accuracy = user_stats["best_score"]
 
     except Exception as e:
         _log(f"Latest submission score extraction failed: {e}")
@@ -1948,28 +2281,45 @@ def run_experiment(
         feature_key = ",".join(sanitized_features)
         cache_key = f"{model_name_key}|{complexity_level}|{data_size_str}|{feature_key}"
         
-        # 2. Check Cache
-        cached_predictions = get_cached_prediction(cache_key)
+        # 2. Check Cache (by integer key; the string key above is only logged)
+        cached_predictions = get_cached_prediction(model_name_key, complexity_level, data_size_str, feature_set, app=CACHE_APP)
+        if cached_predictions is None and LAZY_TRAINING:
+            # Opt-in fallback: train this configuration once on the bounded worker pool.
+            # Each call waits only a few seconds; the status is refreshed between polls
+            # so no request thread is held for the whole fit.
+            for _ in range(LAZY_TRAINING_MAX_POLLS):
+                cached_predictions = train_missing_prediction(model_name_key, complexity_level, data_size_str, feature_set, data_size_str)
+                if cached_predictions is not None or not training_pending(model_name_key, complexity_level, data_size_str, feature_set):
+                    break
+                yield {
+                    submission_feedback_display: gr.update(value=get_status_html(2, "Training Model", "⏳ Training this configuration for the first time..."), visible=True),
+                    login_error: gr.update(visible=False)
+                }
+        cached_metrics = get_cached_metrics(model_name_key, complexity_level, data_size_str, feature_set, app=CACHE_APP) if cached_predictions is not None else None
         
         # Initialize submission variables
         predictions = None
         tuned_model = None
         preprocessor = None
         
-        if cached_predictions:
+        if cached_predictions is not None:
             # === FAST PATH (Zero CPU) ===
             _log(f"⚡ CACHE HIT: {cache_key}")
+            if DEBUG_LOG:
+                group_metrics = get_cached_group_metrics(model_name_key, complexity_level, data_size_str, feature_set, app=CACHE_APP)
+                for attribute, counts in (group_metrics or {}).items():
+                    rates = ", ".join(
+                        f"{group}: FPR {c.fpr if c.fpr is not None else float('nan'):.2f} / FNR {c.fnr if c.fnr is not None else float('nan'):.2f}"
+                        for group, c in counts.items()
+                    )
+                    _log(f"   {attribute} -> {rates}")
             yield { 
                 submission_feedback_display: gr.update(value=get_status_html(2, "Training Model", "⚡ The machine is learning from history..."), visible=True),
                 login_error: gr.update(visible=False)
             }
 
-            # --- DECOMPRESSION STEP (Vital) ---
-            # If string "01010...", convert to [0, 1, 0, 1...]
-            if isinstance(cached_predictions, str):
-                predictions = [int(c) for c in cached_predictions]
-            else:
-                predictions = cached_predictions
+            # The reader decodes bit-packed BLOBs straight to a NumPy 0/1 array.
+            predictions = cached_predictions
 
             # Pass None to submit_model to skip training overhead validation
             tuned_model = None
@@ -2005,15 +2355,19 @@ def run_experiment(
             progress(0.6, desc="Computing Preview Score...")
             
             # We need to calculate accuracy for the preview card
-            from sklearn.metrics import accuracy_score
-            # Ensure predictions are in correct format (list or array)
-            if isinstance(predictions, list):
-                # Cached predictions are lists
-                preds_array = np.array(predictions)
+            # Precomputed with the cache entry; scored here only for caches built without labels
+            if cached_metrics is not None and cached_metrics.accuracy is not None:
+                preview_score = cached_metrics.accuracy
             else:
-                preds_array = predictions
+                from sklearn.metrics import accuracy_score
+                # Ensure predictions are in correct format (list or array)
+                if isinstance(predictions, list):
+                    # Cached predictions are lists
+                    preds_array = np.array(predictions)
+                else:
+                    preds_array = predictions
                 
-            preview_score = accuracy_score(Y_TEST, preds_array)
+                preview_score = accuracy_score(Y_TEST, preds_array)
             
             preview_kpi_meta = {
                 "was_preview": True, "preview_score": preview_score, "ready_at_run_start": ready,
@@ -2100,37 +2454,26 @@ def run_experiment(
         description = f"{model_name_key} (Cplx:{complexity_level} Size:{data_size_str})"
         tags = f"team:{team_name},model:{model_name_key}"
 
-        # 1. FETCH BASELINE SNAPSHOT (non-cached) before submission
-        baseline_leaderboard_df = _get_leaderboard_with_optional_token(playground, token)
-        
-        # Capture baseline user stats for comparison after submission
-        baseline_row_count = 0
-        baseline_best_score = 0.0
-        baseline_latest_ts = None
-        baseline_latest_score = None
-        
-        if baseline_leaderboard_df is not None and not baseline_leaderboard_df.empty:
-            user_rows = baseline_leaderboard_df[baseline_leaderboard_df["username"] == username]
-            if not user_rows.empty:
-                baseline_row_count = len(user_rows)
-                if "accuracy" in user_rows.columns:
-                    baseline_best_score = float(user_rows["accuracy"].max())
-                baseline_latest_ts = _get_user_latest_ts(baseline_leaderboard_df, username)
-                baseline_latest_score = _get_user_latest_accuracy(baseline_leaderboard_df, username)
+        # 1. BASELINE SNAPSHOT: the shared cached leaderboard (a conditional
+        # refresh if expired), which the new row is merged into after submitting
+        _fetch_leaderboard(token)
         
-        _log(f"Baseline snapshot: row_count={baseline_row_count}, best_score={baseline_best_score:.4f}, latest_ts={baseline_latest_ts}, latest_score={baseline_latest_score}")
-        
-        from sklearn.metrics import accuracy_score
-        # Ensure correct type for local accuracy calc
-        if isinstance(predictions, list):
-            local_accuracy_preds = np.array(predictions)
+        # Precomputed with the cache entry; scored here only for caches built without labels
+        if cached_metrics is not None and cached_metrics.accuracy is not None:
+            local_test_accuracy = cached_metrics.accuracy
         else:
-            local_accuracy_preds = predictions
-        local_test_accuracy = accuracy_score(Y_TEST, local_accuracy_preds)
+            from sklearn.metrics import accuracy_score
+            # Ensure correct type for local accuracy calc
+            if isinstance(predictions, list):
+                local_accuracy_preds = np.array(predictions)
+            else:
+                local_accuracy_preds = predictions
+            local_test_accuracy = accuracy_score(Y_TEST, local_accuracy_preds)
 
         # 2. SUBMIT & CAPTURE ACCURACY with submission_ok flag
         submission_ok = False
         this_submission_score = local_test_accuracy  # Initialize with local score
+        submitted_version = None
         submission_error = ""  # Initialize with empty string
         
         def _submit():
@@ -2148,9 +2491,10 @@ def run_experiment(
         
         try:
             submit_result = _retry_with_backoff(_submit, description="model submission")
-            # Parse submission result to get server-side accuracy
+            # Parse submission result to get the model version (= new leaderboard version) and server-side accuracy
             if isinstance(submit_result, tuple) and len(submit_result) == 3:
-                _, _, metrics = submit_result
+                model_version, _, metrics = submit_result
+                submitted_version = int(model_version) if str(model_version).isdigit() else None
                 if metrics and "accuracy" in metrics and metrics["accuracy"] is not None:
                     this_submission_score = float(metrics["accuracy"])
                 # else: keep local_test_accuracy as fallback (already initialized above)
@@ -2221,10 +2565,10 @@ def run_experiment(
             yield failure_updates
             return
 
-        # --- Stage 4: Poll for leaderboard update (submission succeeded) ---
+        # --- Stage 4: Update leaderboard with the submission (submission succeeded) ---
         progress(0.7, desc="Verifying submission...")
         
-        # Show pending KPI card while polling
+        # Show pending KPI card while the leaderboard updates
         pending_kpi_html = _build_kpi_card_html(
             new_score=0, last_score=last_submission_score, new_rank=0, last_rank=last_rank,
             submission_count=submission_count, is_preview=False, is_pending=True,
@@ -2235,34 +2579,23 @@ def run_experiment(
             login_error: gr.update(visible=False)
         }
         
-        # Poll leaderboard until user's rows change or timeout
-        poll_detected_change = False
-        poll_iterations = 0
-        updated_leaderboard_df = None  # Will hold the fresh leaderboard if polling succeeds
-        
-        for attempt in range(LEADERBOARD_POLL_TRIES):
-            poll_iterations = attempt + 1
-            _log(f"Polling attempt {poll_iterations}/{LEADERBOARD_POLL_TRIES}")
-            
-            # Fetch fresh leaderboard (bypass cache)
-            refreshed_leaderboard = _get_leaderboard_with_optional_token(playground, token)
-            
-            # Check if user's rows changed
-            if _user_rows_changed(
-                refreshed_leaderboard, username, baseline_row_count, baseline_best_score,
-                baseline_latest_ts, baseline_latest_score
-            ):
-                _log(f"User rows changed detected after {poll_iterations} polls")
-                poll_detected_change = True
-                updated_leaderboard_df = refreshed_leaderboard  # Store updated leaderboard
-                break
-            
-            time.sleep(LEADERBOARD_POLL_SLEEP)
+        # Merge the new row into the cached leaderboard; download only if other
+        # submissions landed since the cached copy (or the eval API is unversioned)
+        new_row = {
+            "username": username,
+            "accuracy": this_submission_score,
+            "Team": team_name,
+            # Approximates the backend timestamp until a refresh brings the real row
+            "timestamp": pd.Timestamp.now(),
+            # None when the submit result carries no version: confirmed by polling instead
+            "version": submitted_version
+        }
+        final_leaderboard_df, poll_iterations, poll_detected_change = _leaderboard_after_submission(token, new_row)
         
         if not poll_detected_change:
-            _log(f"Polling timed out after {poll_iterations} attempts. Using optimistic fallback.")
+            _log(f"Leaderboard not confirmed after {poll_iterations} fetches. Using optimistic merge.")
         
-        # --- Stage 5: Calculate final state (optimistic if polling timed out) ---
+        # --- Stage 5: Calculate final state (optimistic if not confirmed) ---
         progress(0.9, desc="Calculating Rank...")
         
         # Increment submission count ONLY after verified success (or timeout with optimistic fallback)
@@ -2270,29 +2603,6 @@ def run_experiment(
         new_first_submission_score = first_submission_score
         if submission_count == 0 and first_submission_score is None:
             new_first_submission_score = this_submission_score
-        
-        # Use polled leaderboard if available, else simulate with baseline
-        if poll_detected_change and updated_leaderboard_df is not None:
-            # Real data from polling - use the updated leaderboard
-            final_leaderboard_df = updated_leaderboard_df
-        else:
-            # Optimistic fallback: simulate the new row using baseline snapshot
-            # Note: We use pd.Timestamp.now() as an approximation. This may not match
-            # the exact backend timestamp, but it's acceptable for the fallback case
-            # since the real leaderboard will eventually be consistent.
-            simulated_df = baseline_leaderboard_df.copy() if baseline_leaderboard_df is not None else pd.DataFrame()
-            new_row = pd.DataFrame([{
-                "username": username,
-                "accuracy": this_submission_score,
-                "Team": team_name,
-                "timestamp": pd.Timestamp.now(), 
-                "version": "latest"
-            }])
-            if not simulated_df.empty:
-                simulated_df = pd.concat([simulated_df, new_row], ignore_index=True)
-            else:
-                simulated_df = new_row
-            final_leaderboard_df = simulated_df
 
         # Generate tables and KPI card from final leaderboard
         team_html, individual_html, _, new_best_accuracy, new_rank, _ = generate_competitive_summary(
@@ -3909,6 +4219,7 @@ def create_model_building_game_app(theme_primary_hue: str = "indigo") -> "gr.Blo
                         minimum=1, maximum=3, step=1, value=2,
                         info="Higher values allow deeper pattern learning; very high values may overfit."
                     )
+                    complexity_sweep_display = gr.HTML(_build_complexity_sweep_html({}, 2))
 
                     gr.Markdown("---") # Separator
 
@@ -4208,6 +4519,12 @@ def create_model_building_game_app(theme_primary_hue: str = "indigo") -> "gr.Blo
         )
         complexity_slider.change(fn=lambda v: v, inputs=complexity_slider, outputs=complexity_state)
 
+        # Sweep chart: one cache range query whenever the configuration or the
+        # slider's cap (a new rank after a submission) changes
+        sweep_inputs = [model_type_radio, complexity_slider, feature_set_checkbox, data_size_radio, submission_count_state]
+        for component in sweep_inputs:
+            component.change(fn=render_complexity_sweep, inputs=sweep_inputs, outputs=complexity_sweep_display)
+
         feature_set_checkbox.change(
             fn=lambda v: v or [],
             inputs=feature_set_checkbox,
@@ -0,0 +1,156 @@
+"""
+aimodelshare.moral_compass.prediction_cache - shared access to the precomputed
+prediction cache used by the model building game apps.
+
+Apps look entries up with the configuration-level functions of :mod:`.lookup`
+(``get_cached_prediction``, ``get_cached_predictions``, ``get_cached_metrics``,
+...), which all go through one process-wide :class:`PredictionCacheReader`,
+and load the build's train/test rows with :func:`load_prepared_data`. The
+estimators (``MODEL_TYPES``, ``tune_model``) come from :mod:`.models`, shared
+with ``precompute_cache.py``.
+"""
+from .codec import (
+    encode_predictions,
+    decode_predictions,
+    PredictionCodecError,
+    FORMAT_VERSION,
+)
+from .keys import (
+    encode_key,
+    decode_key,
+    key_model,
+    legacy_key_to_int,
+    int_to_legacy_key,
+    CacheKeyError,
+    MODEL_NAMES,
+    DATA_SIZES,
+    ALL_FEATURES,
+)
+from .fingerprint import (
+    fingerprint,
+    estimator_fingerprint,
+    model_fingerprints,
+    DATA_FINGERPRINT_META,
+    MODEL_FINGERPRINTS_META,
+    FIT_INDEPENDENT,
+    FIT_APPROXIMATE_SWEEP,
+)
+from .models import MODEL_TYPES, tune_model
+from .lru import ByteLRUCache
+from .metrics import (
+    EntryMetrics,
+    GroupConfusion,
+    MetricScorer,
+    MetricsError,
+    METRIC_NAMES,
+    GROUP_ATTRIBUTES,
+    encode_metrics,
+    decode_metrics,
+)
+from .store import PredictionCacheWriter, vector_digest
+from .matrix import PackedPredictionMatrix
+from .lazy import (
+    LazyTrainer,
+    OverlayCache,
+    TrainingTimeout,
+    get_lazy_trainer,
+    overlay_path,
+)
+from .reader import (
+    PredictionCacheReader,
+    get_reader,
+    DEFAULT_DB_PATH,
+)
+from .dataset import (
+    PreparedData,
+    PreparedDataError,
+    DATA_ARTIFACT_VERSION,
+    DEFAULT_DATA_PATH,
+    write_prepared_data,
+    read_prepared_data,
+    load_prepared_data,
+)
+from .lookup import (
+    CacheConfig,
+    LAZY_TRAINING,
+    LAZY_TRAINING_MAX_POLLS,
+    config_key,
+    get_cached_prediction,
+    get_cached_predictions,
+    complexity_sweep,
+    model_sweep,
+    get_cached_metrics,
+    get_cached_group_metrics,
+    lazy_train_prediction,
+    lazy_training_pending,
+    expect_app_models,
+    preload_cache,
+    cache_stats,
+)
+
+__all__ = [
+    "encode_predictions",
+    "decode_predictions",
+    "PredictionCodecError",
+    "FORMAT_VERSION",
+    "encode_key",
+    "decode_key",
+    "key_model",
+    "legacy_key_to_int",
+    "int_to_legacy_key",
+    "CacheKeyError",
+    "MODEL_NAMES",
+    "DATA_SIZES",
+    "ALL_FEATURES",
+    "fingerprint",
+    "estimator_fingerprint",
+    "model_fingerprints",
+    "DATA_FINGERPRINT_META",
+    "MODEL_FINGERPRINTS_META",
+    "FIT_INDEPENDENT",
+    "FIT_APPROXIMATE_SWEEP",
+    "MODEL_TYPES",
+    "tune_model",
+    "ByteLRUCache",
+    "EntryMetrics",
+    "GroupConfusion",
+    "MetricScorer",
+    "MetricsError",
+    "METRIC_NAMES",
+    "GROUP_ATTRIBUTES",
+    "encode_metrics",
+    "decode_metrics",
+    "PredictionCacheWriter",
+    "vector_digest",
+    "PackedPredictionMatrix",
+    "LazyTrainer",
+    "OverlayCache",
+    "TrainingTimeout",
+    "get_lazy_trainer",
+    "overlay_path",
+    "PredictionCacheReader",
+    "get_reader",
+    "DEFAULT_DB_PATH",
+    "PreparedData",
+    "PreparedDataError",
+    "DATA_ARTIFACT_VERSION",
+    "DEFAULT_DATA_PATH",
+    "write_prepared_data",
+    "read_prepared_data",
+    "load_prepared_data",
+    "CacheConfig",
+    "LAZY_TRAINING",
+    "LAZY_TRAINING_MAX_POLLS",
+    "config_key",
+    "get_cached_prediction",
+    "get_cached_predictions",
+    "complexity_sweep",
+    "model_sweep",
+    "get_cached_metrics",
+    "get_cached_group_metrics",
+    "lazy_train_prediction",
+    "lazy_training_pending",
+    "expect_app_models",
+    "preload_cache",
+    "cache_stats",
+]
@@ -0,0 +1,82 @@
+"""
+Binary encoding for cached prediction vectors.
+
+Each cached model stores ~1000 binary test-set predictions. Instead of one
+ASCII '0'/'1' character per prediction, vectors are stored as a small
+versioned header followed by ``numpy.packbits`` output (8 predictions/byte):
+
+    magic (2 bytes, b"PB") | format version (uint8) | length (uint32, LE) | packed bits
+
+Decoding is a single ``np.unpackbits`` call, with no per-element Python loop.
+Legacy TEXT values ("0101..." strings or JSON lists) are still accepted so an
+older ``prediction_cache.sqlite`` keeps working.
+"""
+
+import json
+import struct
+from typing import Any, Union
+
+import numpy as np
+
+FORMAT_MAGIC = b"PB"
+FORMAT_VERSION = 1
+
+_HEADER = struct.Struct("<2sBI")
+_ASCII_ZERO = ord("0")
+
+
+class PredictionCodecError(ValueError):
+    """Raised when a prediction vector cannot be encoded or decoded."""
+    pass
+
+
+def _as_binary_array(predictions: Any) -> np.ndarray:
+    """Coerce predictions (sequence, array or '0101' string) to a uint8 0/1 array."""
+    if isinstance(predictions, str):
+        arr = np.frombuffer(predictions.encode("ascii"), dtype=np.uint8) - _ASCII_ZERO
+    else:
+        arr = np.asarray(predictions).ravel()
+        if arr.dtype == bool:
+            arr = arr.astype(np.uint8)
+    if arr.size and (arr.min() < 0 or arr.max() > 1):
+        raise PredictionCodecError("Prediction vectors must be binary (0/1).")
+    return arr.astype(np.uint8, copy=False)
+
+
+def encode_predictions(predictions: Any) -> bytes:
+    """
+    Encode binary predictions as a versioned, bit-packed BLOB.
+
+    Args:
+        predictions: Sequence/array of 0/1 labels, or a legacy "0101" string.
+
+    Returns:
+        bytes: Header followed by packed bits.
+    """
+    arr = _as_binary_array(predictions)
+    return _HEADER.pack(FORMAT_MAGIC, FORMAT_VERSION, arr.size) + np.packbits(arr).tobytes()
+
+
+def decode_predictions(value: Union[bytes, bytearray, memoryview, str]) -> np.ndarray:
+    """
+    Decode a cached value into a uint8 NumPy array of 0/1 predictions.
+
+    Accepts bit-packed BLOBs as well as legacy "0101" strings and JSON list strings.
+    """
+    if isinstance(value, str):
+        if value.startswith("["):
+            return _as_binary_array(json.loads(value))
+        return _as_binary_array(value)
+
+    buf = memoryview(value)
+    if len(buf) < _HEADER.size:
+        raise PredictionCodecError("Prediction blob is shorter than its header.")
+    magic, version, length = _HEADER.unpack_from(buf)
+    if magic != FORMAT_MAGIC:
+        raise PredictionCodecError(f"Unknown prediction blob magic: {bytes(magic)!r}")
+    if version != FORMAT_VERSION:
+        raise PredictionCodecError(f"Unsupported prediction blob version: {version}")
+    packed = np.frombuffer(buf, dtype=np.uint8, offset=_HEADER.size)
+    if packed.size * 8 < length:
+        raise PredictionCodecError("Prediction blob is truncated.")
+    return np.unpackbits(packed, count=length)
@@ -0,0 +1,193 @@
+"""
+Prepared COMPAS data shared by the cache build and the model building apps.
+
+Cached predictions are only valid for the exact test rows they were computed
+against. ``precompute_cache.py --export-data`` writes the rows it trained on
+(after the row cap, ``length_of_stay`` and ``c_charge_desc`` bucketing), its
+train/test split and the row order of every data size sample to one versioned
+``.npz`` file. Apps load it at startup (:func:`load_prepared_data`) instead of
+downloading the CSV and re-deriving all of this, so their test rows are the
+cache's by construction.
+
+Every column is stored as its own array: numeric columns keep their dtype,
+text columns are dictionary encoded (int32 codes, -1 for missing, the category
+strings and the pandas dtype), so the file loads without pickle. Original row
+labels are kept, so the frames are equal (values, dtypes and index) to the
+ones the CSV path builds.
+"""
+
+import logging
+import os
+from typing import Any, Dict, Iterable, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger("aimodelshare.moral_compass")
+
+# Bump when the layout changes; older files are ignored (apps fall back to the CSV)
+DATA_ARTIFACT_VERSION = 1
+DEFAULT_DATA_PATH = os.environ.get("PREDICTION_CACHE_DATA", "compas_prepared.npz")
+
+_NUMERIC_PREFIX = "values__"
+_CODES_PREFIX = "codes__"
+_CATEGORIES_PREFIX = "categories__"
+_DTYPE_PREFIX = "dtype__"
+_SAMPLE_PREFIX = "sample__"
+
+
+class PreparedDataError(ValueError):
+    """Raised when a data artifact cannot be written or read."""
+
+
+def _fraction_key(fraction: float) -> float:
+    return round(float(fraction), 6)
+
+
+def _encode_column(name: str, values: pd.Series, arrays: Dict[str, np.ndarray]) -> None:
+    if pd.api.types.is_numeric_dtype(values):
+        arrays[_NUMERIC_PREFIX + name] = values.to_numpy()
+        return
+    missing = values.isna().to_numpy()
+    categories, codes = np.unique(values[~missing].astype(str).to_numpy(), return_inverse=True)
+    full = np.full(len(values), -1, dtype=np.int32)
+    full[~missing] = codes
+    arrays[_CODES_PREFIX + name] = full
+    arrays[_CATEGORIES_PREFIX + name] = categories.astype(str)
+    arrays[_DTYPE_PREFIX + name] = np.array(str(values.dtype))
+
+
+def _decode_column(name: str, data: Mapping[str, np.ndarray], index: pd.Index) -> pd.Series:
+    if _NUMERIC_PREFIX + name in data:
+        return pd.Series(data[_NUMERIC_PREFIX + name], index=index, name=name)
+    codes = data[_CODES_PREFIX + name]
+    values = data[_CATEGORIES_PREFIX + name].astype(object)[np.maximum(codes, 0)]
+    values[codes < 0] = np.nan
+    return pd.Series(values, index=index, name=name, dtype=object).astype(str(data[_DTYPE_PREFIX + name]))
+
+
+def write_prepared_data(
+    path: str,
+    X_train: pd.DataFrame,
+    X_test: pd.DataFrame,
+    y_train: pd.Series,
+    y_test: pd.Series,
+    samples: Mapping[float, Iterable[Any]],
+    data_fingerprint: Optional[str] = None,
+) -> None:
+    """
+    Write a train/test split and its data size samples as a data artifact.
+
+    Args:
+        path: Output path. An existing file is replaced atomically.
+        X_train, X_test, y_train, y_test: The split, as returned by ``train_test_split``.
+        samples: ``{train fraction: X_train row labels of that sample, in sample order}``.
+        data_fingerprint: Data fingerprint of the build (see :mod:`.fingerprint`).
+    """
+    if list(X_train.columns) != list(X_test.columns):
+        raise PreparedDataError("Train and test frames have different columns.")
+    frame = pd.concat([X_train, X_test])
+    arrays = {
+        "version": np.array(DATA_ARTIFACT_VERSION),
+        "columns": np.array(list(frame.columns), dtype=str),
+        "index": frame.index.to_numpy(dtype=np.int64),
+        "target": pd.concat([y_train, y_test]).to_numpy(),
+        "target_name": np.array(str(y_train.name)),
+        "n_train": np.array(len(X_train)),
+        "fingerprint": np.array(data_fingerprint or ""),
+    }
+    samples = sorted((_fraction_key(f), labels) for f, labels in samples.items())
+    arrays["fractions"] = np.array([fraction for fraction, _ in samples], dtype=np.float64)
+    for i, (fraction, labels) in enumerate(samples):
+        positions = X_train.index.get_indexer(list(labels))
+        if (positions < 0).any():
+            raise PreparedDataError(f"Sample {fraction} has rows that are not in the training set.")
+        arrays[f"{_SAMPLE_PREFIX}{i}"] = positions.astype(np.int32)
+    for column in frame.columns:
+        _encode_column(column, frame[column], arrays)
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_path, path)
+
+
+class PreparedData:
+    """Prepared rows, train/test split and data size samples of a data artifact."""
+
+    def __init__(
+        self,
+        frame: pd.DataFrame,
+        target: pd.Series,
+        n_train: int,
+        samples: Dict[float, np.ndarray],
+        data_fingerprint: Optional[str],
+    ):
+        self._frame = frame
+        self._target = target
+        self._n_train = n_train
+        self._samples = samples
+        self.data_fingerprint = data_fingerprint
+
+    @property
+    def fractions(self) -> Tuple[float, ...]:
+        """Train fractions with a stored sample (besides the full training set)."""
+        return tuple(self._samples)
+
+    def _rows(self, positions: np.ndarray, columns: Optional[Sequence[str]]) -> Tuple[pd.DataFrame, pd.Series]:
+        frame = self._frame if columns is None else self._frame.reindex(columns=list(columns))
+        return frame.take(positions), self._target.take(positions)
+
+    def split(self, columns: Optional[Sequence[str]] = None) -> Tuple[pd.DataFrame, pd.DataFrame, pd.Series, pd.Series]:
+        """
+        ``(X_train, X_test, y_train, y_test)`` with the given columns, in that
+        order (columns missing from the artifact are all-NaN, as on the CSV path).
+        """
+        X_train, y_train = self._rows(np.arange(self._n_train), columns)
+        X_test, y_test = self._rows(np.arange(self._n_train, len(self._frame)), columns)
+        return X_train, X_test, y_train, y_test
+
+    def sample(self, fraction: float, columns: Optional[Sequence[str]] = None) -> Tuple[pd.DataFrame, pd.Series]:
+        """``(X, y)`` of the stored training sample of ``fraction`` (1.0 is the full training set)."""
+        fraction = _fraction_key(fraction)
+        if fraction == 1.0:
+            positions = np.arange(self._n_train)
+        elif fraction in self._samples:
+            positions = self._samples[fraction]
+        else:
+            raise PreparedDataError(f"No stored sample for fraction {fraction}.")
+        return self._rows(positions, columns)
+
+
+def read_prepared_data(path: str) -> PreparedData:
+    """Read a data artifact; raises :class:`PreparedDataError` if it is unusable."""
+    with np.load(path, allow_pickle=False) as data:
+        version = int(data["version"]) if "version" in data else None
+        if version != DATA_ARTIFACT_VERSION:
+            raise PreparedDataError(f"Data artifact version {version}, expected {DATA_ARTIFACT_VERSION}.")
+        columns = [str(c) for c in data["columns"]]
+        index = pd.Index(data["index"])
+        frame = pd.DataFrame({column: _decode_column(column, data, index) for column in columns}, index=index)
+        target = pd.Series(data["target"], index=index, name=str(data["target_name"]))
+        samples = {
+            _fraction_key(fraction): data[f"{_SAMPLE_PREFIX}{i}"].astype(np.intp)
+            for i, fraction in enumerate(data["fractions"])
+        }
+        return PreparedData(frame, target, int(data["n_train"]), samples, str(data["fingerprint"]) or None)
+
+
+def load_prepared_data(path: Optional[str] = None) -> Optional[PreparedData]:
+    """
+    Prepared data of ``PREDICTION_CACHE_DATA`` (or ``path``) for app startup.
+
+    Returns None, so the app falls back to the CSV, when the file is missing or
+    unusable (e.g. written by an older layout).
+    """
+    path = path or DEFAULT_DATA_PATH
+    if not os.path.exists(path):
+        return None
+    try:
+        return read_prepared_data(path)
+    except Exception as e:
+        logger.warning(f"Ignoring data artifact {os.path.basename(path)}: {e}")
+        return None
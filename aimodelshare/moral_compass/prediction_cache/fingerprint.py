@@ -0,0 +1,78 @@
+"""
+Fingerprints of the code and configuration that produced cache entries.
+
+An entry is only valid for the model factory, complexity tuning table, data
+sampling and preprocessing it was trained with. The build records two kinds of
+fingerprint in the database ``meta`` table:
+
+- ``data_fingerprint``: the data preparation (row cap, sampling seeds,
+  ``c_charge_desc`` bucketing, per-column preprocessing)
+- ``model_fingerprints``: JSON ``{model name: fingerprint}`` of each model's
+  estimator at every complexity level, the scikit-learn version and the fit
+  mode (exact or approximate complexity sweep)
+
+Every entry carries the fingerprint of its model (the model is part of the
+key), so a rebuild recomputes only the models whose fingerprint changed, and
+an app can refuse the entries of models it would train differently.
+
+A model fingerprint hashes the estimator class and ``get_params()`` after
+tuning, not source code, so refactoring the factory or the tuning function
+does not invalidate anything unless the resulting hyperparameters change.
+The builder and the apps both take their estimators from :mod:`.models`.
+"""
+
+import hashlib
+from typing import Any, Callable, Dict, Iterable, Mapping, Optional
+
+import sklearn
+
+from .keys import COMPLEXITY_LEVELS
+
+DATA_FINGERPRINT_META = "data_fingerprint"
+MODEL_FINGERPRINTS_META = "model_fingerprints"
+
+# Fit modes: every level fitted on its own (or shared where that is exact), or
+# levels truncated from one deep tree/forest (precompute_cache.py --approximate-sweep)
+FIT_INDEPENDENT = "independent"
+FIT_APPROXIMATE_SWEEP = "approximate-sweep"
+
+
+def fingerprint(*parts: Any) -> str:
+    """Short hex digest of the ``repr`` of ``parts`` (values must have a stable repr)."""
+    return hashlib.blake2b(repr(parts).encode("utf-8"), digest_size=8).hexdigest()
+
+
+def estimator_fingerprint(model: Any) -> str:
+    """Fingerprint of an estimator's class and hyperparameters."""
+    cls = type(model)
+    return fingerprint(cls.__module__, cls.__qualname__, sorted(model.get_params().items()))
+
+
+def model_fingerprints(
+    factories: Mapping[str, Callable[[], Any]],
+    tune: Callable[[Any, int], Any],
+    levels: Iterable[int] = COMPLEXITY_LEVELS,
+    fit_modes: Optional[Mapping[str, str]] = None,
+) -> Dict[str, str]:
+    """
+    Fingerprint of every model over all complexity levels.
+
+    Args:
+        factories: ``{model name: zero-argument estimator factory}``.
+        tune: ``tune(model, level)`` applying a complexity level; returns the model.
+        levels: Complexity levels the cache covers.
+        fit_modes: ``{model name: FIT_*}`` of models not fitted ``FIT_INDEPENDENT``.
+
+    Returns:
+        ``{model name: fingerprint}``.
+    """
+    levels = tuple(levels)
+    fit_modes = fit_modes or {}
+    return {
+        name: fingerprint(
+            sklearn.__version__,
+            fit_modes.get(name, FIT_INDEPENDENT),
+            *(estimator_fingerprint(tune(factory(), level)) for level in levels),
+        )
+        for name, factory in factories.items()
+    }
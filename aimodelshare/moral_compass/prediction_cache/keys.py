@@ -0,0 +1,136 @@
+"""
+Canonical integer keys for prediction cache entries.
+
+A cache entry is identified by (model, complexity, data size, feature subset).
+Instead of the historical ``"Model|Complexity|DataSize|f1,f2,..."`` strings,
+the store keys entries by one small integer, laid out from high to low bits as::
+
+    | model id (2) | data size id (2) | feature bitmask (11) | complexity (4) |
+
+The feature bitmask has bit ``i`` set when ``ALL_FEATURES[i]`` is selected.
+Complexity occupies the low bits, so the 10 levels of one (model, data size,
+features) configuration are consecutive integers. Every key fits in 19 bits
+and is stored as the rowid (``INTEGER PRIMARY KEY``) of the ``cache`` table.
+
+The model names and data size labels are the English ones used by
+``precompute_cache.py``; localized apps translate labels before encoding.
+"""
+
+from typing import Iterable, Tuple
+
+MODEL_NAMES = (
+    "The Balanced Generalist",
+    "The Rule-Maker",
+    "The 'Nearest Neighbor'",
+    "The Deep Pattern-Finder",
+)
+DATA_SIZES = ("Small (20%)", "Medium (60%)", "Large (80%)", "Full (100%)")
+ALL_FEATURES = (
+    "juv_fel_count",
+    "juv_misd_count",
+    "juv_other_count",
+    "days_b_screening_arrest",
+    "age",
+    "length_of_stay",
+    "priors_count",
+    "race",
+    "sex",
+    "c_charge_degree",
+    "c_charge_desc",
+)
+COMPLEXITY_LEVELS = range(1, 11)
+
+COMPLEXITY_BITS = 4
+FEATURE_BITS = len(ALL_FEATURES)
+DATA_SIZE_BITS = 2
+MODEL_BITS = 2
+KEY_BITS = COMPLEXITY_BITS + FEATURE_BITS + DATA_SIZE_BITS + MODEL_BITS
+
+_MODEL_IDS = {name: i for i, name in enumerate(MODEL_NAMES)}
+_DATA_SIZE_IDS = {label: i for i, label in enumerate(DATA_SIZES)}
+_FEATURE_BITS = {name: 1 << i for i, name in enumerate(ALL_FEATURES)}
+
+
+class CacheKeyError(ValueError):
+    """Raised for configurations that have no cache key."""
+
+
+def feature_mask(features: Iterable[str]) -> int:
+    """Bitmask over ``ALL_FEATURES`` for a feature subset (order-insensitive)."""
+    mask = 0
+    for name in features:
+        bit = _FEATURE_BITS.get(str(name))
+        if bit is None:
+            raise CacheKeyError(f"Unknown feature: {name!r}")
+        mask |= bit
+    return mask
+
+
+def mask_features(mask: int) -> Tuple[str, ...]:
+    """Features selected by ``mask``, in ``ALL_FEATURES`` order."""
+    return tuple(name for name, bit in _FEATURE_BITS.items() if mask & bit)
+
+
+def encode_key(model_name: str, complexity: int, data_size: str, features: Iterable[str]) -> int:
+    """
+    Integer cache key for one configuration.
+
+    Raises:
+        CacheKeyError: unknown model, data size or feature, or complexity
+            outside ``COMPLEXITY_LEVELS``.
+    """
+    model_id = _MODEL_IDS.get(model_name)
+    if model_id is None:
+        raise CacheKeyError(f"Unknown model: {model_name!r}")
+    size_id = _DATA_SIZE_IDS.get(data_size)
+    if size_id is None:
+        raise CacheKeyError(f"Unknown data size: {data_size!r}")
+    try:
+        level = int(complexity)
+    except (TypeError, ValueError):
+        raise CacheKeyError(f"Invalid complexity: {complexity!r}")
+    if level not in COMPLEXITY_LEVELS:
+        raise CacheKeyError(f"Complexity out of range: {complexity!r}")
+
+    key = (model_id << DATA_SIZE_BITS) | size_id
+    key = (key << FEATURE_BITS) | feature_mask(features)
+    return (key << COMPLEXITY_BITS) | level
+
+
+def decode_key(key: int) -> Tuple[str, int, str, Tuple[str, ...]]:
+    """Inverse of :func:`encode_key`: (model_name, complexity, data_size, features)."""
+    key = int(key)
+    if not 0 <= key < (1 << KEY_BITS):
+        raise CacheKeyError(f"Cache key out of range: {key}")
+    level = key & ((1 << COMPLEXITY_BITS) - 1)
+    key >>= COMPLEXITY_BITS
+    mask = key & ((1 << FEATURE_BITS) - 1)
+    key >>= FEATURE_BITS
+    size_id = key & ((1 << DATA_SIZE_BITS) - 1)
+    model_id = key >> DATA_SIZE_BITS
+    if level not in COMPLEXITY_LEVELS:
+        raise CacheKeyError(f"Invalid complexity bits in cache key: {level}")
+    return MODEL_NAMES[model_id], level, DATA_SIZES[size_id], mask_features(mask)
+
+
+def key_model(key: int) -> str:
+    """Model name of an integer key (the top bits), without decoding the rest."""
+    key = int(key)
+    if not 0 <= key < (1 << KEY_BITS):
+        raise CacheKeyError(f"Cache key out of range: {key}")
+    return MODEL_NAMES[key >> (KEY_BITS - MODEL_BITS)]
+
+
+def legacy_key_to_int(key: str) -> int:
+    """Integer key for a legacy ``"Model|Complexity|DataSize|f1,f2"`` string."""
+    parts = str(key).split("|")
+    if len(parts) != 4:
+        raise CacheKeyError(f"Malformed legacy cache key: {key!r}")
+    model_name, complexity, data_size, features = parts
+    return encode_key(model_name, complexity, data_size, [f for f in features.split(",") if f])
+
+
+def int_to_legacy_key(key: int) -> str:
+    """Legacy string form of an integer key (features sorted by name)."""
+    model_name, complexity, data_size, features = decode_key(key)
+    return f"{model_name}|{complexity}|{data_size}|{','.join(sorted(features))}"
@@ -0,0 +1,327 @@
+"""
+Opt-in on-demand training for prediction cache misses.
+
+The baked cache is immutable and live training is disabled in the apps to
+protect the instance. When an app enables this fallback, a miss is trained on
+a small process pool instead:
+
+- the pool is bounded (``max_workers`` processes, at most ``max_pending``
+  queued or running jobs; further misses are rejected, not queued)
+- every job runs under a CPU-time cap (``RLIMIT_CPU``) and is abandoned when
+  it exceeds it
+- concurrent misses for the same key share one in-flight job
+- results are written to a writable overlay database next to the immutable
+  one, so each key is trained once per instance; a key that failed (worker
+  crash, CPU cap) is retried only after a backoff that doubles per failure
+- a request waits only a few seconds for its job; the job keeps running and
+  the app polls again (:meth:`LazyTrainer.is_pending`) instead of holding
+  its request thread for the whole fit
+
+Each app gets its own trainer and overlay (trained with its own ``train_fn``).
+
+Usage (``train_fn`` must be a module-level function, it runs in a worker):
+
+    trainer = get_lazy_trainer("prediction_cache.sqlite", train_fn, app)
+    predictions = trainer.get_or_train(key, *train_fn_args)
+"""
+
+import logging
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import CancelledError, Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional, Tuple, Union
+
+import numpy as np
+
+from .codec import PredictionCodecError, decode_predictions, encode_predictions
+from .store import as_integer_key
+
+try:
+    import resource
+    import signal
+except ImportError:  # Windows: no CPU cap
+    resource = None
+
+logger = logging.getLogger("aimodelshare.moral_compass")
+
+DEFAULT_WORKERS = int(os.environ.get("PREDICTION_CACHE_LAZY_WORKERS", "1"))
+DEFAULT_MAX_PENDING = int(os.environ.get("PREDICTION_CACHE_LAZY_MAX_PENDING", "4"))
+DEFAULT_CPU_SECONDS = int(os.environ.get("PREDICTION_CACHE_LAZY_CPU_SECONDS", "60"))
+# How long one request waits for its job before returning (the job keeps running)
+DEFAULT_WAIT_SECONDS = float(os.environ.get("PREDICTION_CACHE_LAZY_WAIT_SECONDS", "3"))
+# Backoff before a failed key is trained again; doubles with every further failure
+DEFAULT_RETRY_SECONDS = float(os.environ.get("PREDICTION_CACHE_LAZY_RETRY_SECONDS", "60"))
+
+
+class TrainingTimeout(RuntimeError):
+    """Raised inside a worker when a job exceeds its CPU-time cap."""
+
+
+def overlay_path(db_path: str, app: Optional[str] = None) -> str:
+    """Path of the writable overlay of ``app`` (or the default one) for an immutable cache file."""
+    root, _ = os.path.splitext(os.path.abspath(db_path))
+    return f"{root}.{app}.overlay.sqlite" if app else f"{root}.overlay.sqlite"
+
+
+class OverlayCache:
+    """
+    Small writable key -> vector store for predictions trained at runtime.
+
+    Uses one connection guarded by a lock; writes are rare (one per trained key).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache (key INTEGER PRIMARY KEY, value BLOB NOT NULL)"
+        )
+
+    def get(self, key: Union[int, str]) -> Optional[np.ndarray]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM cache WHERE key=?", (as_integer_key(key),)
+            ).fetchone()
+        if not row:
+            return None
+        try:
+            value = decode_predictions(row[0])
+        except PredictionCodecError as e:
+            logger.warning(f"Overlay cache decode error for key {key!r}: {e}")
+            return None
+        value.setflags(write=False)
+        return value
+
+    def put(self, key: Union[int, str], predictions: Any) -> None:
+        blob = encode_predictions(predictions)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value) VALUES (?, ?)", (as_integer_key(key), blob)
+            )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def _on_cpu_limit(signum, frame):
+    raise TrainingTimeout("Training job exceeded its CPU-time cap")
+
+
+def _run_job(train_fn: Callable[..., Any], cpu_seconds: int, args: tuple) -> np.ndarray:
+    """
+    Worker entry point: run ``train_fn(*args)`` under a CPU-time cap.
+
+    The cap is relative to the worker's CPU time so far, because workers are
+    reused across jobs. The soft limit sends SIGXCPU, which is turned into
+    :class:`TrainingTimeout` and fails only this job.
+    """
+    if resource is None or cpu_seconds <= 0:
+        return np.asarray(train_fn(*args), dtype=np.uint8)
+
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    soft, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    limit = int(usage.ru_utime + usage.ru_stime) + int(cpu_seconds)
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    previous = signal.signal(signal.SIGXCPU, _on_cpu_limit)
+    resource.setrlimit(resource.RLIMIT_CPU, (limit, hard))
+    try:
+        return np.asarray(train_fn(*args), dtype=np.uint8)
+    finally:
+        resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+        signal.signal(signal.SIGXCPU, previous)
+
+
+class LazyTrainer:
+    """
+    Bounded, deduplicating trainer that fills an :class:`OverlayCache`.
+
+    Thread-safe: request threads call :meth:`get_or_train` concurrently.
+    """
+
+    def __init__(
+        self,
+        train_fn: Callable[..., Any],
+        overlay: OverlayCache,
+        max_workers: int = DEFAULT_WORKERS,
+        max_pending: int = DEFAULT_MAX_PENDING,
+        cpu_seconds: int = DEFAULT_CPU_SECONDS,
+        wait_seconds: float = DEFAULT_WAIT_SECONDS,
+        retry_seconds: float = DEFAULT_RETRY_SECONDS,
+        mp_context: str = "spawn",
+    ):
+        """
+        Args:
+            train_fn: Module-level function returning 0/1 predictions; called
+                in a worker process with the extra arguments of :meth:`submit`.
+            overlay: Where trained vectors are stored.
+            max_workers: Worker processes.
+            max_pending: Maximum queued plus running jobs.
+            cpu_seconds: CPU-time cap per job (0 disables it).
+            wait_seconds: How long :meth:`get_or_train` waits for a job.
+            retry_seconds: Backoff before a failed key is trained again
+                (doubled after every further failure of that key).
+            mp_context: Multiprocessing start method. ``spawn`` is safe next to
+                the web server's threads; workers import ``train_fn``'s module.
+        """
+        self.train_fn = train_fn
+        self.overlay = overlay
+        self.max_workers = max(1, int(max_workers))
+        self.max_pending = max(1, int(max_pending))
+        self.cpu_seconds = int(cpu_seconds)
+        self.wait_seconds = float(wait_seconds)
+        self.retry_seconds = float(retry_seconds)
+        self._mp_context = multiprocessing.get_context(mp_context)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._inflight: Dict[int, Future] = {}
+        # key -> (consecutive failures, monotonic time before which it is not retried)
+        self._failed: Dict[int, Tuple[int, float]] = {}
+        self._counters = {
+            "overlay_hits": 0, "submitted": 0, "deduplicated": 0,
+            "rejected": 0, "completed": 0, "failed": 0,
+        }
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=self._mp_context)
+        return self._executor
+
+    def submit(self, key: Union[int, str], *args: Any) -> Optional[Future]:
+        """
+        Start (or join) the training job for ``key``.
+
+        Returns:
+            The job's future, or None if the key is backing off after a
+            failure or the pool is saturated.
+        """
+        key = as_integer_key(key)
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self._counters["deduplicated"] += 1
+                return future
+            failed = self._failed.get(key)
+            if failed is not None and time.monotonic() < failed[1]:
+                return None
+            if len(self._inflight) >= self.max_pending:
+                self._counters["rejected"] += 1
+                return None
+            try:
+                future = self._pool().submit(_run_job, self.train_fn, self.cpu_seconds, args)
+            except BrokenProcessPool:
+                # A worker died (e.g. killed at the hard CPU limit): start a fresh pool.
+                # _finish may already have dropped the broken one.
+                executor, self._executor = self._executor, None
+                if executor is not None:
+                    executor.shutdown(wait=False)
+                future = self._pool().submit(_run_job, self.train_fn, self.cpu_seconds, args)
+            self._inflight[key] = future
+            self._counters["submitted"] += 1
+        future.add_done_callback(lambda f, key=key: self._finish(key, f))
+        return future
+
+    def _finish(self, key: int, future: Future) -> None:
+        error = CancelledError() if future.cancelled() else future.exception()
+        if error is None:
+            try:
+                self.overlay.put(key, future.result())
+            except Exception as e:  # keep the result available to waiters either way
+                logger.warning(f"Could not store trained predictions for key {key}: {e}")
+        with self._lock:
+            self._inflight.pop(key, None)
+            if error is None:
+                self._failed.pop(key, None)
+                self._counters["completed"] += 1
+            else:
+                failures = self._failed.get(key, (0, 0.0))[0] + 1
+                backoff = self.retry_seconds * 2 ** (failures - 1)
+                self._failed[key] = (failures, time.monotonic() + backoff)
+                self._counters["failed"] += 1
+                if isinstance(error, BrokenProcessPool):
+                    self._executor = None
+        if error is not None:
+            logger.warning(f"Lazy training failed for key {key}: {error!r}")
+
+    def get_or_train(self, key: Union[int, str], *args: Any) -> Optional[np.ndarray]:
+        """
+        Return the overlay vector for ``key``, training it first if needed.
+
+        Blocks up to ``wait_seconds``. Returns None if the key cannot be
+        trained now (saturated pool, failure backoff, CPU cap) or is still
+        training after the wait; in that case :meth:`is_pending` is True and
+        the caller polls again later.
+        """
+        value = self.overlay.get(key)
+        if value is not None:
+            with self._lock:
+                self._counters["overlay_hits"] += 1
+            return value
+        future = self.submit(key, *args)
+        if future is None:
+            return None
+        try:
+            value = future.result(timeout=self.wait_seconds)
+        except Exception:
+            return None
+        value.setflags(write=False)
+        return value
+
+    def is_pending(self, key: Union[int, str]) -> bool:
+        """True while a training job for ``key`` is queued or running."""
+        with self._lock:
+            return as_integer_key(key) in self._inflight
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns:
+            dict with overlay_hits, submitted, deduplicated, rejected,
+            completed, failed, in_flight and overlay_entries.
+        """
+        with self._lock:
+            stats = dict(self._counters, in_flight=len(self._inflight))
+        stats["overlay_entries"] = len(self.overlay)
+        return stats
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Stop the worker pool and close the overlay."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=not wait)
+        self.overlay.close()
+
+
+# ----------------------------------------------------------------------
+# Process-wide trainers
+# ----------------------------------------------------------------------
+
+_trainers: Dict[str, LazyTrainer] = {}
+_trainers_lock = threading.Lock()
+
+
+def get_lazy_trainer(db_path: str, train_fn: Callable[..., Any], app: Optional[str] = None) -> LazyTrainer:
+    """
+    Return the trainer of ``app`` for the cache at ``db_path`` (created on first use).
+
+    Every app has its own ``train_fn``, pool and overlay, so one app never
+    serves predictions trained with another app's code.
+    """
+    overlay = overlay_path(db_path, app)
+    with _trainers_lock:
+        trainer = _trainers.get(overlay)
+        if trainer is None:
+            trainer = LazyTrainer(train_fn, OverlayCache(overlay))
+            _trainers[overlay] = trainer
+        return trainer
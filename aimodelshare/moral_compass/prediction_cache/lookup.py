@@ -0,0 +1,230 @@
+"""
+Configuration-level cache lookups shared by every model building game app.
+
+``model_building_game`` and the ``model_building_app_{en,es,ca}`` apps (and
+their ``*_final`` versions) all look entries up by (model, complexity, data
+size, features) through these functions. They use the process-wide reader of
+``PREDICTION_CACHE_DB`` (see :func:`.reader.get_reader`), so all apps in a
+process share one connection pool, LRU, optional in-memory copy and set of
+counters (:func:`cache_stats`), and fixes to the lookup path land in one place.
+
+Each app registers its expected model fingerprints with
+:func:`expect_app_models` under its own name and passes that name as ``app``
+to every lookup, so the expectations of one app never apply to another.
+
+Model and data size names are the English ones from :mod:`.keys`; localized
+apps translate their labels before calling in.
+"""
+
+import os
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Tuple
+
+import numpy as np
+
+from .fingerprint import model_fingerprints
+from .models import MODEL_TYPES, tune_model
+from .keys import COMPLEXITY_LEVELS, MODEL_NAMES, CacheKeyError, decode_key, encode_key
+from .lazy import get_lazy_trainer
+from .metrics import EntryMetrics, GroupConfusion
+from .reader import get_reader
+
+# Opt-in: train cache misses on a small bounded process pool instead of showing
+# "Configuration Not Found" (see :mod:`.lazy`)
+LAZY_TRAINING = os.environ.get("LAZY_TRAINING", "false").lower() == "true"
+# Short waits (PREDICTION_CACHE_LAZY_WAIT_SECONDS each) an app makes for one
+# lazily trained configuration, updating its UI in between
+LAZY_TRAINING_MAX_POLLS = int(os.environ.get("LAZY_TRAINING_MAX_POLLS", "40"))
+
+
+@dataclass(frozen=True)
+class CacheConfig:
+    """One model building configuration, as chosen in the game UI."""
+
+    model_name: str
+    complexity: int
+    data_size: str
+    features: Tuple[str, ...]
+
+    @property
+    def key(self) -> Optional[int]:
+        """Integer cache key, or None if the configuration has none."""
+        return config_key(self.model_name, self.complexity, self.data_size, self.features)
+
+
+def config_key(model_name: str, complexity: int, data_size: str, features: Iterable[str]) -> Optional[int]:
+    """:func:`.keys.encode_key`, returning None instead of raising for unknown configurations."""
+    try:
+        return encode_key(model_name, complexity, data_size, features)
+    except CacheKeyError:
+        return None
+
+
+def get_cached_prediction(
+    model_name: str, complexity: int, data_size: str, features: Iterable[str], app: Optional[str] = None
+) -> Optional[np.ndarray]:
+    """
+    Cached test-set predictions (read-only uint8 0/1 array) of one configuration.
+
+    Returns None on a miss, a read error, an unknown configuration or an
+    entry refused for ``app`` (see :func:`expect_app_models`).
+    """
+    key = config_key(model_name, complexity, data_size, features)
+    return get_reader().get(key, app) if key is not None else None
+
+
+def get_cached_predictions(configs: Iterable[CacheConfig], app: Optional[str] = None) -> List[Optional[np.ndarray]]:
+    """Batched :func:`get_cached_prediction`, in order, via :meth:`.reader.PredictionCacheReader.get_many`."""
+    keys = [config.key for config in configs]
+    found = iter(get_reader().get_many([key for key in keys if key is not None], app))
+    return [next(found) if key is not None else None for key in keys]
+
+
+def _accuracies(vectors: List[np.ndarray], y_true: Any) -> np.ndarray:
+    """Accuracy of each prediction vector against ``y_true``, in one vectorized pass."""
+    y_true = np.asarray(y_true).astype(np.uint8).ravel()
+    if not vectors:
+        return np.zeros(0)
+    return (np.stack(vectors) == y_true).mean(axis=1)
+
+
+def complexity_sweep(
+    model_name: str, data_size: str, features: Iterable[str], y_true: Any, app: Optional[str] = None
+) -> Dict[int, float]:
+    """
+    Test accuracy at every cached complexity level of one configuration.
+
+    The levels of a configuration are consecutive keys, so this is a single
+    indexed range query (:meth:`.reader.PredictionCacheReader.get_range`).
+
+    Returns:
+        ``{complexity level: accuracy}`` for the levels found in the cache.
+    """
+    features = list(features)
+    first = config_key(model_name, COMPLEXITY_LEVELS[0], data_size, features)
+    last = config_key(model_name, COMPLEXITY_LEVELS[-1], data_size, features)
+    if first is None or last is None:
+        return {}
+    found = get_reader().get_range(first, last, app)
+    levels = [decode_key(key)[1] for key in found]
+    return dict(zip(levels, _accuracies(list(found.values()), y_true).tolist()))
+
+
+def model_sweep(
+    complexity: int, data_size: str, features: Iterable[str], y_true: Any, app: Optional[str] = None
+) -> Dict[str, float]:
+    """
+    Test accuracy of every model at one complexity level, from one batched lookup.
+
+    Returns:
+        ``{model name: accuracy}`` for the models found in the cache.
+    """
+    features = tuple(features)
+    configs = [CacheConfig(name, complexity, data_size, features) for name in MODEL_NAMES]
+    found = [(c.model_name, v) for c, v in zip(configs, get_cached_predictions(configs, app)) if v is not None]
+    return dict(zip([name for name, _ in found], _accuracies([v for _, v in found], y_true).tolist()))
+
+
+def get_cached_metrics(
+    model_name: str, complexity: int, data_size: str, features: Iterable[str], app: Optional[str] = None
+) -> Optional[EntryMetrics]:
+    """
+    Precomputed metrics (accuracy, macro F1/precision/recall, full test set and
+    public/private split) of one configuration. Returns None on a miss or for
+    caches built without test labels.
+    """
+    key = config_key(model_name, complexity, data_size, features)
+    return get_reader().get_metrics(key, app) if key is not None else None
+
+
+def get_cached_group_metrics(
+    model_name: str, complexity: int, data_size: str, features: Iterable[str], app: Optional[str] = None
+) -> Optional[Dict[str, Dict[str, GroupConfusion]]]:
+    """
+    Precomputed confusion counts per race and sex value on the test set, as
+    ``{"race": {value: GroupConfusion}, "sex": {...}}`` (each with .fpr/.fnr).
+    Returns None on a miss or for caches built without groups.
+    """
+    key = config_key(model_name, complexity, data_size, features)
+    return get_reader().get_group_metrics(key, app) if key is not None else None
+
+
+def lazy_train_prediction(
+    train_fn: Callable[..., Any],
+    model_name: str,
+    complexity: int,
+    data_size: str,
+    features: Iterable[str],
+    X_train: Any,
+    y_train: Any,
+    X_test: Any,
+    app: Optional[str] = None,
+) -> Optional[np.ndarray]:
+    """
+    Cache-miss fallback used when ``LAZY_TRAINING`` is enabled.
+
+    ``train_fn(model_name, complexity, features, X_train, y_train, X_test)``
+    must be a module-level function of the app; it runs in a worker process of
+    the app's own trainer. Waits a few seconds for the job; returns None when
+    disabled, when the data is not loaded yet, when the pool is saturated, when
+    the job fails or exceeds its CPU cap, or while it is still running (see
+    :func:`lazy_training_pending`; calling again joins the same job).
+    """
+    if not LAZY_TRAINING:
+        return None
+    key = config_key(model_name, complexity, data_size, features)
+    if key is None or X_train is None or y_train is None or X_test is None:
+        return None
+    trainer = get_lazy_trainer(get_reader().db_path, train_fn, app)
+    return trainer.get_or_train(key, model_name, complexity, list(features), X_train, y_train, X_test)
+
+
+def lazy_training_pending(
+    train_fn: Callable[..., Any],
+    model_name: str,
+    complexity: int,
+    data_size: str,
+    features: Iterable[str],
+    app: Optional[str] = None,
+) -> bool:
+    """True while the app's lazy training job for this configuration is still running."""
+    key = config_key(model_name, complexity, data_size, features)
+    if not LAZY_TRAINING or key is None:
+        return False
+    return get_lazy_trainer(get_reader().db_path, train_fn, app).is_pending(key)
+
+
+def expect_app_models(
+    app: str,
+    model_types: Mapping[str, Any] = MODEL_TYPES,
+    tune: Callable[[Any, int], Any] = tune_model,
+) -> None:
+    """
+    Only serve ``app`` entries trained with the models it would train itself.
+
+    Args:
+        app: Name the app passes as ``app`` to its lookups (e.g. its module name).
+        model_types: ``{name: factory}`` or ``{name: {"model_builder": factory, ...}}``;
+            the shared :data:`.models.MODEL_TYPES` by default.
+        tune: Complexity tuning function; the shared :func:`.models.tune_model` by default.
+    """
+    factories = {
+        name: spec["model_builder"] if isinstance(spec, Mapping) else spec for name, spec in model_types.items()
+    }
+    get_reader().expect_fingerprints(model_fingerprints(factories, tune), app)
+
+
+def preload_cache() -> bool:
+    """
+    Load the cache into memory if ``PREDICTION_CACHE_MODE=ram``.
+
+    Returns:
+        True if lookups are now served from memory.
+    """
+    reader = get_reader()
+    return reader.mode == "ram" and reader.preload()
+
+
+def cache_stats() -> Dict[str, Any]:
+    """Counters of the shared reader (see :meth:`.reader.PredictionCacheReader.stats`)."""
+    return get_reader().stats()
@@ -0,0 +1,88 @@
+"""
+Byte-bounded LRU of decoded prediction vectors.
+
+In a classroom session most clicks hit a handful of popular configurations,
+so the reader keeps recently used decoded arrays in memory and serves repeats
+without touching SQLite or decoding again.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+import numpy as np
+
+
+class ByteLRUCache:
+    """
+    Thread-safe LRU mapping whose capacity is the total ``nbytes`` of its values.
+
+    Stored arrays are made read-only, because the same object is handed to
+    every caller that asks for the key.
+    """
+
+    def __init__(self, max_bytes: int):
+        """
+        Args:
+            max_bytes: Upper bound on the summed ``nbytes`` of cached arrays.
+                Arrays larger than this are never cached.
+        """
+        self.max_bytes = max(0, int(max_bytes))
+        self._data: "OrderedDict[Hashable, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, key: Hashable) -> Optional[np.ndarray]:
+        """Return the cached array for ``key`` (marking it most recently used) or None."""
+        with self._lock:
+            value = self._data.get(key)
+            if value is None:
+                self._misses += 1
+                return None
+            self._data.move_to_end(key)
+            self._hits += 1
+            return value
+
+    def put(self, key: Hashable, value: np.ndarray) -> None:
+        """Insert ``value`` and evict least recently used entries until it fits."""
+        size = int(value.nbytes)
+        if size > self.max_bytes:
+            return
+        value.setflags(write=False)
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= int(old.nbytes)
+            while self._data and self._bytes + size > self.max_bytes:
+                _, evicted = self._data.popitem(last=False)
+                self._bytes -= int(evicted.nbytes)
+                self._evictions += 1
+            self._data[key] = value
+            self._bytes += size
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns:
+            dict with hits, misses, evictions, entries, bytes and max_bytes.
+        """
+        with self._lock:
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
@@ -0,0 +1,183 @@
+"""
+In-memory copy of the prediction cache for ``PREDICTION_CACHE_MODE=ram``.
+
+The whole cache is ~327k keys over a few thousand unique vectors of ~1000
+bit-packed predictions, i.e. tens of MB. Instances with spare memory can load
+it once at startup and serve lookups without SQLite:
+
+- ``keys``: sorted int64 array of every cache key
+- ``rows``: uint32 row of each key in the vector matrix (vectors stay deduplicated)
+- ``packed``: contiguous ``(n_vectors, ceil(length / 8))`` uint8 matrix of
+  ``numpy.packbits`` rows, copied straight from the stored BLOBs
+- ``metrics`` / ``groups``: the raw ``vectors.metrics`` and ``vectors.groups``
+  BLOBs as fixed-width uint8 matrices
+
+A lookup is ``np.searchsorted`` on ``keys`` plus one row unpack; metrics and
+group confusion counts are one row copy, so RAM mode never opens SQLite.
+"""
+
+import logging
+import sqlite3
+from typing import Optional, Tuple
+
+import numpy as np
+
+from .codec import _HEADER, FORMAT_MAGIC, FORMAT_VERSION, PredictionCodecError
+from .store import DEDUP_LOOKUP_SQL, integer_keys, lookup_sql, vector_columns
+
+logger = logging.getLogger("aimodelshare.moral_compass")
+
+
+class PackedPredictionMatrix:
+    """
+    Read-only, sorted-key index over bit-packed prediction rows.
+
+    Build with :meth:`load`; instances are immutable and safe to share
+    between threads.
+    """
+
+    def __init__(
+        self,
+        keys: np.ndarray,
+        rows: np.ndarray,
+        packed: np.ndarray,
+        length: int,
+        metrics: Optional[np.ndarray] = None,
+        has_metrics: Optional[np.ndarray] = None,
+        groups: Optional[np.ndarray] = None,
+        has_groups: Optional[np.ndarray] = None,
+    ):
+        """
+        Args:
+            keys: Sorted int64 cache keys.
+            rows: Row of ``packed`` for each key.
+            packed: uint8 matrix of packed prediction rows.
+            length: Number of predictions per row.
+            metrics: Optional uint8 matrix of metrics BLOBs, one row per vector.
+            has_metrics: bool per vector; False where the BLOB was NULL.
+            groups: Optional uint8 matrix of group counts BLOBs, one row per vector.
+            has_groups: bool per vector; False where the BLOB was NULL.
+        """
+        self.keys = keys
+        self.rows = rows
+        self.packed = packed
+        self.length = int(length)
+        self.metrics = metrics
+        self.has_metrics = has_metrics
+        self.groups = groups
+        self.has_groups = has_groups
+        for array in (keys, rows, packed, metrics, has_metrics, groups, has_groups):
+            if array is not None:
+                array.setflags(write=False)
+
+    @classmethod
+    def load(cls, conn: sqlite3.Connection) -> "PackedPredictionMatrix":
+        """
+        Read every key and vector of a deduplicated, integer-keyed database.
+
+        Raises:
+            PredictionCodecError: if the database uses an older schema or its
+                vectors are not bit-packed BLOBs of one common length.
+        """
+        if not integer_keys(conn) or lookup_sql(conn) != DEDUP_LOOKUP_SQL:
+            raise PredictionCodecError(
+                "RAM mode needs an integer-keyed, deduplicated cache (rebuild with convert_db.py)"
+            )
+        columns = vector_columns(conn)
+        extra = ", ".join(c if c in columns else "NULL" for c in ("metrics", "groups"))
+        sql = f"SELECT id, value, {extra} FROM vectors ORDER BY id"
+
+        ids, payloads, metric_blobs, group_blobs = [], [], [], []
+        length = None
+        for vector_id, value, metrics, groups in conn.execute(sql):
+            if not isinstance(value, bytes) or len(value) < _HEADER.size:
+                raise PredictionCodecError(f"Vector {vector_id} is not a bit-packed BLOB")
+            magic, version, n = _HEADER.unpack_from(value)
+            if magic != FORMAT_MAGIC or version != FORMAT_VERSION:
+                raise PredictionCodecError(f"Vector {vector_id} has an unsupported format")
+            if length is None:
+                length = n
+            elif n != length:
+                raise PredictionCodecError(f"Vector {vector_id} has {n} predictions, expected {length}")
+            ids.append(vector_id)
+            payloads.append(value[_HEADER.size:])
+            metric_blobs.append(metrics)
+            group_blobs.append(groups)
+
+        length = length or 0
+        width = (length + 7) // 8
+        if any(len(p) != width for p in payloads):
+            raise PredictionCodecError("Prediction blob is truncated.")
+        packed = np.frombuffer(b"".join(payloads), dtype=np.uint8).reshape(len(payloads), width)
+        vector_ids = np.asarray(ids, dtype=np.int64)
+
+        metrics, has_metrics = _blob_matrix(metric_blobs)
+        groups, has_groups = _blob_matrix(group_blobs)
+
+        n_keys = conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        pairs = np.fromiter(
+            (v for row in conn.execute("SELECT key, vector_id FROM cache ORDER BY key") for v in row),
+            dtype=np.int64,
+            count=2 * n_keys,
+        ).reshape(n_keys, 2)
+        rows = np.searchsorted(vector_ids, pairs[:, 1])
+        if n_keys and (rows.max(initial=0) >= len(vector_ids) or np.any(vector_ids[rows] != pairs[:, 1])):
+            raise PredictionCodecError("Cache references a missing vector")
+        return cls(
+            np.ascontiguousarray(pairs[:, 0]), rows.astype(np.uint32), packed, length,
+            metrics, has_metrics, groups, has_groups,
+        )
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the index and matrices."""
+        total = self.keys.nbytes + self.rows.nbytes + self.packed.nbytes
+        for blobs, present in ((self.metrics, self.has_metrics), (self.groups, self.has_groups)):
+            if blobs is not None:
+                total += blobs.nbytes + present.nbytes
+        return total
+
+    def find(self, key: int) -> Optional[int]:
+        """Vector row of ``key`` (binary search), or None if it is absent."""
+        i = int(np.searchsorted(self.keys, key))
+        if i < len(self.keys) and self.keys[i] == key:
+            return int(self.rows[i])
+        return None
+
+    def predictions(self, row: int) -> np.ndarray:
+        """Read-only uint8 0/1 predictions of a vector row."""
+        value = np.unpackbits(self.packed[row], count=self.length)
+        value.setflags(write=False)
+        return value
+
+    def metrics_blob(self, row: int) -> Optional[bytes]:
+        """Stored metrics BLOB of a vector row, or None."""
+        if self.metrics is None or not self.has_metrics[row]:
+            return None
+        return self.metrics[row].tobytes()
+
+    def groups_blob(self, row: int) -> Optional[bytes]:
+        """Stored group counts BLOB of a vector row, or None."""
+        if self.groups is None or not self.has_groups[row]:
+            return None
+        return self.groups[row].tobytes()
+
+
+def _blob_matrix(blobs: list) -> Tuple[Optional[np.ndarray], Optional[np.ndarray]]:
+    """
+    Stack fixed-width BLOBs into a uint8 matrix plus a presence mask.
+
+    NULLs and BLOBs of another width than the first one are blank rows marked
+    absent. Returns ``(None, None)`` when no BLOB is present.
+    """
+    present = [b for b in blobs if b is not None]
+    if not present:
+        return None, None
+    width = len(present[0])
+    mask = np.array([b is not None and len(b) == width for b in blobs])
+    blank = bytes(width)
+    matrix = np.frombuffer(b"".join(b if ok else blank for b, ok in zip(blobs, mask)), dtype=np.uint8)
+    return matrix.reshape(len(blobs), width), mask
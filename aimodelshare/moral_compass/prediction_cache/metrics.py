@@ -0,0 +1,278 @@
+"""
+Precomputed evaluation metrics for cached prediction vectors.
+
+The eval Lambda scores a classification submission with accuracy and macro
+F1/precision/recall (``zero_division=0``), on a public and a private part of
+the test labels split by ``train_test_split(..., test_size=1 - private_size,
+shuffle=True, stratify=y_true, random_state=1)``. That split depends only on
+the labels, so it is drawn once and every vector is scored with numpy
+counting, without calling sklearn per entry.
+
+Scores are stored per unique vector as a packed float64 tuple laid out as
+``SCOPES x METRIC_NAMES``; a scope the Lambda would report as void (e.g. the
+public part when ``private_size == 1``) is stored as NaN and decoded as None.
+
+For the fairness apps each vector can also carry per-group confusion counts
+(tp, fp, fn, tn for every race and sex value in the test set), from which
+FPR/FNR gaps are read without touching the test frame. Counts are stored as
+little-endian uint32 in the order of the database's ``group_names`` meta.
+"""
+
+import struct
+from dataclasses import dataclass
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .codec import _as_binary_array
+
+METRIC_NAMES: Tuple[str, ...] = ("accuracy", "f1_score", "precision", "recall")
+SCOPES: Tuple[str, ...] = ("full", "public", "private")
+# Sensitive attributes the bias detective / fairness fixer apps slice by
+GROUP_ATTRIBUTES: Tuple[str, ...] = ("race", "sex")
+CONFUSION_FIELDS: Tuple[str, ...] = ("tp", "fp", "fn", "tn")
+
+_N_VALUES = len(SCOPES) * len(METRIC_NAMES)
+_STRUCT = struct.Struct(f"<{_N_VALUES}d")
+
+
+class MetricsError(ValueError):
+    """Raised when labels or stored metrics cannot be used."""
+
+
+@dataclass(frozen=True)
+class EntryMetrics:
+    """
+    Metric tuple of one cache entry.
+
+    ``full`` scores the whole test set (what the app preview shows); ``public``
+    and ``private`` are what the leaderboard would report. Each maps
+    :data:`METRIC_NAMES` to a float, or to None when the scope is void.
+    """
+
+    full: Dict[str, Optional[float]]
+    public: Dict[str, Optional[float]]
+    private: Dict[str, Optional[float]]
+
+    @property
+    def accuracy(self) -> Optional[float]:
+        """Accuracy on the whole test set."""
+        return self.full["accuracy"]
+
+
+@dataclass(frozen=True)
+class GroupConfusion:
+    """Confusion counts of one group (positive class = reoffended)."""
+
+    tp: int
+    fp: int
+    fn: int
+    tn: int
+
+    @property
+    def size(self) -> int:
+        return self.tp + self.fp + self.fn + self.tn
+
+    @property
+    def fpr(self) -> Optional[float]:
+        """False positive rate, or None if the group has no negatives."""
+        negatives = self.fp + self.tn
+        return self.fp / negatives if negatives else None
+
+    @property
+    def fnr(self) -> Optional[float]:
+        """False negative rate, or None if the group has no positives."""
+        positives = self.fn + self.tp
+        return self.fn / positives if positives else None
+
+
+def group_masks(groups: Mapping[str, Sequence[Any]]) -> Tuple[List[Tuple[str, str]], np.ndarray]:
+    """
+    One row mask per (attribute, value) of ``groups``.
+
+    Args:
+        groups: Attribute name -> per-row values, e.g. ``{"race": X_test["race"]}``.
+            Missing values form no group.
+
+    Returns:
+        (group_names, masks): sorted ``(attribute, value)`` pairs and a bool
+        array of shape ``(len(group_names), n_rows)``.
+    """
+    names, masks = [], []
+    n_rows = None
+    for attribute in sorted(groups):
+        column = np.asarray([None if v is None or v != v else str(v) for v in groups[attribute]], dtype=object)
+        if n_rows is not None and len(column) != n_rows:
+            raise MetricsError(f"Group column {attribute!r} has {len(column)} rows, expected {n_rows}")
+        n_rows = len(column)
+        for value in sorted({v for v in column if v is not None}):
+            names.append((attribute, value))
+            masks.append(column == value)
+    if not masks:
+        return names, np.zeros((0, n_rows or 0), dtype=bool)
+    return names, np.stack(masks)
+
+
+def split_masks(y_true: Any, private_size: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Boolean (public, private) row masks matching the eval Lambda's split.
+
+    Args:
+        y_true: Test labels, in the order predictions are stored.
+        private_size: Fraction of rows in the private part (0 and 1 are the
+            Lambda's "everything public" / "everything private" cases).
+    """
+    y_true = np.asarray(y_true)
+    n = len(y_true)
+    private = np.zeros(n, dtype=bool)
+    if not 0.0 <= private_size <= 1.0:
+        raise MetricsError(f"private_size must be between 0 and 1, got {private_size}")
+    if private_size == 1:
+        private[:] = True
+    elif private_size > 0:
+        from sklearn.model_selection import train_test_split
+
+        private_idx, _ = train_test_split(
+            np.arange(n), test_size=1 - private_size, shuffle=True,
+            stratify=y_true, random_state=1,
+        )
+        private[private_idx] = True
+    return ~private, private
+
+
+def _score(y_true: np.ndarray, y_pred: np.ndarray) -> np.ndarray:
+    """Accuracy and macro F1/precision/recall with ``zero_division=0``, like sklearn."""
+    if len(y_true) == 0:
+        return np.full(len(METRIC_NAMES), np.nan)
+    labels = np.union1d(y_true, y_pred)
+    tp = np.array([np.count_nonzero((y_true == c) & (y_pred == c)) for c in labels], dtype=float)
+    n_pred = np.array([np.count_nonzero(y_pred == c) for c in labels], dtype=float)
+    n_true = np.array([np.count_nonzero(y_true == c) for c in labels], dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precision = np.where(n_pred > 0, tp / n_pred, 0.0)
+        recall = np.where(n_true > 0, tp / n_true, 0.0)
+        f1 = np.where(n_pred + n_true > 0, 2 * tp / (n_pred + n_true), 0.0)
+    accuracy = np.count_nonzero(y_true == y_pred) / len(y_true)
+    return np.array([accuracy, f1.mean(), precision.mean(), recall.mean()])
+
+
+class MetricScorer:
+    """
+    Scores prediction vectors against fixed test labels.
+
+    Usage:
+        scorer = MetricScorer(y_test, private_size=0.5)
+        blob = encode_metrics(scorer.score(predictions))
+    """
+
+    def __init__(
+        self,
+        y_true: Any,
+        private_size: float = 0.0,
+        groups: Optional[Mapping[str, Sequence[Any]]] = None,
+    ):
+        """
+        Args:
+            y_true: 0/1 test labels, in the order predictions are stored.
+            private_size: Private fraction of the competition's
+                ``public_private_split.json``.
+            groups: Optional attribute -> per-row values of the test rows
+                (see :func:`group_masks`) for :meth:`score_groups`.
+        """
+        self.y_true = _as_binary_array(y_true)
+        self.private_size = float(private_size)
+        public, private = split_masks(self.y_true, self.private_size)
+        self._scopes = [np.ones(len(self.y_true), dtype=bool), public, private]
+        self.group_names: List[Tuple[str, str]] = []
+        self._group_masks = np.zeros((0, len(self.y_true)), dtype=np.uint32)
+        if groups:
+            self.group_names, masks = group_masks(groups)
+            if masks.shape[1] != len(self.y_true):
+                raise MetricsError(
+                    f"Group columns have {masks.shape[1]} rows, labels have {len(self.y_true)}"
+                )
+            self._group_masks = masks.astype(np.uint32)
+
+    def score(self, predictions: Any) -> np.ndarray:
+        """
+        Args:
+            predictions: 0/1 predictions in any form :func:`.codec.encode_predictions` accepts.
+
+        Returns:
+            float array of shape ``(len(SCOPES), len(METRIC_NAMES))``.
+
+        Raises:
+            MetricsError: if the number of predictions differs from the labels.
+        """
+        y_pred = _as_binary_array(predictions)
+        if len(y_pred) != len(self.y_true):
+            raise MetricsError(
+                f"Expected {len(self.y_true)} predictions, got {len(y_pred)}"
+            )
+        return np.stack([_score(self.y_true[m], y_pred[m]) for m in self._scopes])
+
+    def score_groups(self, predictions: Any) -> np.ndarray:
+        """
+        Returns:
+            uint32 array of shape ``(len(group_names), 4)`` with
+            :data:`CONFUSION_FIELDS` counts per group.
+        """
+        y_pred = _as_binary_array(predictions)
+        if len(y_pred) != len(self.y_true):
+            raise MetricsError(
+                f"Expected {len(self.y_true)} predictions, got {len(y_pred)}"
+            )
+        t, p = self.y_true.astype(bool), y_pred.astype(bool)
+        cells = np.stack([t & p, ~t & p, t & ~p, ~t & ~p], axis=1).astype(np.uint32)
+        return self._group_masks @ cells
+
+
+def encode_metrics(values: np.ndarray) -> bytes:
+    """Pack a :meth:`MetricScorer.score` result into a fixed-size BLOB."""
+    return _STRUCT.pack(*np.asarray(values, dtype=np.float64).ravel())
+
+
+def decode_metrics(blob: bytes) -> EntryMetrics:
+    """
+    Unpack a BLOB written by :func:`encode_metrics`.
+
+    Raises:
+        MetricsError: if the BLOB has the wrong size.
+    """
+    if blob is None or len(blob) != _STRUCT.size:
+        raise MetricsError("Stored metrics have an unexpected size")
+    values = _STRUCT.unpack(bytes(blob))
+    scopes = []
+    for i in range(len(SCOPES)):
+        row = values[i * len(METRIC_NAMES):(i + 1) * len(METRIC_NAMES)]
+        scopes.append({
+            name: (None if np.isnan(v) else float(v)) for name, v in zip(METRIC_NAMES, row)
+        })
+    return EntryMetrics(*scopes)
+
+
+def encode_group_counts(counts: np.ndarray) -> bytes:
+    """Pack a :meth:`MetricScorer.score_groups` result into a BLOB."""
+    return np.asarray(counts, dtype="<u4").tobytes()
+
+
+def decode_group_counts(
+    blob: bytes, group_names: Sequence[Tuple[str, str]]
+) -> Dict[str, Dict[str, GroupConfusion]]:
+    """
+    Unpack a BLOB written by :func:`encode_group_counts`.
+
+    Returns:
+        ``{attribute: {value: GroupConfusion}}``, e.g. ``result["race"]["Caucasian"].fpr``.
+
+    Raises:
+        MetricsError: if the BLOB does not match ``group_names``.
+    """
+    width = len(CONFUSION_FIELDS)
+    if blob is None or len(blob) != len(group_names) * width * 4:
+        raise MetricsError("Stored group counts do not match the group names")
+    counts = np.frombuffer(bytes(blob), dtype="<u4").reshape(-1, width)
+    result: Dict[str, Dict[str, GroupConfusion]] = {}
+    for (attribute, value), row in zip(group_names, counts):
+        result.setdefault(attribute, {})[value] = GroupConfusion(*(int(c) for c in row))
+    return result
@@ -0,0 +1,52 @@
+"""
+The estimators of the model building game and their complexity tuning.
+
+``precompute_cache.py`` builds the cache with these definitions and every
+model building app trains cache misses with them, so both sides produce (and
+fingerprint, see :mod:`.fingerprint`) the same models. Apps add their own
+localized model cards on top; they must not redefine the estimators.
+"""
+
+from typing import Any, Callable, Dict
+
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.linear_model import LogisticRegression
+from sklearn.neighbors import KNeighborsClassifier
+from sklearn.tree import DecisionTreeClassifier
+
+# {model name: zero-argument estimator factory}, in the order of keys.MODEL_NAMES
+MODEL_TYPES: Dict[str, Callable[[], Any]] = {
+    "The Balanced Generalist": lambda: LogisticRegression(max_iter=500, random_state=42, class_weight="balanced"),
+    "The Rule-Maker": lambda: DecisionTreeClassifier(random_state=42, class_weight="balanced"),
+    "The 'Nearest Neighbor'": lambda: KNeighborsClassifier(),
+    "The Deep Pattern-Finder": lambda: RandomForestClassifier(random_state=42, class_weight="balanced"),
+}
+
+
+def tune_model(model: Any, level: int) -> Any:
+    """
+    Map a 1–10 slider value to model hyperparameters.
+    Levels 1–3: Conservative / simple
+    Levels 4–7: Balanced
+    Levels 8–10: Aggressive / risk of overfitting
+
+    Returns:
+        ``model``, updated in place.
+    """
+    level = int(level)
+    if isinstance(model, LogisticRegression):
+        c_map = {1: 0.01, 2: 0.025, 3: 0.05, 4: 0.1, 5: 0.25, 6: 0.5, 7: 1.0, 8: 2.0, 9: 5.0, 10: 10.0}
+        model.C = c_map.get(level, 1.0)
+        model.max_iter = max(getattr(model, "max_iter", 0), 500)
+    elif isinstance(model, RandomForestClassifier):
+        depth_map = {1: 3, 2: 5, 3: 7, 4: 9, 5: 11, 6: 15, 7: 20, 8: 25, 9: None, 10: None}
+        est_map = {1: 20, 2: 30, 3: 40, 4: 60, 5: 80, 6: 100, 7: 120, 8: 150, 9: 180, 10: 220}
+        model.max_depth = depth_map.get(level, 10)
+        model.n_estimators = est_map.get(level, 100)
+    elif isinstance(model, DecisionTreeClassifier):
+        depth_map = {1: 2, 2: 3, 3: 4, 4: 5, 5: 6, 6: 8, 7: 10, 8: 12, 9: 15, 10: None}
+        model.max_depth = depth_map.get(level, 6)
+    elif isinstance(model, KNeighborsClassifier):
+        k_map = {1: 100, 2: 75, 3: 60, 4: 50, 5: 40, 6: 30, 7: 25, 8: 15, 9: 7, 10: 3}
+        model.n_neighbors = k_map.get(level, 25)
+    return model
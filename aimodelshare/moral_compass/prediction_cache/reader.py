@@ -0,0 +1,672 @@
+"""
+Pooled, read-only reader for the baked prediction cache.
+
+``prediction_cache.sqlite`` is produced at image build time (see ``convert_db.py``)
+and never changes afterwards, so it is opened with ``mode=ro&immutable=1``: SQLite
+skips file locking and change detection, and pages are served through ``mmap``.
+
+Connections are opened lazily, handed out to one thread at a time from a bounded
+pool and returned after each lookup, so the open/schema-parse/page-cache warmup
+cost is paid once per connection instead of once per Build & Submit click.
+
+Decoded vectors of recent lookups are kept in a byte-bounded LRU
+(:class:`.lru.ByteLRUCache`), so repeated configurations skip SQLite and decoding.
+Counters are logged every ``PREDICTION_CACHE_LOG_EVERY`` lookups.
+
+:meth:`PredictionCacheReader.get_metrics` returns the entry's precomputed
+accuracy/F1/precision/recall, so the preview KPI needs no sklearn call, and
+:meth:`PredictionCacheReader.get_group_metrics` its per-race/sex confusion counts.
+
+With ``PREDICTION_CACHE_MODE=ram`` the app calls :meth:`PredictionCacheReader.preload`
+at startup, which copies every key, vector and metrics BLOB into a
+:class:`.matrix.PackedPredictionMatrix`; from then on :meth:`get` and
+:meth:`get_metrics` are a binary search plus a row slice and never touch SQLite.
+
+Apps pass the fingerprints of their own models to
+:meth:`PredictionCacheReader.expect_fingerprints` under their own ``app`` name;
+lookups made for that app then treat entries of models whose stored fingerprint
+differs (see :mod:`.fingerprint`) as misses. Apps sharing the reader keep
+separate expectations, so one app's models never decide what another is served.
+"""
+
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
+from urllib.parse import quote
+
+import numpy as np
+
+from .codec import PredictionCodecError, decode_predictions
+from .fingerprint import MODEL_FINGERPRINTS_META
+from .keys import CacheKeyError, int_to_legacy_key, key_model
+from .lru import ByteLRUCache
+from .matrix import PackedPredictionMatrix
+from .metrics import EntryMetrics, GroupConfusion, MetricsError, decode_group_counts, decode_metrics
+from .store import (
+    DEDUP_LOOKUP_SQL,
+    GROUPS_LOOKUP_SQL,
+    METRICS_LOOKUP_SQL,
+    RANGE_SQL,
+    as_integer_key,
+    integer_keys,
+    lookup_sql,
+    many_lookup_sql,
+    read_meta,
+    vector_columns,
+)
+
+logger = logging.getLogger("aimodelshare.moral_compass")
+
+DEFAULT_DB_PATH = os.environ.get("PREDICTION_CACHE_DB", "prediction_cache.sqlite")
+DEFAULT_MMAP_BYTES = int(os.environ.get("PREDICTION_CACHE_MMAP_BYTES", str(256 * 1024 * 1024)))
+DEFAULT_POOL_SIZE = int(os.environ.get("PREDICTION_CACHE_POOL_SIZE", "8"))
+# Decoded vectors are ~1 KB each, so 16 MB holds every configuration a class uses
+DEFAULT_LRU_BYTES = int(os.environ.get("PREDICTION_CACHE_LRU_BYTES", str(16 * 1024 * 1024)))
+# Keys per IN (...) query of get_many (SQLite allows 999 parameters by default)
+MANY_CHUNK = 500
+DEFAULT_LOG_EVERY = int(os.environ.get("PREDICTION_CACHE_LOG_EVERY", "100"))
+# "sqlite" (default) or "ram": load the whole cache into memory at startup
+DEFAULT_MODE = os.environ.get("PREDICTION_CACHE_MODE", "sqlite").strip().lower()
+
+
+class PredictionCacheReader:
+    """
+    Thread-safe reader over an immutable prediction cache database.
+
+    Features:
+    - Read-only, immutable URI open with ``mmap_size`` set
+    - Bounded connection pool shared by all request threads
+    - Byte-bounded LRU of decoded vectors in front of SQLite
+    - Hit/miss/error/latency/LRU counters via :meth:`stats`, logged periodically
+    - Optional in-memory mode (:meth:`preload`) that bypasses SQLite and the LRU
+    - Per-app refusal of entries built with other model settings (:meth:`expect_fingerprints`)
+    """
+
+    def __init__(
+        self,
+        db_path: str = DEFAULT_DB_PATH,
+        mmap_bytes: int = DEFAULT_MMAP_BYTES,
+        pool_size: int = DEFAULT_POOL_SIZE,
+        lru_bytes: int = DEFAULT_LRU_BYTES,
+        log_every: int = DEFAULT_LOG_EVERY,
+        mode: str = DEFAULT_MODE,
+    ):
+        """
+        Args:
+            db_path: Path to the SQLite cache file.
+            mmap_bytes: Value for ``PRAGMA mmap_size`` on every connection.
+            pool_size: Maximum number of idle connections kept for reuse.
+            lru_bytes: Memory budget of the decoded-vector LRU (0 disables it).
+            log_every: Log counters every N lookups (0 disables logging).
+            mode: ``"sqlite"`` or ``"ram"``. Only records the intent; the owner
+                calls :meth:`preload` when mode is ``"ram"``.
+        """
+        self.db_path = os.path.abspath(db_path)
+        self.mmap_bytes = int(mmap_bytes)
+        self.pool_size = max(1, int(pool_size))
+        self.log_every = max(0, int(log_every))
+        self.mode = mode
+        self._pool: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue(maxsize=self.pool_size)
+        self._lru: Optional[ByteLRUCache] = ByteLRUCache(lru_bytes) if lru_bytes > 0 else None
+
+        self._stats_lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._errors = 0
+        self._lookup_seconds = 0.0
+        self._max_lookup_seconds = 0.0
+        self._connections_opened = 0
+        self._lookup_sql: Optional[str] = None
+        self._integer_keys = True
+        self._vector_columns: set = set()
+        self._group_names: List[Tuple[str, str]] = []
+        self._matrix: Optional[PackedPredictionMatrix] = None
+        self._preload_lock = threading.Lock()
+        self._stored_fingerprints: Optional[Dict[str, str]] = None
+        self._expected_fingerprints: Dict[Optional[str], Dict[str, str]] = {}
+        self._refused: Dict[Optional[str], frozenset] = {}
+
+    @property
+    def available(self) -> bool:
+        """True if the cache file exists on disk."""
+        return os.path.exists(self.db_path)
+
+    @property
+    def refused_models(self) -> List[str]:
+        """Models refused for lookups without an ``app`` (see :meth:`refused_for`)."""
+        return self.refused_for(None)
+
+    def refused_for(self, app: Optional[str]) -> List[str]:
+        """Models whose entries are refused for ``app`` (fingerprint mismatch), once the schema is read."""
+        return sorted(self._refused.get(app, ()))
+
+    def expect_fingerprints(self, expected: Dict[str, str], app: Optional[str] = None) -> None:
+        """
+        Only serve entries built with the given model fingerprints to ``app``.
+
+        Compared against the ``model_fingerprints`` meta right away (or on the
+        first lookup if the file does not exist yet).
+        Entries of a model whose stored fingerprint differs or is missing are
+        misses for lookups made with the same ``app``; databases built before
+        fingerprints are served with a warning.
+
+        Args:
+            expected: ``{model name: fingerprint}`` from
+                :func:`.fingerprint.model_fingerprints` over the app's own models.
+            app: Name the app passes to every lookup (None for the default).
+        """
+        self._expected_fingerprints[app] = dict(expected)
+        self._refused.pop(app, None)
+        if self._lookup_sql is not None:
+            self._refused[app] = self._check_fingerprints(app)
+        elif self.available:
+            # Check now: in-memory lookups never re-read the schema
+            try:
+                with self.connection() as conn:
+                    self._detect_schema(conn)
+            except sqlite3.Error as e:
+                logger.warning(f"Prediction cache read error for {self.db_path}: {e}")
+
+    @property
+    def in_memory(self) -> bool:
+        """True once :meth:`preload` has loaded the cache into memory."""
+        return self._matrix is not None
+
+    def preload(self) -> bool:
+        """
+        Load the whole cache into a :class:`.matrix.PackedPredictionMatrix`.
+
+        Lookups keep going through SQLite while loading, and fall back to it
+        if loading fails (e.g. a string-keyed legacy database).
+
+        Returns:
+            True if the cache is in memory.
+        """
+        with self._preload_lock:
+            if self._matrix is not None:
+                return True
+            if not self.available:
+                return False
+            start = time.perf_counter()
+            try:
+                with self.connection() as conn:
+                    self._detect_schema(conn)
+                    matrix = PackedPredictionMatrix.load(conn)
+            except (sqlite3.Error, PredictionCodecError) as e:
+                logger.warning(f"Prediction cache {self.db_path} could not be loaded into memory: {e}")
+                return False
+            self._matrix = matrix
+        if self._lru is not None:
+            self._lru.clear()
+        logger.info(
+            f"Prediction cache {os.path.basename(self.db_path)} loaded into memory: "
+            f"{len(matrix)} keys, {len(matrix.packed)} vectors, {matrix.nbytes / 1e6:.1f} MB "
+            f"in {time.perf_counter() - start:.1f}s"
+        )
+        return True
+
+    # ------------------------------------------------------------------
+    # Connection pool
+    # ------------------------------------------------------------------
+
+    def _open_connection(self) -> sqlite3.Connection:
+        uri = f"file:{quote(self.db_path)}?mode=ro&immutable=1"
+        # check_same_thread=False: a pooled connection may be used by a different
+        # thread than the one that opened it, but never by two threads at once.
+        conn = sqlite3.connect(uri, uri=True, timeout=10.0, check_same_thread=False)
+        conn.execute(f"PRAGMA mmap_size={self.mmap_bytes}")
+        conn.execute("PRAGMA query_only=1")
+        with self._stats_lock:
+            self._connections_opened += 1
+        return conn
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """
+        Check out a pooled connection for the duration of the ``with`` block.
+
+        Connections that raised a database error are discarded instead of
+        being returned to the pool.
+        """
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            conn = self._open_connection()
+
+        healthy = True
+        try:
+            yield conn
+        except sqlite3.Error:
+            healthy = False
+            raise
+        finally:
+            if healthy:
+                try:
+                    self._pool.put_nowait(conn)
+                except queue.Full:
+                    conn.close()
+            else:
+                conn.close()
+
+    def close(self) -> None:
+        """Close all idle pooled connections and drop the LRU contents."""
+        if self._lru is not None:
+            self._lru.clear()
+        while True:
+            try:
+                conn = self._pool.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+
+    # ------------------------------------------------------------------
+    # Lookups
+    # ------------------------------------------------------------------
+
+    def _is_refused(self, key: Union[int, str], app: Optional[str]) -> bool:
+        """True if ``key`` belongs to a model whose entries are refused for ``app``."""
+        refused = self._refused.get(app)
+        try:
+            return bool(refused) and key_model(as_integer_key(key)) in refused
+        except CacheKeyError:
+            return False
+
+    def _db_key(self, key: Union[int, str], app: Optional[str] = None) -> Union[int, str, None]:
+        """
+        Translate ``key`` to the key type of the open database (None if it has
+        none, or if its model's entries are refused for ``app``).
+        """
+        try:
+            if self._is_refused(key, app):
+                return None
+            if self._integer_keys:
+                return as_integer_key(key)
+            return key if isinstance(key, str) else int_to_legacy_key(key)
+        except CacheKeyError:
+            return None
+
+    def get(self, key: Union[int, str], app: Optional[str] = None) -> Optional[np.ndarray]:
+        """
+        Return the cached predictions for ``key`` as a read-only uint8 0/1 array.
+
+        ``key`` is the integer from :func:`.keys.encode_key`; legacy
+        ``"Model|Complexity|DataSize|features"`` strings are converted, and
+        databases that still use string keys are queried with the string form.
+
+        Resolves through the deduplicated ``cache -> vectors`` tables when present,
+        otherwise reads the single-table legacy layout. Bit-packed BLOBs and legacy
+        "0101" TEXT values are both decoded. Entries refused for ``app`` (see
+        :meth:`expect_fingerprints`) are misses.
+        Returns None on a miss, read error or undecodable value.
+        """
+        matrix = self._matrix
+        if matrix is not None:
+            return self._get_in_memory(matrix, key, app)
+        if not self.available:
+            return None
+
+        start = time.perf_counter()
+        if self._is_refused(key, app):
+            self._record(time.perf_counter() - start, hit=False)
+            return None
+        if self._lru is not None:
+            value = self._lru.get(key)
+            if value is not None:
+                self._record(time.perf_counter() - start, hit=True)
+                return value
+
+        value = None
+        error = False
+        try:
+            with self.connection() as conn:
+                self._detect_schema(conn)
+                db_key = self._db_key(key, app)
+                row = conn.execute(self._lookup_sql, (db_key,)).fetchone() if db_key is not None else None
+            if row:
+                value = decode_predictions(row[0])
+                if self._lru is not None:
+                    self._lru.put(key, value)
+                else:
+                    value.setflags(write=False)
+        except sqlite3.Error as e:
+            error = True
+            logger.warning(f"Prediction cache read error for {self.db_path}: {e}")
+        except PredictionCodecError as e:
+            error = True
+            logger.warning(f"Prediction cache decode error for key {key!r}: {e}")
+
+        self._record(time.perf_counter() - start, hit=value is not None, error=error)
+        return value
+
+    def get_many(self, keys: Iterable[Union[int, str]], app: Optional[str] = None) -> List[Optional[np.ndarray]]:
+        """
+        Batched :meth:`get`: the predictions of every key, in order (None for misses).
+
+        LRU hits are served first; the remaining keys are read on one pooled
+        connection with an ``IN (...)`` query per ``MANY_CHUNK`` keys. Every key
+        counts as one lookup in :meth:`stats`.
+        """
+        keys = list(keys)
+        matrix = self._matrix
+        if matrix is not None:
+            return [self._get_in_memory(matrix, key, app) for key in keys]
+        results: List[Optional[np.ndarray]] = [None] * len(keys)
+        if not self.available or not keys:
+            return results
+
+        start = time.perf_counter()
+        pending: Dict[Union[int, str], List[int]] = {}
+        for i, key in enumerate(keys):
+            if self._is_refused(key, app):
+                continue
+            value = self._lru.get(key) if self._lru is not None else None
+            if value is not None:
+                results[i] = value
+            else:
+                pending.setdefault(key, []).append(i)
+
+        errors: Set[int] = set()
+        if pending:
+            try:
+                with self.connection() as conn:
+                    self._detect_schema(conn)
+                    by_db_key: Dict[Union[int, str], List[Union[int, str]]] = {}
+                    for key in pending:
+                        db_key = self._db_key(key, app)
+                        if db_key is not None:
+                            by_db_key.setdefault(db_key, []).append(key)
+                    db_keys = list(by_db_key)
+                    rows = []
+                    for i in range(0, len(db_keys), MANY_CHUNK):
+                        chunk = db_keys[i:i + MANY_CHUNK]
+                        rows.extend(conn.execute(many_lookup_sql(self._lookup_sql, len(chunk)), chunk).fetchall())
+            except sqlite3.Error as e:
+                logger.warning(f"Prediction cache read error for {self.db_path}: {e}")
+                errors.update(i for positions in pending.values() for i in positions)
+                rows = []
+
+            for db_key, blob in rows:
+                try:
+                    value = decode_predictions(blob)
+                except PredictionCodecError as e:
+                    logger.warning(f"Prediction cache decode error for key {db_key!r}: {e}")
+                    errors.update(i for key in by_db_key[db_key] for i in pending[key])
+                    continue
+                value.setflags(write=False)
+                for key in by_db_key[db_key]:
+                    if self._lru is not None:
+                        self._lru.put(key, value)
+                    for i in pending[key]:
+                        results[i] = value
+
+        elapsed = (time.perf_counter() - start) / len(keys)
+        for i, value in enumerate(results):
+            self._record(elapsed, hit=value is not None, error=i in errors)
+        return results
+
+    def get_range(self, first: int, last: int, app: Optional[str] = None) -> Dict[int, np.ndarray]:
+        """
+        Predictions of every stored key in ``[first, last]``, as ``{key: array}``.
+
+        On integer-keyed databases this is one indexed range scan, e.g. all
+        complexity levels of a configuration (see :mod:`.keys`); older
+        databases fall back to :meth:`get_many`. Results are added to the LRU
+        and every key of the range counts as one lookup in :meth:`stats`.
+        """
+        first, last = as_integer_key(first), as_integer_key(last)
+        if last < first:
+            return {}
+        matrix = self._matrix
+        if matrix is not None:
+            start = time.perf_counter()
+            lo, hi = np.searchsorted(matrix.keys, [first, last + 1])
+            found = {}
+            for key, row in zip(matrix.keys[lo:hi].tolist(), matrix.rows[lo:hi].tolist()):
+                if self._db_key(key, app) is not None:
+                    found[key] = matrix.predictions(row)
+            self._record_range(time.perf_counter() - start, last - first + 1, len(found))
+            return found
+        if not self.available:
+            return {}
+
+        start = time.perf_counter()
+        try:
+            with self.connection() as conn:
+                self._detect_schema(conn)
+                scannable = self._integer_keys and self._lookup_sql == DEDUP_LOOKUP_SQL
+                rows = conn.execute(RANGE_SQL, (first, last)).fetchall() if scannable else None
+        except sqlite3.Error as e:
+            logger.warning(f"Prediction cache read error for {self.db_path}: {e}")
+            self._record_range(time.perf_counter() - start, last - first + 1, 0, error=True)
+            return {}
+        if rows is None:
+            keys = range(first, last + 1)
+            return {key: value for key, value in zip(keys, self.get_many(keys, app)) if value is not None}
+
+        found = {}
+        for key, blob in rows:
+            if self._db_key(key, app) is None:
+                continue
+            try:
+                value = decode_predictions(blob)
+            except PredictionCodecError as e:
+                logger.warning(f"Prediction cache decode error for key {key!r}: {e}")
+                continue
+            if self._lru is not None:
+                self._lru.put(key, value)
+            else:
+                value.setflags(write=False)
+            found[key] = value
+        self._record_range(time.perf_counter() - start, last - first + 1, len(found))
+        return found
+
+    def _record_range(self, elapsed: float, lookups: int, hits: int, error: bool = False) -> None:
+        for i in range(lookups):
+            self._record(elapsed / lookups, hit=i < hits, error=error)
+
+    def _get_in_memory(
+        self, matrix: PackedPredictionMatrix, key: Union[int, str], app: Optional[str] = None
+    ) -> Optional[np.ndarray]:
+        start = time.perf_counter()
+        db_key = self._db_key(key, app)
+        row = matrix.find(db_key) if db_key is not None else None
+        value = matrix.predictions(row) if row is not None else None
+        self._record(time.perf_counter() - start, hit=value is not None)
+        return value
+
+    def get_metrics(self, key: Union[int, str], app: Optional[str] = None) -> Optional[EntryMetrics]:
+        """
+        Return the precomputed metrics of the entry for ``key``.
+
+        Returns None on a miss, a read error, or a database built without
+        test labels. Lookups are not counted in :meth:`stats`.
+        """
+        blob = self._get_vector_column("metrics", METRICS_LOOKUP_SQL, key, app)
+        if blob is None:
+            return None
+        try:
+            return decode_metrics(blob)
+        except MetricsError as e:
+            logger.warning(f"Prediction cache metrics error for key {key!r}: {e}")
+            return None
+
+    def get_group_metrics(
+        self, key: Union[int, str], app: Optional[str] = None
+    ) -> Optional[Dict[str, Dict[str, GroupConfusion]]]:
+        """
+        Return the entry's confusion counts per sensitive group.
+
+        Returns:
+            ``{"race": {"African-American": GroupConfusion, ...}, "sex": {...}}``
+            (see :attr:`.metrics.GroupConfusion.fpr` / ``fnr``), or None on a
+            miss, a read error, or a database built without groups.
+            Lookups are not counted in :meth:`stats`.
+        """
+        blob = self._get_vector_column("groups", GROUPS_LOOKUP_SQL, key, app)
+        if blob is None:
+            return None
+        try:
+            return decode_group_counts(blob, self._group_names)
+        except MetricsError as e:
+            logger.warning(f"Prediction cache group counts error for key {key!r}: {e}")
+            return None
+
+    def _get_vector_column(
+        self, column: str, sql: str, key: Union[int, str], app: Optional[str] = None
+    ) -> Optional[bytes]:
+        """Raw ``vectors.<column>`` BLOB for ``key`` via the matrix or the LRU, or None."""
+        matrix = self._matrix
+        if matrix is not None:
+            db_key = self._db_key(key, app)
+            row = matrix.find(db_key) if db_key is not None else None
+            if row is None:
+                return None
+            return matrix.metrics_blob(row) if column == "metrics" else matrix.groups_blob(row)
+        if not self.available or self._is_refused(key, app):
+            return None
+
+        lru_key = (column, key)
+        if self._lru is not None:
+            packed = self._lru.get(lru_key)
+            if packed is not None:
+                return packed.tobytes()
+
+        try:
+            with self.connection() as conn:
+                self._detect_schema(conn)
+                db_key = self._db_key(key, app)
+                if column not in self._vector_columns or db_key is None:
+                    return None
+                row = conn.execute(sql, (db_key,)).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Prediction cache read error for {self.db_path}: {e}")
+            return None
+        if not row or row[0] is None:
+            return None
+
+        blob = bytes(row[0])
+        if self._lru is not None:
+            self._lru.put(lru_key, np.frombuffer(blob, dtype=np.uint8).copy())
+        return blob
+
+    def _detect_schema(self, conn: sqlite3.Connection) -> None:
+        if self._lookup_sql is None:
+            self._integer_keys = integer_keys(conn)
+            if self._integer_keys:
+                self._vector_columns = vector_columns(conn)
+                names = read_meta(conn, "group_names")
+                self._group_names = [tuple(n) for n in json.loads(names)] if names else []
+            stored = read_meta(conn, MODEL_FINGERPRINTS_META)
+            self._stored_fingerprints = json.loads(stored) if stored else None
+            self._refused = {app: self._check_fingerprints(app) for app in self._expected_fingerprints}
+            self._lookup_sql = lookup_sql(conn)
+
+    def _check_fingerprints(self, app: Optional[str]) -> frozenset:
+        expected = self._expected_fingerprints.get(app)
+        if expected is None:
+            return frozenset()
+        label = f" to {app}" if app else ""
+        stored = self._stored_fingerprints
+        if stored is None:
+            logger.warning(
+                f"Prediction cache {os.path.basename(self.db_path)} has no model fingerprints; "
+                f"serving it{label} without checking that it matches the app's models"
+            )
+            return frozenset()
+        refused = frozenset(name for name, fp in expected.items() if stored.get(name) != fp)
+        if refused:
+            logger.warning(
+                f"Prediction cache {os.path.basename(self.db_path)} was built with different settings for "
+                f"{', '.join(sorted(refused))}; their entries will not be served{label}"
+            )
+        return refused
+
+    def _record(self, elapsed: float, hit: bool, error: bool = False) -> None:
+        with self._stats_lock:
+            if error:
+                self._errors += 1
+            elif hit:
+                self._hits += 1
+            else:
+                self._misses += 1
+            self._lookup_seconds += elapsed
+            if elapsed > self._max_lookup_seconds:
+                self._max_lookup_seconds = elapsed
+            lookups = self._hits + self._misses + self._errors
+        if self.log_every and lookups % self.log_every == 0:
+            self.log_stats()
+
+    def log_stats(self) -> None:
+        """Write a one-line summary of :meth:`stats` to the package logger."""
+        s = self.stats()
+        logger.info(
+            f"Prediction cache {os.path.basename(self.db_path)}: {s['lookups']} lookups, "
+            f"hit rate {s['hit_rate']:.1%} ({s['hits']} hits, {s['misses']} misses, {s['errors']} errors), "
+            f"avg {s['avg_lookup_ms']:.3f} ms, max {s['max_lookup_ms']:.1f} ms; "
+            f"LRU {s['lru_hits']} hits / {s['lru_misses']} misses / {s['lru_evictions']} evictions, "
+            f"{s['lru_entries']} entries, {s['lru_bytes'] / 1e6:.1f}/{s['lru_max_bytes'] / 1e6:.1f} MB"
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Snapshot of reader counters.
+
+        Returns:
+            dict with hits, misses, errors, lookups, hit_rate, avg_lookup_ms,
+            max_lookup_ms, connections_opened, idle_connections, in_memory,
+            memory_bytes (size of the preloaded matrix), refused_models (of any
+            app), refused_by_app (``{app: [models]}``) and the LRU
+            counters lru_hits, lru_misses, lru_evictions, lru_entries,
+            lru_bytes and lru_max_bytes (zeros when the LRU is disabled).
+        """
+        lru = self._lru.stats() if self._lru is not None else {
+            "hits": 0, "misses": 0, "evictions": 0, "entries": 0, "bytes": 0, "max_bytes": 0,
+        }
+        with self._stats_lock:
+            lookups = self._hits + self._misses + self._errors
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "errors": self._errors,
+                "lookups": lookups,
+                "hit_rate": (self._hits / lookups) if lookups else 0.0,
+                "avg_lookup_ms": (self._lookup_seconds / lookups * 1000.0) if lookups else 0.0,
+                "max_lookup_ms": self._max_lookup_seconds * 1000.0,
+                "connections_opened": self._connections_opened,
+                "idle_connections": self._pool.qsize(),
+                "in_memory": self._matrix is not None,
+                "memory_bytes": self._matrix.nbytes if self._matrix is not None else 0,
+                "refused_models": sorted(set().union(*self._refused.values())),
+                "refused_by_app": {app: sorted(models) for app, models in self._refused.items() if models},
+                **{f"lru_{name}": value for name, value in lru.items()},
+            }
+
+
+# ----------------------------------------------------------------------
+# Process-wide readers
+# ----------------------------------------------------------------------
+
+_readers: Dict[str, PredictionCacheReader] = {}
+_readers_lock = threading.Lock()
+
+
+def get_reader(db_path: Optional[str] = None) -> PredictionCacheReader:
+    """
+    Return the process-wide reader for ``db_path`` (created on first use).
+
+    All apps running in the same process share one reader, and therefore one
+    connection pool and one set of counters, per cache file.
+    """
+    path = os.path.abspath(db_path or DEFAULT_DB_PATH)
+    with _readers_lock:
+        reader = _readers.get(path)
+        if reader is None:
+            reader = PredictionCacheReader(path)
+            _readers[path] = reader
+        return reader
@@ -0,0 +1,284 @@
+"""
+On-disk layout of ``prediction_cache.sqlite`` and the build-time writer.
+
+Many configurations (e.g. KNN with 100 neighbours, or feature subsets with no
+signal) produce exactly the same prediction vector, so vectors are stored once
+and addressed by content:
+
+    vectors (id INTEGER PRIMARY KEY, digest BLOB UNIQUE, value BLOB, metrics BLOB, groups BLOB)
+    cache   (key INTEGER PRIMARY KEY, vector_id INTEGER)
+    meta    (name TEXT PRIMARY KEY, value TEXT)
+
+``digest`` is a BLAKE2b hash of the encoded vector. Keys reference vectors by
+their integer rowid, which is smaller than repeating the digest per key.
+``cache.key`` is the integer key from :mod:`.keys` and is the table's rowid,
+so a lookup is a single probe of a small integer B-tree. ``metrics`` holds the
+vector's precomputed scores and ``groups`` its per-group confusion counts, in
+the order of the JSON ``group_names`` meta (see :mod:`.metrics`); both are NULL
+when the build had no test labels or groups. ``meta`` also holds the build's
+data and model fingerprints (see :mod:`.fingerprint`) when the builder knew them.
+
+Older databases have no ``groups`` column (schema 4), no ``metrics`` column
+(schema 3), ``cache.key TEXT``
+(schema 2) or a single ``cache(key TEXT, value)`` table; readers detect and
+still support all of them.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+from typing import Any, Dict, Optional, Set, Union
+
+from .codec import FORMAT_VERSION, encode_predictions
+from .keys import CacheKeyError, KEY_BITS, legacy_key_to_int
+from .metrics import METRIC_NAMES, MetricScorer, encode_group_counts, encode_metrics
+
+logger = logging.getLogger("aimodelshare.moral_compass")
+
+SCHEMA_VERSION = 5
+
+DEDUP_LOOKUP_SQL = (
+    "SELECT v.value FROM cache c JOIN vectors v ON v.id = c.vector_id WHERE c.key=?"
+)
+LEGACY_LOOKUP_SQL = "SELECT value FROM cache WHERE key=?"
+METRICS_LOOKUP_SQL = (
+    "SELECT v.metrics FROM cache c JOIN vectors v ON v.id = c.vector_id WHERE c.key=?"
+)
+GROUPS_LOOKUP_SQL = (
+    "SELECT v.groups FROM cache c JOIN vectors v ON v.id = c.vector_id WHERE c.key=?"
+)
+# Batched lookups: format with one "?" per key, e.g. many_lookup_sql(DEDUP_LOOKUP_SQL, 3)
+DEDUP_MANY_SQL = (
+    "SELECT c.key, v.value FROM cache c JOIN vectors v ON v.id = c.vector_id WHERE c.key IN ({})"
+)
+LEGACY_MANY_SQL = "SELECT key, value FROM cache WHERE key IN ({})"
+# Key range scan of an integer-keyed store, e.g. the 10 complexity levels of one configuration
+RANGE_SQL = (
+    "SELECT c.key, v.value FROM cache c JOIN vectors v ON v.id = c.vector_id "
+    "WHERE c.key BETWEEN ? AND ? ORDER BY c.key"
+)
+
+
+def vector_digest(blob: bytes) -> bytes:
+    """Content address of an encoded prediction vector."""
+    return hashlib.blake2b(blob, digest_size=16).digest()
+
+
+def lookup_sql(conn: sqlite3.Connection) -> str:
+    """
+    Pick the key lookup query matching the database schema.
+
+    Databases built before deduplication have a single ``cache(key, value)`` table.
+    """
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='vectors'"
+    ).fetchone()
+    return DEDUP_LOOKUP_SQL if row else LEGACY_LOOKUP_SQL
+
+
+def many_lookup_sql(single_sql: str, count: int) -> str:
+    """``(key, value)`` query for ``count`` keys matching the single-key ``single_sql``."""
+    template = DEDUP_MANY_SQL if single_sql == DEDUP_LOOKUP_SQL else LEGACY_MANY_SQL
+    return template.format(",".join("?" * count))
+
+
+def vector_columns(conn: sqlite3.Connection) -> Set[str]:
+    """Columns of the ``vectors`` table (``metrics`` from schema 4, ``groups`` from 5)."""
+    return {row[1] for row in conn.execute("PRAGMA table_info(vectors)")}
+
+
+def read_meta(conn: sqlite3.Connection, name: str) -> Optional[str]:
+    """Value of a ``meta`` row, or None."""
+    try:
+        row = conn.execute("SELECT value FROM meta WHERE name=?", (name,)).fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return row[0] if row else None
+
+
+def integer_keys(conn: sqlite3.Connection) -> bool:
+    """True if ``cache.key`` holds integer keys (schema 3 and later)."""
+    for _, name, col_type, *_ in conn.execute("PRAGMA table_info(cache)"):
+        if name == "key":
+            return col_type.upper() == "INTEGER"
+    return False
+
+
+def as_integer_key(key: Union[int, str]) -> int:
+    """Integer cache key, converting legacy strings."""
+    if isinstance(key, str):
+        return legacy_key_to_int(key)
+    key = int(key)
+    if not 0 <= key < (1 << KEY_BITS):
+        raise CacheKeyError(f"Cache key out of range: {key}")
+    return key
+
+
+class PredictionCacheWriter:
+    """
+    Build a deduplicated prediction cache database from (key, predictions) pairs.
+
+    The build is tuned for a one-shot bulk load with bounded memory:
+    - ``journal_mode=OFF`` / ``synchronous=OFF`` (the output is rebuilt on failure)
+    - inserts are committed in batches of ``batch_size``
+    - vector deduplication uses the on-disk ``digest`` index, not a Python dict
+    - keys go to an unindexed staging table; the primary key index is built once,
+      in key order, by :meth:`finalize`, which also runs ``ANALYZE`` and ``VACUUM``
+
+    Usage:
+        writer = PredictionCacheWriter("prediction_cache.sqlite")
+        for key, preds in items:
+            writer.add(key, preds)
+        stats = writer.finalize()
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        batch_size: int = 10000,
+        scorer: Optional[MetricScorer] = None,
+        meta: Optional[Dict[str, Any]] = None,
+    ):
+        """
+        Args:
+            db_path: Output path. An existing file is replaced.
+            batch_size: Number of entries per committed transaction.
+            scorer: Scores each new unique vector into ``vectors.metrics`` (and
+                ``vectors.groups`` if it has groups). Without one both are NULL.
+            meta: Extra ``meta`` rows written by :meth:`finalize`, e.g. the
+                build fingerprints (see :mod:`.fingerprint`).
+        """
+        self.db_path = db_path
+        self.batch_size = max(1, int(batch_size))
+        self.scorer = scorer
+        self.extra_meta = dict(meta or {})
+        if os.path.exists(db_path):
+            os.remove(db_path)
+        self._conn = sqlite3.connect(db_path, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=OFF")
+        self._conn.execute("PRAGMA synchronous=OFF")
+        self._conn.executescript(
+            """
+            CREATE TABLE vectors (
+                id INTEGER PRIMARY KEY, digest BLOB NOT NULL UNIQUE, value BLOB NOT NULL,
+                metrics BLOB, groups BLOB
+            );
+            CREATE TABLE cache_staging (key INTEGER NOT NULL, vector_id INTEGER NOT NULL);
+            CREATE TABLE meta (name TEXT PRIMARY KEY, value TEXT);
+            """
+        )
+        self._pending = 0
+        self.raw_bytes = 0
+        self._conn.execute("BEGIN")
+
+    def add(self, key: Union[int, str], predictions: Any) -> None:
+        """
+        Add one cache entry. Duplicate keys keep the first value.
+
+        Args:
+            key: Integer key from :func:`.keys.encode_key`, or a legacy
+                ``"Model|Complexity|DataSize|features"`` string.
+            predictions: 0/1 predictions in any form :func:`encode_predictions` accepts.
+
+        Raises:
+            CacheKeyError: if a string key cannot be parsed.
+            MetricsError: if a scorer is set and the vector length differs from its labels.
+        """
+        key = as_integer_key(key)
+        blob = encode_predictions(predictions)
+        digest = vector_digest(blob)
+        cur = self._conn.execute(
+            "INSERT OR IGNORE INTO vectors (digest, value) VALUES (?, ?)", (digest, blob)
+        )
+        if cur.rowcount:
+            vector_id = cur.lastrowid
+            if self.scorer is not None:
+                # Only new vectors are scored, so deduplicated entries cost nothing extra
+                groups = (
+                    encode_group_counts(self.scorer.score_groups(predictions))
+                    if self.scorer.group_names else None
+                )
+                self._conn.execute(
+                    "UPDATE vectors SET metrics=?, groups=? WHERE id=?",
+                    (encode_metrics(self.scorer.score(predictions)), groups, vector_id),
+                )
+        else:
+            vector_id = self._conn.execute(
+                "SELECT id FROM vectors WHERE digest=?", (digest,)
+            ).fetchone()[0]
+        self._conn.execute(
+            "INSERT INTO cache_staging (key, vector_id) VALUES (?, ?)", (key, vector_id)
+        )
+        self.raw_bytes += len(blob)
+
+        self._pending += 1
+        if self._pending >= self.batch_size:
+            self._conn.execute("COMMIT")
+            self._conn.execute("BEGIN")
+            self._pending = 0
+
+    def abort(self) -> None:
+        """Close and delete a partially written database."""
+        self._conn.close()
+        if os.path.exists(self.db_path):
+            os.remove(self.db_path)
+
+    def finalize(self) -> Dict[str, Any]:
+        """
+        Build the keyed ``cache`` table, drop vectors orphaned by duplicate keys,
+        write metadata, ``ANALYZE``/``VACUUM`` and close.
+
+        Returns:
+            dict with entries, unique_vectors, dedup_ratio, vector_bytes_before
+            (size without deduplication) and vector_bytes_after.
+        """
+        conn = self._conn
+        conn.execute("CREATE TABLE cache (key INTEGER PRIMARY KEY, vector_id INTEGER NOT NULL)")
+        # Sorted insert appends rowids in order, building the B-tree in one pass; ties on key
+        # resolve to the earliest staged row, so the first value wins.
+        conn.execute(
+            "INSERT OR IGNORE INTO cache (key, vector_id) "
+            "SELECT key, vector_id FROM cache_staging ORDER BY key, rowid"
+        )
+        conn.execute("DROP TABLE cache_staging")
+        conn.execute("DELETE FROM vectors WHERE id NOT IN (SELECT vector_id FROM cache)")
+        entries = conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        unique, stored_bytes = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM vectors"
+        ).fetchone()
+        stats = {
+            "entries": entries,
+            "unique_vectors": unique,
+            "dedup_ratio": (entries / unique) if unique else 0.0,
+            "vector_bytes_before": self.raw_bytes,
+            "vector_bytes_after": stored_bytes,
+        }
+        meta = {
+            "format_version": FORMAT_VERSION,
+            "schema_version": SCHEMA_VERSION,
+            "key_format": "int",
+            "entries": entries,
+            "unique_vectors": unique,
+        }
+        if self.scorer is not None:
+            meta["metrics"] = ",".join(METRIC_NAMES)
+            meta["private_size"] = self.scorer.private_size
+            meta["test_rows"] = len(self.scorer.y_true)
+            if self.scorer.group_names:
+                meta["group_names"] = json.dumps(self.scorer.group_names)
+        meta.update(self.extra_meta)
+        conn.executemany(
+            "INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)",
+            [(k, str(v)) for k, v in meta.items()],
+        )
+        conn.execute("COMMIT")
+        conn.execute("ANALYZE")
+        conn.execute("VACUUM")
+        conn.close()
+        logger.info(
+            f"Prediction cache written to {self.db_path}: {entries} entries, "
+            f"{unique} unique vectors (dedup {stats['dedup_ratio']:.2f}x)"
+        )
+        return stats
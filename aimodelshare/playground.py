@@ -1872,7 +1872,7 @@ class Competition:
         data = inspect_y_test(apiurl=self.playground_url, submission_type=self.submission_type)
         return data
 
-    def get_leaderboard(self, verbose=3, columns=None,token=None):
+    def get_leaderboard(self, verbose=3, columns=None,token=None, username=None, top_k=None, format="json"):
         """
         Get current competition leaderboard to rank all submitted models.
         Use in conjuction with stylize_leaderboard to visualize data.
@@ -1884,18 +1884,51 @@ class Competition:
         `columns` : optional, ``list of strings``
             list of specific column names to include in the leaderboard, all else will be excluded
             performance metrics will always be displayed
+        `username` : optional, ``string``
+            only return this user's rows (plus the `top_k` best rows)
+        `top_k` : optional, ``int``
+            only return the `top_k` best rows (plus the rows of `username`)
+        `format` : optional, ``string``
+            wire format: "json" (default) or "columnar", a smaller gzip'd
+            columnar encoding for large competitions
 
         Returns:
         --------
         dictionary of leaderboard data
+        (for scoped queries, leaderboard.attrs holds "user_rank" and "users")
         """
         from aimodelshare.leaderboard import get_leaderboard
         data = get_leaderboard(verbose=verbose,
                                columns=columns,
                                apiurl=self.playground_url,
-                               submission_type=self.submission_type, token=token)
+                               submission_type=self.submission_type, token=token,
+                               username=username, top_k=top_k, format=format)
         return data
 
+    def get_leaderboard_if_changed(self, known_version=None, verbose=3, columns=None, token=None, format="json"):
+        """
+        Get the competition leaderboard only if it changed since `known_version`.
+
+        Parameters:
+        -----------
+        `known_version` : optional, ``int``
+            leaderboard version of the caller's copy, as returned by a previous call
+            (the newest submitted model version; None always downloads the table)
+        `verbose`, `columns`, `format` : as for get_leaderboard
+
+        Returns:
+        --------
+        (leaderboard, version) : leaderboard is None when unchanged;
+        version is None when the competition's eval API predates versioning
+        """
+        from aimodelshare.leaderboard import get_leaderboard_if_changed
+        return get_leaderboard_if_changed(apiurl=self.playground_url,
+                                          known_version=known_version,
+                                          verbose=verbose,
+                                          columns=columns,
+                                          submission_type=self.submission_type, token=token,
+                                          format=format)
+
     def stylize_leaderboard(self, leaderboard, naming_convention="keras"):
         """
         Stylizes data received from get_leaderbord.
@@ -1,44 +1,213 @@
+import argparse
 import gzip
 import json
-import sqlite3
 import os
+import resource
+import time
+
+from aimodelshare.moral_compass.prediction_cache import (
+    DATA_FINGERPRINT_META,
+    MODEL_FINGERPRINTS_META,
+    CacheKeyError,
+    MetricScorer,
+    PredictionCacheWriter,
+)
 
 CACHE_FILE = "prediction_cache.json.gz"
+CHECKPOINT_FILE = "cache_checkpoint.jsonl"
 DB_FILE = "prediction_cache.sqlite"
+# Written by precompute_cache.py next to CACHE_FILE:
+# {"y_test": "0101...", "private_size": 0.5, "groups": {"race": [...], "sex": [...]},
+#  "data_fingerprint": "...", "model_fingerprints": {"The Rule-Maker": "...", ...}}
+LABELS_FILE = "prediction_cache_labels.json"
+
+# Input is read in fixed-size chunks, so peak memory does not grow with the
+# number of cache entries (the old converter json.load-ed the whole file and
+# then built a second full list of rows).
+READ_CHUNK_CHARS = 1 << 20
+BATCH_SIZE = 10000
+
+
+def iter_jsonl_items(path):
+    """Yield (key, value) pairs from a cache_checkpoint.jsonl file, one line at a time."""
+    with open(path, "r", encoding="UTF-8") as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                yield entry["k"], entry["v"]
+
+
+def iter_json_object_items(fp, chunk_size=READ_CHUNK_CHARS):
+    """
+    Yield (key, value) pairs of a top-level JSON object without loading it whole.
+
+    Incremental parser built on json.JSONDecoder.raw_decode: only the current
+    chunk (plus one partially read value) is held in memory.
+    """
+    decoder = json.JSONDecoder()
+    buf = ""
+    pos = 0
+    eof = False
+
+    def read_more():
+        nonlocal buf, pos, eof
+        chunk = fp.read(chunk_size)
+        if not chunk:
+            eof = True
+        buf = buf[pos:] + chunk
+        pos = 0
+
+    def peek():
+        # Next non-whitespace character ('' at end of input)
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos].isspace():
+                pos += 1
+            if pos < len(buf) or eof:
+                return buf[pos] if pos < len(buf) else ""
+            read_more()
+
+    def expect(char):
+        nonlocal pos
+        if peek() != char:
+            raise ValueError(f"Expected {char!r} at offset {pos} of current chunk")
+        pos += 1
+
+    def decode_value():
+        nonlocal pos
+        peek()
+        while True:
+            try:
+                value, end = decoder.raw_decode(buf, pos)
+                # A value ending exactly at the buffer edge may be truncated (e.g. a number)
+                if end < len(buf) or eof:
+                    pos = end
+                    return value
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            read_more()
+
+    expect("{")
+    if peek() == "}":
+        return
+    while True:
+        key = decode_value()
+        expect(":")
+        value = decode_value()
+        yield key, value
+        sep = peek()
+        if sep == ",":
+            pos += 1
+        elif sep == "}":
+            return
+        else:
+            raise ValueError(f"Malformed JSON object near offset {pos} of current chunk")
 
-def convert():
-    if not os.path.exists(CACHE_FILE):
-        print(f"❌ {CACHE_FILE} not found. Skipping conversion.")
+
+def iter_json_gz_items(path):
+    """Yield (key, value) pairs from the gzip'd JSON dictionary artifact, streaming."""
+    with gzip.open(path, "rt", encoding="UTF-8") as f:
+        yield from iter_json_object_items(f)
+
+
+def iter_source_items(path):
+    if path.endswith(".jsonl"):
+        return iter_jsonl_items(path)
+    return iter_json_gz_items(path)
+
+
+def _default_source():
+    for candidate in (CACHE_FILE, CHECKPOINT_FILE):
+        if os.path.exists(candidate):
+            return candidate
+    return CACHE_FILE
+
+
+def load_scorer(path=LABELS_FILE):
+    """MetricScorer for the labels file, or None if there is none."""
+    if not path or not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="UTF-8") as f:
+        labels = json.load(f)
+    y_test = [int(c) for c in labels["y_test"]]
+    return MetricScorer(y_test, labels.get("private_size", 0.0), labels.get("groups"))
+
+
+def load_fingerprint_meta(path=LABELS_FILE):
+    """Build fingerprint ``meta`` rows recorded in the labels file ({} if none)."""
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="UTF-8") as f:
+        labels = json.load(f)
+    if "data_fingerprint" not in labels:
+        return {}
+    return {
+        DATA_FINGERPRINT_META: labels["data_fingerprint"],
+        MODEL_FINGERPRINTS_META: json.dumps(labels["model_fingerprints"], sort_keys=True),
+    }
+
+
+def convert(source=None, db_path=DB_FILE, batch_size=BATCH_SIZE, labels_path=LABELS_FILE):
+    source = source or _default_source()
+    if not os.path.exists(source):
+        print(f"❌ {source} not found. Skipping conversion.")
         return
 
-    print(f"📖 Reading {CACHE_FILE} (this may take 15s)...")
+    scorer = load_scorer(labels_path)
+    if scorer is None:
+        print(f"⚠️ {labels_path} not found. Entries will have no precomputed metrics.")
+    else:
+        print(
+            f"📐 Scoring vectors against {len(scorer.y_true)} test labels (private_size={scorer.private_size}, "
+            f"{len(scorer.group_names)} fairness groups)"
+        )
+
+    print(f"📖 Streaming {source} into {db_path}...")
+    start = time.time()
+    meta = load_fingerprint_meta(labels_path)
+    if not meta:
+        print("⚠️ No build fingerprints recorded. Apps will serve the cache without checking its model settings.")
+    writer = PredictionCacheWriter(db_path, batch_size=batch_size, scorer=scorer, meta=meta)
+    count = 0
+    skipped = 0
     try:
-        with gzip.open(CACHE_FILE, "rt", encoding="UTF-8") as f:
-            data = json.load(f)
+        for k, v in iter_source_items(source):
+            try:
+                # String keys are stored under their integer encoding
+                writer.add(k, v)
+            except CacheKeyError:
+                skipped += 1
+                continue
+            count += 1
+            if count % 50000 == 0:
+                print(f"   ... {count} entries ({time.time() - start:.0f}s)")
     except Exception as e:
-        print(f"❌ Error reading JSON: {e}")
+        print(f"❌ Error reading {source} after {count} entries: {e}")
+        writer.abort()
         return
 
-    print(f"📦 Converting {len(data)} models to SQLite...")
-    
-    # Create DB
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    
-    # Create table with an index on the 'key' for super-fast lookups
-    cursor.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT)")
-    
-    # Bulk insert
-    items = [(k, v) for k, v in data.items()]
-    cursor.executemany("INSERT OR IGNORE INTO cache (key, value) VALUES (?, ?)", items)
-    
-    conn.commit()
-    
-    # Create Index explicitly (though PRIMARY KEY implies it) to ensure speed
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_key ON cache (key)")
-    
-    conn.close()
-    print(f"✅ Success! Created {DB_FILE}")
+    # Content-addressed store: identical prediction vectors are written once
+    # (bit-packed) and cache keys point at them by id.
+    stats = writer.finalize()
+    stats["skipped_keys"] = skipped
+    if skipped:
+        print(f"⚠️ Skipped {skipped} entries whose keys have no integer encoding.")
+
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(
+        f"♻️  Dedup: {stats['entries']} keys -> {stats['unique_vectors']} unique vectors "
+        f"({stats['dedup_ratio']:.2f}x, {stats['vector_bytes_before'] / 1e6:.1f} MB -> "
+        f"{stats['vector_bytes_after'] / 1e6:.1f} MB of vectors)"
+    )
+    print(f"✅ Success! Created {db_path} in {time.time() - start:.1f}s (peak RSS {peak_mb:.0f} MB)")
+    return stats
 
 if __name__ == "__main__":
-    convert()
+    parser = argparse.ArgumentParser(description="Convert the prediction cache artifact to SQLite.")
+    parser.add_argument("source", nargs="?", help=f"{CACHE_FILE} or {CHECKPOINT_FILE} (default: whichever exists)")
+    parser.add_argument("--output", default=DB_FILE, help=f"Output database (default: {DB_FILE})")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Entries per transaction")
+    parser.add_argument("--labels", default=LABELS_FILE, help=f"Test labels for precomputed metrics (default: {LABELS_FILE})")
+    args = parser.parse_args()
+    convert(args.source, args.output, args.batch_size, args.labels)
@@ -2,61 +2,136 @@ import os
 import json
 import gzip
 import itertools
+import argparse
 import time
 import gc
+import warnings
+import sqlite3
+import heapq
+import inspect
 import pandas as pd
 import numpy as np
 from joblib import Parallel, delayed
+from sklearn.base import clone
 from sklearn.model_selection import train_test_split
 from sklearn.pipeline import Pipeline
-from sklearn.compose import ColumnTransformer
 from sklearn.preprocessing import StandardScaler, OneHotEncoder
 from sklearn.impute import SimpleImputer
-from sklearn.linear_model import LogisticRegression
 from sklearn.tree import DecisionTreeClassifier
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.neighbors import KNeighborsClassifier
 
+# The estimators and complexity tuning the apps train with; entries are only
+# served by an app while both sides produce the same model fingerprints.
+from aimodelshare.moral_compass.prediction_cache.models import MODEL_TYPES, tune_model
+
 # --- 1. CONFIGURATION ---
 MAX_ROWS = 4000
+# Seed of the row cap, train/test split and data size samples
+SAMPLE_SEED = 42
+TEST_SIZE = 0.25
+# Most frequent c_charge_desc values kept; the rest become "OTHER"
+TOP_CHARGES = 50
 # Stop script after 50 minutes (3000 seconds) to prevent GitHub Timeout Crash
-MAX_RUNTIME_SEC = 3000 
-# UPDATED: Reduced batch size to force frequent garbage collection
-BATCH_SIZE = 1000 
+MAX_RUNTIME_SEC = 3000
+# Tasks per checkpoint flush (time limit is checked between batches)
+BATCH_SIZE = 1000
+# Worker processes for model fits (-1 = all cores). Override with --jobs.
+N_JOBS = int(os.environ.get("PRECOMPUTE_JOBS", "-1"))
+# Tasks sent to a worker per dispatch; amortises IPC without holding many results in RAM
+CHUNK_SIZE = 25
 
-CHECKPOINT_FILE = "cache_checkpoint.jsonl"
+CHECKPOINT_FILE = "cache_checkpoint.sqlite"
+# Checkpoints written before the SQLite store; imported once on resume
+LEGACY_CHECKPOINT_FILE = "cache_checkpoint.jsonl"
 FINAL_FILE = "prediction_cache.json.gz"
+# Test labels + public/private split written next to FINAL_FILE; convert_db.py
+# uses it to precompute each entry's metrics
+LABELS_FILE = "prediction_cache_labels.json"
+# Private fraction of the competition's public_private_split.json (eval Lambda).
+# Override with --private-size.
+PRIVATE_SIZE = float(os.environ.get("PRECOMPUTE_PRIVATE_SIZE", "0"))
+# Output of --merge: the deduplicated store the apps read
+DB_FILE = "prediction_cache.sqlite"
+# Prepared train/test rows and data size samples, loaded by the apps at startup
+DATA_FILE = "compas_prepared.npz"
+DATA_URL = "https://raw.githubusercontent.com/propublica/compas-analysis/master/compas-scores-two-years.csv"
 
 ALL_NUMERIC_COLS = ["juv_fel_count", "juv_misd_count", "juv_other_count", "days_b_screening_arrest", "age", "length_of_stay", "priors_count"]
 ALL_CATEGORICAL_COLS = ["race", "sex", "c_charge_degree", "c_charge_desc"]
 ALL_FEATURES = ALL_NUMERIC_COLS + ALL_CATEGORICAL_COLS
+# Test-set groups whose confusion counts are stored per entry for the fairness apps
+GROUP_COLS = ["race", "sex"]
 
 DATA_SIZE_MAP = {"Small (20%)": 0.2, "Medium (60%)": 0.6, "Large (80%)": 0.8, "Full (100%)": 1.0}
 
-MODEL_TYPES = {
-    "The Balanced Generalist": lambda: LogisticRegression(max_iter=200, random_state=42, class_weight="balanced"),
-    "The Rule-Maker": lambda: DecisionTreeClassifier(random_state=42, class_weight="balanced"),
-    "The 'Nearest Neighbor'": lambda: KNeighborsClassifier(),
-    "The Deep Pattern-Finder": lambda: RandomForestClassifier(random_state=42, class_weight="balanced")
-}
+COMPLEXITY_LEVELS = range(1, 11)
+FEATURE_COMBOS = [combo for r in range(1, len(ALL_FEATURES) + 1) for combo in itertools.combinations(ALL_FEATURES, r)]
+# 4 models x 4 data sizes x 2047 feature subsets x 10 levels = 327,520
+TOTAL_TASKS = len(MODEL_TYPES) * len(DATA_SIZE_MAP) * len(FEATURE_COMBOS) * len(COMPLEXITY_LEVELS)
+
+# --- 2. TASK INDEX ---
+# Every task has a stable integer id: its position in the enumeration
+# (model, data size, feature subset, complexity), complexity innermost so each
+# (model, size, features) sweep is a contiguous id range.
+_MODEL_NAMES = list(MODEL_TYPES)
+_DATA_SIZES = list(DATA_SIZE_MAP)
+_COMBO_INDEX = {combo: i for i, combo in enumerate(FEATURE_COMBOS)}
+
+def task_index(model_name, complexity, data_size, feature_tuple):
+    i = _MODEL_NAMES.index(model_name)
+    i = i * len(_DATA_SIZES) + _DATA_SIZES.index(data_size)
+    i = i * len(FEATURE_COMBOS) + _COMBO_INDEX[tuple(feature_tuple)]
+    return i * len(COMPLEXITY_LEVELS) + COMPLEXITY_LEVELS.index(complexity)
 
-# --- 2. DATA PREP ---
-def load_data():
+def model_task_range(model_name):
+    """[start, stop) task ids of one model (the model is the outermost index)."""
+    per_model = len(_DATA_SIZES) * len(FEATURE_COMBOS) * len(COMPLEXITY_LEVELS)
+    start = _MODEL_NAMES.index(model_name) * per_model
+    return start, start + per_model
+
+def task_from_index(task_id):
+    rest, level = divmod(int(task_id), len(COMPLEXITY_LEVELS))
+    rest, combo = divmod(rest, len(FEATURE_COMBOS))
+    model, size = divmod(rest, len(_DATA_SIZES))
+    return _MODEL_NAMES[model], COMPLEXITY_LEVELS[level], _DATA_SIZES[size], FEATURE_COMBOS[combo]
+
+# Sharding assigns whole sweeps (10 consecutive ids) round-robin, so no sweep
+# is split and every shard gets a similar mix of cheap and expensive models.
+def parse_shard(spec):
+    """Parse "i/N" (0-based shard i of N)."""
+    try:
+        index, count = (int(part) for part in spec.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected i/N, got {spec!r}")
+    if count < 1 or not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"shard index must be in 0..{count - 1}, got {spec!r}")
+    return index, count
+
+def shard_mask(index, count):
+    """Boolean array over all task ids, True for the tasks of shard index/count."""
+    return (np.arange(TOTAL_TASKS) // len(COMPLEXITY_LEVELS)) % count == index
+
+def shard_checkpoint_file(index, count):
+    return f"cache_checkpoint.shard-{index}-of-{count}.sqlite"
+
+# --- 3. DATA PREP ---
+def load_data(csv_path=None):
     print("Loading dataset...")
-    url = "https://raw.githubusercontent.com/propublica/compas-analysis/master/compas-scores-two-years.csv"
+    source = csv_path or os.environ.get("COMPAS_CSV") or DATA_URL
     try:
-        df = pd.read_csv(url)
+        df = pd.read_csv(source)
         df['c_jail_in'] = pd.to_datetime(df['c_jail_in'])
         df['c_jail_out'] = pd.to_datetime(df['c_jail_out'])
         df['length_of_stay'] = (df['c_jail_out'] - df['c_jail_in']).dt.total_seconds() / (24 * 60 * 60)
     except:
-        df = pd.read_csv(url)
+        df = pd.read_csv(source)
         df['length_of_stay'] = np.nan
 
     if df.shape[0] > MAX_ROWS:
-        df = df.sample(n=MAX_ROWS, random_state=42)
+        df = df.sample(n=MAX_ROWS, random_state=SAMPLE_SEED)
 
-    top_charges = df["c_charge_desc"].value_counts().head(50).index
+    top_charges = df["c_charge_desc"].value_counts().head(TOP_CHARGES).index
     df["c_charge_desc"] = df["c_charge_desc"].apply(lambda x: x if pd.notna(x) and x in top_charges else "OTHER")
 
     for col in ALL_FEATURES:
@@ -65,165 +140,650 @@ def load_data():
     X = df[ALL_FEATURES].copy()
     y = df["two_year_recid"].copy()
     print(f"Data Loaded. Shape: {X.shape}")
-    return train_test_split(X, y, test_size=0.25, random_state=42, stratify=y)
+    return train_test_split(X, y, test_size=TEST_SIZE, random_state=SAMPLE_SEED, stratify=y)
 
-X_TRAIN_RAW, X_TEST_RAW, Y_TRAIN, Y_TEST = load_data()
+def sample_data_sizes(X_train_raw, y_train):
+    X_samples, y_samples = {}, {}
+    for label, frac in DATA_SIZE_MAP.items():
+        if frac == 1.0:
+            X_samples[label], y_samples[label] = X_train_raw, y_train
+        else:
+            X_samples[label] = X_train_raw.sample(frac=frac, random_state=SAMPLE_SEED)
+            y_samples[label] = y_train.loc[X_samples[label].index]
+    return X_samples, y_samples
 
-X_SAMPLES, Y_SAMPLES = {}, {}
-for label, frac in DATA_SIZE_MAP.items():
-    if frac == 1.0:
-        X_SAMPLES[label], Y_SAMPLES[label] = X_TRAIN_RAW, Y_TRAIN
-    else:
-        X_SAMPLES[label] = X_TRAIN_RAW.sample(frac=frac, random_state=42)
-        Y_SAMPLES[label] = Y_TRAIN.loc[X_SAMPLES[label].index]
-
-# --- 3. WORKER HELPERS ---
-def get_preprocessor(features):
-    num = [f for f in features if f in ALL_NUMERIC_COLS]
-    cat = [f for f in features if f in ALL_CATEGORICAL_COLS]
-    steps = []
-    if num: steps.append(("num", Pipeline([("imputer", SimpleImputer(strategy="median")), ("scaler", StandardScaler())]), num))
-    if cat: steps.append(("cat", Pipeline([("imputer", SimpleImputer(strategy="constant", fill_value="missing")), ("onehot", OneHotEncoder(handle_unknown="ignore", sparse_output=True))]), cat))
-    return ColumnTransformer(steps, remainder="drop")
-
-def tune_model(model, level):
-    level = int(level)
-    if isinstance(model, LogisticRegression):
-        model.C = {1: 0.01, 2: 0.025, 3: 0.05, 4: 0.1, 5: 0.25, 6: 0.5, 7: 1.0, 8: 2.0, 9: 5.0, 10: 10.0}.get(level, 1.0)
-    elif isinstance(model, RandomForestClassifier):
-        model.n_estimators = {1: 10, 2: 12, 3: 15, 4: 18, 5: 20, 6: 22, 7: 25, 8: 28, 9: 30, 10: 30}.get(level, 20)
-        model.max_depth = level * 2 + 2 if level < 9 else None
-    elif isinstance(model, DecisionTreeClassifier):
-        model.max_depth = level + 1 if level < 10 else None
-    elif isinstance(model, KNeighborsClassifier):
-        model.n_neighbors = {1: 100, 2: 75, 3: 60, 4: 50, 5: 40, 6: 30, 7: 25, 8: 15, 9: 7, 10: 3}.get(level, 25)
-    return model
-
-def process(task):
+# --- 4. SHARED PREPROCESSING ---
+# Every transformer in the old per-task ColumnTransformer (median imputer +
+# scaler, constant imputer + one-hot) works column by column. So each column is
+# fitted ONCE per data size, and any feature subset's matrix is just a column
+# slice of the full matrix, in the same column order the ColumnTransformer used
+# (numeric block then categorical block, both in ALL_FEATURES order).
+def get_column_transformer(col):
+    if col in ALL_NUMERIC_COLS:
+        return Pipeline([("imputer", SimpleImputer(strategy="median")), ("scaler", StandardScaler())])
+    return Pipeline([("imputer", SimpleImputer(strategy="constant", fill_value="missing")), ("onehot", OneHotEncoder(handle_unknown="ignore", sparse_output=False))])
+
+def build_feature_matrices(X_train, X_test):
+    """
+    Fit per-column transformers on X_train.
+
+    Returns (train_matrix, test_matrix, column_slices) where column_slices maps
+    each feature to its (start, stop) column range. Matrices are dense float64:
+    at <= 4000 rows they are a few MB, so trees never need per-task densification.
+    """
+    train_blocks, test_blocks, column_slices = [], [], {}
+    offset = 0
+    for col in ALL_FEATURES:
+        tf = get_column_transformer(col)
+        tr = np.asarray(tf.fit_transform(X_train[[col]]), dtype=np.float64)
+        te = np.asarray(tf.transform(X_test[[col]]), dtype=np.float64)
+        column_slices[col] = (offset, offset + tr.shape[1])
+        offset += tr.shape[1]
+        train_blocks.append(tr)
+        test_blocks.append(te)
+    return np.hstack(train_blocks), np.hstack(test_blocks), column_slices
+
+def feature_columns(feature_tuple, column_slices):
+    return np.array([i for f in ALL_FEATURES if f in feature_tuple for i in range(*column_slices[f])], dtype=np.intp)
+
+class PrecomputeEngine:
+    """Preprocessed train/test matrices for every data size, built once."""
+
+    def __init__(self, csv_path=None):
+        X_train_raw, X_test_raw, y_train, y_test = load_data(csv_path)
+        X_samples, y_samples = sample_data_sizes(X_train_raw, y_train)
+        self.X_test_raw = X_test_raw
+        self.y_test = y_test.to_numpy()
+        self.matrices = {}
+        for label in DATA_SIZE_MAP:
+            X_tr, X_te, slices = build_feature_matrices(X_samples[label], X_test_raw)
+            self.matrices[label] = (X_tr, y_samples[label].to_numpy(), X_te, slices)
+        print(f"Preprocessing fitted once per data size: {', '.join(DATA_SIZE_MAP)}")
+
+_ENGINE = None
+
+def get_engine():
+    global _ENGINE
+    if _ENGINE is None:
+        _ENGINE = PrecomputeEngine()
+    return _ENGINE
+
+# --- 5. MODELS ---
+def cache_key(model_name, complexity, data_size, feature_tuple):
+    return f"{model_name}|{complexity}|{data_size}|{','.join(sorted(feature_tuple))}"
+
+def fit_predict(model_name, complexity, X_tr, y_tr, X_te):
+    model = tune_model(MODEL_TYPES[model_name](), complexity)
+    model.fit(X_tr, y_tr)
+    return model.predict(X_te)
+
+# Stored with every checkpoint and cache: a task's result is only reused while
+# the data fingerprint and its model's fingerprint are unchanged (see
+# aimodelshare.moral_compass.prediction_cache.fingerprint).
+_PREPROCESSING_CODE = (load_data, sample_data_sizes, get_column_transformer, build_feature_matrices, feature_columns)
+
+def build_fingerprints(approximate=False):
+    """
+    (data fingerprint, {model name: fingerprint}) of the current configuration.
+
+    approximate=True marks the trees and forests as built by --approximate-sweep.
+    """
+    from aimodelshare.moral_compass.prediction_cache import FIT_APPROXIMATE_SWEEP, fingerprint, model_fingerprints
+
+    data = fingerprint(
+        MAX_ROWS, SAMPLE_SEED, TEST_SIZE, TOP_CHARGES, DATA_SIZE_MAP, ALL_FEATURES,
+        *(inspect.getsource(fn) for fn in _PREPROCESSING_CODE),
+    )
+    fit_modes = {
+        name: FIT_APPROXIMATE_SWEEP for name, factory in MODEL_TYPES.items()
+        if approximate and isinstance(factory(), (DecisionTreeClassifier, RandomForestClassifier))
+    }
+    return data, model_fingerprints(MODEL_TYPES, tune_model, COMPLEXITY_LEVELS, fit_modes)
+
+def export_data_artifact(path=DATA_FILE, csv_path=None):
+    """
+    Write the split and data size samples this build trains on to the data
+    artifact the apps load instead of the CSV (see
+    aimodelshare.moral_compass.prediction_cache.dataset).
+    """
+    from aimodelshare.moral_compass.prediction_cache import write_prepared_data
+
+    X_train_raw, X_test_raw, y_train, y_test = load_data(csv_path)
+    X_samples, _ = sample_data_sizes(X_train_raw, y_train)
+    samples = {frac: X_samples[label].index for label, frac in DATA_SIZE_MAP.items() if frac < 1.0}
+    write_prepared_data(path, X_train_raw, X_test_raw, y_train, y_test, samples, build_fingerprints()[0])
+
+# --- 6. COMPLEXITY SWEEPS ---
+# The 10 levels of one (model, data size, features) group differ only in the
+# tune_model setting. By default a sweep shares work between levels only where
+# the predictions are identical to fitting every level independently:
+# - KNN: one k-neighbour query at the largest k, majority vote over prefixes
+#   (rows with a distance tie at the k-th neighbour are re-queried)
+# - DecisionTree: levels are fitted in ascending max_depth; once a fitted tree
+#   stops short of its depth limit, the limit never applied, so every deeper
+#   level would grow the same tree and reuses its predictions
+# - RandomForest: levels with the same max_depth (9 and 10: unlimited, 180 and
+#   220 trees) grow one warm-started forest in ascending n_estimators. Tree i
+#   draws its seed as the i-th value of the forest's random_state either way,
+#   so the first 180 trees of the 220-tree fit are the 180-tree forest
+# - LogisticRegression: every level is fitted on its own (a warm-started
+#   regularisation path converges to slightly different coefficients, which
+#   flips predictions near the decision boundary)
+#
+# approximate=True (--approximate-sweep) instead fits one tree/forest at the
+# deepest level and truncates it to each max_depth, level k of the forest using
+# its first n_estimators trees. The results are APPROXIMATE: a tree grown to
+# full depth consumes the feature-shuffle (max_features) RNG in a different
+# order than a depth-limited fit, so it picks different splits below the root.
+# On the COMPAS sample about a third of the tree and forest levels differ from
+# cold fits, by up to ~12% of the test rows. Approximate builds are recorded in
+# the model fingerprints, so apps do not mistake them for exact ones.
+def _tree_node_paths(tree, X):
+    """Node reached by every row of X after 0..max_depth steps, shape (depth+1, n)."""
+    t = tree.tree_
+    # Trees split on float32 features, exactly as DecisionTreeClassifier.apply
+    X = np.asarray(X, dtype=np.float32)
+    rows = np.arange(X.shape[0])
+    node = np.zeros(X.shape[0], dtype=np.intp)
+    paths = [node]
+    for _ in range(t.max_depth):
+        internal = t.children_left[node] != -1
+        go_left = X[rows, np.maximum(t.feature[node], 0)] <= t.threshold[node]
+        node = np.where(internal, np.where(go_left, t.children_left[node], t.children_right[node]), node)
+        paths.append(node)
+    return np.stack(paths)
+
+def _truncated_proba(tree, paths, max_depth):
+    """Class probabilities of ``tree`` cut at ``max_depth`` (None = full tree)."""
+    depth = len(paths) - 1 if max_depth is None else min(max_depth, len(paths) - 1)
+    value = tree.tree_.value[paths[depth], 0, :]
+    return value / value.sum(axis=1, keepdims=True)
+
+def _sweep_knn(model, levels, X_tr, y_tr, X_te):
+    ks = {level: tune_model(model, level).n_neighbors for level in levels}
+    ks = {level: k for level, k in ks.items() if k <= len(y_tr)}
+    if not ks:
+        return {}
+    k_max = max(ks.values())
+    model.set_params(n_neighbors=k_max).fit(X_tr, y_tr)
+    dist, neighbours = model.kneighbors(X_te)
+    y_enc = np.searchsorted(model.classes_, np.asarray(y_tr))[neighbours]
+    out = {}
+    for level, k in ks.items():
+        votes = np.stack([(y_enc[:, :k] == c).sum(axis=1) for c in range(len(model.classes_))], axis=1)
+        # argmax picks the first class on ties, like KNeighborsClassifier.predict
+        preds = model.classes_[votes.argmax(axis=1)]
+        if k < k_max:
+            # Which of several equidistant points make the top k depends on the
+            # search algorithm sklearn picks for that k (duplicate rows are
+            # common), so rows tied at the k-th neighbour are re-queried.
+            tied = np.isclose(dist[:, k - 1], dist[:, k], rtol=1e-9, atol=1e-12)
+            if tied.any():
+                preds[tied] = clone(model).set_params(n_neighbors=k).fit(X_tr, y_tr).predict(X_te[tied])
+        out[level] = preds
+    return out
+
+def _sweep_tree(model, levels, X_tr, y_tr, X_te):
+    depths = {level: tune_model(model, level).max_depth for level in levels}
+    order = sorted(depths, key=lambda lvl: np.inf if depths[lvl] is None else depths[lvl])
+    out, saturated = {}, None
+    for level in order:
+        if saturated is None:
+            fitted = clone(model).set_params(max_depth=depths[level]).fit(X_tr, y_tr)
+            preds = fitted.predict(X_te)
+            if depths[level] is not None and fitted.get_depth() < depths[level]:
+                saturated = preds
+        out[level] = preds if saturated is None else saturated
+    return out
+
+def _sweep_forest(model, levels, X_tr, y_tr, X_te):
+    params = {level: (tune_model(model, level).max_depth, model.n_estimators) for level in levels}
+    out = {}
+    for depth in dict.fromkeys(d for d, _ in params.values()):
+        forest = clone(model).set_params(max_depth=depth, warm_start=True)
+        for level in sorted((lvl for lvl, (d, _) in params.items() if d == depth), key=lambda lvl: params[lvl][1]):
+            with warnings.catch_warnings():
+                # Warns about class_weight="balanced" with warm_start; every fit sees the same y
+                warnings.simplefilter("ignore", UserWarning)
+                forest.set_params(n_estimators=params[level][1]).fit(X_tr, y_tr)
+            out[level] = forest.predict(X_te)
+    return out
+
+def _truncated_sweep_tree(model, levels, X_tr, y_tr, X_te):
+    depths = {level: tune_model(model, level).max_depth for level in levels}
+    model.max_depth = None if None in depths.values() else max(depths.values())
+    model.fit(X_tr, y_tr)
+    paths = _tree_node_paths(model, X_te)
+    return {level: model.classes_[_truncated_proba(model, paths, d).argmax(axis=1)] for level, d in depths.items()}
+
+def _truncated_sweep_forest(model, levels, X_tr, y_tr, X_te):
+    params = {level: (tune_model(model, level).n_estimators, model.max_depth) for level in levels}
+    depths = [d for _, d in params.values()]
+    model.n_estimators = max(n for n, _ in params.values())
+    model.max_depth = None if None in depths else max(depths)
+    model.fit(X_tr, y_tr)
+    paths = [_tree_node_paths(est, X_te) for est in model.estimators_]
+    out = {}
+    for level, (n, d) in params.items():
+        proba = sum(_truncated_proba(est, p, d) for est, p in zip(model.estimators_[:n], paths[:n])) / n
+        out[level] = model.classes_[proba.argmax(axis=1)]
+    return out
+
+def sweep_predict(model_name, levels, X_tr, y_tr, X_te, approximate=False):
+    """
+    Predictions for several complexity levels of one model, sharing work
+    between levels where the result is exact (see above).
+
+    With approximate=True trees and forests are truncated from one deep fit.
+    Returns {level: predictions}. Levels that cannot be fitted (more neighbours
+    than training rows) are left out, as their independent fits would fail.
+    """
+    model = MODEL_TYPES[model_name]()
+    if isinstance(model, KNeighborsClassifier):
+        return _sweep_knn(model, levels, X_tr, y_tr, X_te)
+    if isinstance(model, RandomForestClassifier):
+        sweep = _truncated_sweep_forest if approximate else _sweep_forest
+        return sweep(model, levels, X_tr, y_tr, X_te)
+    if isinstance(model, DecisionTreeClassifier):
+        sweep = _truncated_sweep_tree if approximate else _sweep_tree
+        return sweep(model, levels, X_tr, y_tr, X_te)
+    out = {}
+    for level in levels:
+        try:
+            out[level] = fit_predict(model_name, level, X_tr, y_tr, X_te)
+        except Exception:
+            continue
+    return out
+
+# --- 7. WORKER HELPERS ---
+def pack_predictions(preds):
+    return np.packbits(np.asarray(preds, dtype=np.uint8)).tobytes()
+
+def unpack_predictions(value, length):
+    return np.unpackbits(np.frombuffer(value, dtype=np.uint8), count=length)
+
+def run_chunk(X_tr, y_tr, X_te, column_slices, data_size, groups, sweep=True, approximate=False):
+    """
+    Worker entry point: train every (model, levels, features) group of one data
+    size. The matrices arrive as read-only memmaps shared by all workers.
+    With sweep=False every level is fitted independently (reference mode);
+    approximate=True enables the truncated tree/forest sweeps.
+
+    Returns a list of (task_id, bit-packed predictions).
+    """
+    results = []
+    for model_name, levels, feature_tuple in groups:
+        cols = feature_columns(feature_tuple, column_slices)
+        X_tr_f, X_te_f = X_tr[:, cols], X_te[:, cols]
+        if sweep:
+            try:
+                preds_by_level = sweep_predict(model_name, levels, X_tr_f, y_tr, X_te_f, approximate)
+            except Exception:
+                continue
+        else:
+            preds_by_level = {}
+            for level in levels:
+                try:
+                    preds_by_level[level] = fit_predict(model_name, level, X_tr_f, y_tr, X_te_f)
+                except Exception:
+                    continue
+        for level in levels:
+            if level in preds_by_level:
+                results.append((task_index(model_name, level, data_size, feature_tuple), pack_predictions(preds_by_level[level])))
+    return results
+
+def process(task, sweep=False, approximate=False):
+    """
+    Train a single (model, complexity, data size, features) task in-process.
+
+    With sweep=True the task's whole complexity sweep is run, as in a build,
+    so with approximate=True the result matches an --approximate-sweep cache.
+    """
     model_name, complexity, data_size, feature_tuple = task
-    feature_key = ",".join(sorted(feature_tuple))
-    key = f"{model_name}|{complexity}|{data_size}|{feature_key}"
-    
-    try:
-        prep = get_preprocessor(feature_tuple)
-        X_tr = prep.fit_transform(X_SAMPLES[data_size])
-        X_te = prep.transform(X_TEST_RAW)
-        
-        model = MODEL_TYPES[model_name]()
-        model = tune_model(model, complexity)
-        
-        if isinstance(model, (RandomForestClassifier, DecisionTreeClassifier)):
-            X_tr = X_tr.toarray() if hasattr(X_tr, "toarray") else X_tr
-            X_te = X_te.toarray() if hasattr(X_te, "toarray") else X_te
-            
-        model.fit(X_tr, Y_SAMPLES[data_size])
-        
-        preds = model.predict(X_te)
-        # Store as lightweight string "010101"
-        pred_string = "".join(preds.astype(str))
-        
-        return key, pred_string
-    except Exception:
+    engine = get_engine()
+    X_tr, y_tr, X_te, slices = engine.matrices[data_size]
+    levels = tuple(COMPLEXITY_LEVELS) if sweep else (complexity,)
+    results = dict(run_chunk(X_tr, y_tr, X_te, slices, data_size, [(model_name, levels, feature_tuple)], sweep, approximate))
+    packed = results.get(task_index(*task))
+    if packed is None:
         return None
+    # Store as lightweight string "010101"
+    preds = unpack_predictions(packed, len(engine.y_test))
+    return cache_key(*task), "".join(preds.astype(str))
+
+def iter_chunks(tasks, engine, sweep=True, approximate=False):
+    """
+    Group tasks into (model, levels, features) sweeps per data size and yield
+    delayed worker calls of about CHUNK_SIZE tasks each.
+    """
+    groups = {}
+    for m, c, d, f in tasks:
+        groups.setdefault((d, m, f), []).append(c)
+    by_size = {}
+    for (d, m, f), levels in groups.items():
+        by_size.setdefault(d, []).append((m, tuple(levels), f))
+    for d, size_groups in by_size.items():
+        X_tr, y_tr, X_te, slices = engine.matrices[d]
+        chunk, n = [], 0
+        for group in size_groups:
+            chunk.append(group)
+            n += len(group[1])
+            if n >= CHUNK_SIZE:
+                yield delayed(run_chunk)(X_tr, y_tr, X_te, slices, d, chunk, sweep, approximate)
+                chunk, n = [], 0
+        if chunk:
+            yield delayed(run_chunk)(X_tr, y_tr, X_te, slices, d, chunk, sweep, approximate)
 
-# --- 4. EXECUTION (RESUMABLE) ---
+# --- 8. CHECKPOINT STORE ---
+class CheckpointStore:
+    """
+    Append-only SQLite checkpoint, one row per finished task:
+
+        results (task_id INTEGER PRIMARY KEY, value BLOB)  -- np.packbits(predictions)
+        meta    (name TEXT PRIMARY KEY, value TEXT)        -- total_tasks, n_predictions, y_test, test_groups,
+                                                              data_fingerprint, model_fingerprints
+
+    Resume is one scan of the integer primary key; nothing is JSON-parsed.
+    """
+
+    def __init__(self, path=CHECKPOINT_FILE, shard=None):
+        self.path = path
+        # Default rollback journal: every committed batch is in the main file,
+        # which is what the CI job uploads even when it is cut off mid-run.
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS results (task_id INTEGER PRIMARY KEY, value BLOB NOT NULL);
+            CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT);
+            """
+        )
+        total = self.get_meta("total_tasks")
+        if total is None:
+            self.set_meta("total_tasks", TOTAL_TASKS)
+        elif int(total) != TOTAL_TASKS:
+            raise ValueError(f"{path} was built for {total} tasks, expected {TOTAL_TASKS}. Delete it to start fresh.")
+        if shard is not None:
+            spec = f"{shard[0]}/{shard[1]}"
+            stored = self.get_meta("shard")
+            if stored is None:
+                self.set_meta("shard", spec)
+            elif stored != spec:
+                raise ValueError(f"{path} holds shard {stored}, not {spec}.")
+
+    def get_meta(self, name):
+        row = self.conn.execute("SELECT value FROM meta WHERE name=?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, name, value):
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)", (name, str(value)))
+
+    def fingerprints(self):
+        """(data fingerprint, {model: fingerprint}) the results were built with, or (None, None)."""
+        data, models = self.get_meta("data_fingerprint"), self.get_meta("model_fingerprints")
+        if data is None or models is None:
+            return None, None
+        return data, json.loads(models)
+
+    def sync_fingerprints(self, data_fp, model_fps):
+        """
+        Drop the results of every model built with another configuration, then
+        record the current one. A changed data fingerprint invalidates all
+        models. Stores from runs before fingerprints are assumed current.
+
+        Returns the names of the models whose results were dropped.
+        """
+        stored_data, stored_models = self.fingerprints()
+        stale = []
+        if stored_data is not None:
+            stale = [m for m in MODEL_TYPES if stored_data != data_fp or stored_models.get(m) != model_fps[m]]
+        with self.conn:
+            for name in stale:
+                self.conn.execute("DELETE FROM results WHERE task_id >= ? AND task_id < ?", model_task_range(name))
+            self.conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)", ("data_fingerprint", data_fp))
+            self.conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)", ("model_fingerprints", json.dumps(model_fps, sort_keys=True)))
+        return stale
+
+    def completed_mask(self):
+        """Boolean array over all task ids, True where a result is stored."""
+        ids = np.fromiter((row[0] for row in self.conn.execute("SELECT task_id FROM results")), dtype=np.int64)
+        mask = np.zeros(TOTAL_TASKS, dtype=bool)
+        mask[ids] = True
+        return mask
+
+    def add_many(self, rows):
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO results (task_id, value) VALUES (?, ?)", ((int(i), v) for i, v in rows))
+
+    def count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def rows(self):
+        """Yield (task_id, packed value) in task order."""
+        yield from self.conn.execute("SELECT task_id, value FROM results ORDER BY task_id")
+
+    def items(self):
+        """Yield (cache key, "0101" string) in task order."""
+        length = int(self.get_meta("n_predictions"))
+        for task_id, value in self.rows():
+            yield cache_key(*task_from_index(task_id)), "".join(unpack_predictions(value, length).astype(str))
+
+    def labels(self):
+        """Test labels the predictions are scored against (None for stores that predate them)."""
+        value = self.get_meta("y_test")
+        return None if value is None else np.frombuffer(value.encode("ascii"), dtype=np.uint8) - 48
+
+    def groups(self):
+        """{column: per-row test values} for GROUP_COLS (None for stores that predate them)."""
+        value = self.get_meta("test_groups")
+        return None if value is None else json.loads(value)
+
+    def close(self):
+        self.conn.close()
+
+def import_legacy_checkpoint(store, path=LEGACY_CHECKPOINT_FILE):
+    """One-off import of a cache_checkpoint.jsonl written by older runs."""
+    key_to_id = {cache_key(*task_from_index(i)): i for i in range(TOTAL_TASKS)}
+    rows, length = [], None
+    with open(path, "r") as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                task_id = key_to_id.get(entry["k"])
+                if task_id is None:
+                    continue
+                length = len(entry["v"])
+                rows.append((task_id, pack_predictions(np.frombuffer(entry["v"].encode("ascii"), dtype=np.uint8) - 48)))
+                if len(rows) >= 10000:
+                    store.add_many(rows)
+                    rows = []
+    store.add_many(rows)
+    if length is not None:
+        store.set_meta("n_predictions", length)
+
+def export_json_gz(store, path=FINAL_FILE):
+    """Stream the checkpoint into the {key: "0101"} JSON artifact convert_db.py reads."""
+    with gzip.open(path, "wt", encoding="UTF-8") as f:
+        f.write("{")
+        for i, (key, value) in enumerate(store.items()):
+            f.write(("," if i else "") + json.dumps(key) + ": " + json.dumps(value))
+        f.write("}")
+
+def write_labels(store, path=LABELS_FILE, private_size=PRIVATE_SIZE):
+    """Write the store's test labels, groups and split for convert_db.py; returns False if it has none."""
+    y_test = store.get_meta("y_test")
+    if y_test is None:
+        return False
+    labels = {"y_test": y_test, "private_size": private_size}
+    if store.groups() is not None:
+        labels["groups"] = store.groups()
+    data_fp, model_fps = store.fingerprints()
+    if data_fp is not None:
+        labels["data_fingerprint"], labels["model_fingerprints"] = data_fp, model_fps
+    with open(path, "w") as f:
+        json.dump(labels, f)
+    return True
+
+def merge_checkpoints(paths, db_path=DB_FILE, private_size=PRIVATE_SIZE):
+    """
+    Merge shard checkpoint stores into the deduplicated prediction_cache.sqlite.
+
+    Fails before writing anything unless the stores together hold all
+    TOTAL_TASKS results with one prediction length. When the stores recorded
+    their test labels (and groups), every unique vector is also scored (see
+    aimodelshare.moral_compass.prediction_cache.metrics). The stores must
+    share one fingerprint, which is recorded in the merged database.
+    """
+    # Imported here so compute shards only need the sklearn stack
+    from aimodelshare.moral_compass.prediction_cache import MetricScorer, PredictionCacheWriter, encode_key
+
+    stores = [CheckpointStore(path) for path in paths]
+    try:
+        lengths = {store.get_meta("n_predictions") for store in stores}
+        if len(lengths) != 1 or None in lengths:
+            raise ValueError(f"Checkpoints disagree on prediction length: {sorted(map(str, lengths))}")
+        length = int(lengths.pop())
+        labels = {(store.get_meta("y_test"), store.get_meta("test_groups")) for store in stores}
+        if len(labels) != 1:
+            raise ValueError("Checkpoints were computed against different test labels.")
+        fingerprints = {json.dumps(store.fingerprints(), sort_keys=True) for store in stores}
+        if len(fingerprints) != 1:
+            raise ValueError("Checkpoints were computed with different configurations (fingerprints differ).")
+        data_fp, model_fps = stores[0].fingerprints()
+        meta = {} if data_fp is None else {"data_fingerprint": data_fp, "model_fingerprints": json.dumps(model_fps, sort_keys=True)}
+        y_test = stores[0].labels()
+        scorer = MetricScorer(y_test, private_size, stores[0].groups()) if y_test is not None else None
+
+        covered = np.zeros(TOTAL_TASKS, dtype=bool)
+        for store in stores:
+            covered |= store.completed_mask()
+        missing = int((~covered).sum())
+        if missing:
+            raise ValueError(f"Incomplete: {TOTAL_TASKS - missing} / {TOTAL_TASKS} tasks, {missing} missing (first id {int(np.argmin(covered))}).")
+
+        writer = PredictionCacheWriter(db_path, scorer=scorer, meta=meta)
+        last_id = None
+        try:
+            # Every store is read in task order; overlapping shards keep the first copy
+            for task_id, value in heapq.merge(*(store.rows() for store in stores), key=lambda row: row[0]):
+                if task_id == last_id:
+                    continue
+                last_id = task_id
+                writer.add(encode_key(*task_from_index(task_id)), unpack_predictions(value, length))
+        except Exception:
+            writer.abort()
+            raise
+        stats = writer.finalize()
+    finally:
+        for store in stores:
+            store.close()
+
+    if stats["entries"] != TOTAL_TASKS:
+        raise ValueError(f"Merged {stats['entries']} entries, expected {TOTAL_TASKS}.")
+    return stats
+
+# --- 9. EXECUTION (RESUMABLE) ---
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute the model building game prediction cache.")
+    parser.add_argument("--jobs", type=int, default=N_JOBS, help="Worker processes (-1 = all cores)")
+    parser.add_argument("--csv", default=None, help="Local COMPAS CSV (default: $COMPAS_CSV or the ProPublica URL)")
+    parser.add_argument("--no-sweep", dest="sweep", action="store_false", help="Fit every complexity level independently")
+    parser.add_argument("--approximate-sweep", action="store_true", help="Truncate one deep tree/forest fit to every level (faster, NOT equal to independent fits)")
+    parser.add_argument("--shard", type=parse_shard, default=None, help="Compute only shard i of N (0-based), e.g. 3/8")
+    parser.add_argument("--merge", nargs="+", metavar="CHECKPOINT", help="Merge checkpoint stores into --output and exit")
+    parser.add_argument("--output", default=DB_FILE, help=f"Merged database (default: {DB_FILE})")
+    parser.add_argument("--private-size", type=float, default=PRIVATE_SIZE, help="Private fraction of the leaderboard split, for precomputed metrics")
+    parser.add_argument("--export-data", nargs="?", const=DATA_FILE, metavar="PATH", help=f"Write the prepared data artifact (default: {DATA_FILE}) and exit")
+    args = parser.parse_args()
+
+    if args.export_data:
+        export_data_artifact(args.export_data, args.csv)
+        print(f"✅ Prepared data written to {args.export_data}")
+        raise SystemExit(0)
+
+    if args.merge:
+        print(f"Merging {len(args.merge)} checkpoint(s) into {args.output}...")
+        stats = merge_checkpoints(args.merge, args.output, args.private_size)
+        print(f"✅ {args.output}: {stats['entries']} / {TOTAL_TASKS} entries, {stats['unique_vectors']} unique vectors")
+        raise SystemExit(0)
+
     start_time = time.time()
-    
-    # 1. Load Checkpoint (Completed Keys)
-    completed_keys = set()
-    if os.path.exists(CHECKPOINT_FILE):
-        print(f"Reading checkpoint {CHECKPOINT_FILE}...")
-        try:
-            with open(CHECKPOINT_FILE, "r") as f:
-                for line in f:
-                    if line.strip():
-                        # Minimal parsing to get key without loading full JSON objects
-                        data = json.loads(line)
-                        completed_keys.add(data["k"])
-        except Exception as e:
-            print(f"Warning: Checkpoint corrupt ({e}). Starting fresh.")
-            completed_keys = set()
-    
-    print(f"Resuming with {len(completed_keys)} already finished.")
-
-    # 2. Generate Tasks
-    print("Generating task list...")
-    all_combos = []
-    for r in range(1, len(ALL_FEATURES) + 1):
-        all_combos.extend(itertools.combinations(ALL_FEATURES, r))
-    
-    all_tasks = []
-    for m in MODEL_TYPES:
-        for c in range(1, 11):
-            for d in DATA_SIZE_MAP:
-                for f_combo in all_combos:
-                    # Pre-calculate key to check against checkpoint
-                    fk = ",".join(sorted(f_combo))
-                    k = f"{m}|{c}|{d}|{fk}"
-                    if k not in completed_keys:
-                        all_tasks.append((m, c, d, f_combo))
-                    
+
+    # 1. Open Checkpoint (Completed Task Ids)
+    checkpoint_file = shard_checkpoint_file(*args.shard) if args.shard else CHECKPOINT_FILE
+    new_store = not os.path.exists(checkpoint_file)
+    store = CheckpointStore(checkpoint_file, shard=args.shard)
+    if new_store and not args.shard and os.path.exists(LEGACY_CHECKPOINT_FILE):
+        print(f"Importing legacy checkpoint {LEGACY_CHECKPOINT_FILE}...")
+        import_legacy_checkpoint(store)
+
+    stale = store.sync_fingerprints(*build_fingerprints(args.sweep and args.approximate_sweep))
+    if stale:
+        print(f"♻️ Configuration changed for {', '.join(stale)}; their tasks will be recomputed.")
+
+    todo = shard_mask(*args.shard) if args.shard else np.ones(TOTAL_TASKS, dtype=bool)
+    expected = int(todo.sum())
+    completed = store.completed_mask()
+    print(f"Resuming with {int((completed & todo).sum())} already finished.")
+
+    # 2. Generate Tasks (ids not yet in the checkpoint, in enumeration order)
+    all_tasks = [task_from_index(i) for i in np.flatnonzero(todo & ~completed)]
+
     total_remaining = len(all_tasks)
     print(f"Models remaining to train: {total_remaining}")
-    
+
     # 3. Processing Loop
+    timed_out = False
     if total_remaining > 0:
-        # Open in APPEND mode ('a')
-        with open(CHECKPOINT_FILE, "a") as f_out:
-            
+        _ENGINE = PrecomputeEngine(args.csv)
+        store.set_meta("n_predictions", len(_ENGINE.y_test))
+        store.set_meta("y_test", "".join(_ENGINE.y_test.astype(np.uint8).astype(str)))
+        store.set_meta("test_groups", json.dumps({
+            col: [None if pd.isna(v) else str(v) for v in _ENGINE.X_test_raw[col]] for col in GROUP_COLS
+        }))
+
+        # One worker pool for the whole run. Arrays larger than max_nbytes are
+        # dumped once to shared memory and memmapped read-only by every worker,
+        # so each worker only holds its own model (incl. RandomForest) in RAM.
+        with Parallel(n_jobs=args.jobs, return_as="generator", max_nbytes="1M", mmap_mode="r", verbose=0) as parallel:
+
             for i in range(0, total_remaining, BATCH_SIZE):
                 # Time Check
                 elapsed = time.time() - start_time
                 if elapsed > MAX_RUNTIME_SEC:
                     print(f"⚠️ Time limit reached ({elapsed:.0f}s). Stopping gracefully to save progress.")
+                    timed_out = True
                     break
-                
+
                 batch_tasks = all_tasks[i : i + BATCH_SIZE]
                 print(f"Processing Batch {i//BATCH_SIZE + 1} ({len(batch_tasks)} tasks)...")
-                
-                # UPDATED: n_jobs=1 (Serial Mode) 
-                # This prevents memory explosion with heavy Random Forest models.
-                with Parallel(n_jobs=1, return_as="generator", verbose=0) as parallel:
-                    for result in parallel(delayed(process)(t) for t in batch_tasks):
-                        if result is None: continue
-                        
-                        key, val = result
-                        f_out.write(json.dumps({"k": key, "v": val}) + "\n")
-                
-                # Flush to disk & clean RAM
-                f_out.flush()
-                os.fsync(f_out.fileno())
+
+                # Commit each batch & clean RAM
+                store.add_many(row for results in parallel(iter_chunks(batch_tasks, _ENGINE, args.sweep, args.approximate_sweep)) for row in results)
                 gc.collect()
                 print(f"Batch saved. Time elapsed: {time.time() - start_time:.0f}s")
 
     # 4. Finalization Check
-    final_keys = set()
-    if os.path.exists(CHECKPOINT_FILE):
-        with open(CHECKPOINT_FILE, "r") as f:
-            for line in f:
-                if line.strip():
-                    final_keys.add(json.loads(line)["k"])
-    
-    # Re-calculate total possible tasks count
-    total_possible = 327520 
-    
-    print(f"Status: {len(final_keys)} / {total_possible} complete.")
-    
-    if len(final_keys) >= total_possible:
+    done = store.count()
+    print(f"Status: {done} / {expected} complete.")
+    if done < expected and not timed_out:
+        print(f"⚠️ {expected - done} task(s) failed to train; re-running retries them.")
+
+    if args.shard:
+        if done >= expected:
+            print(f"🎉 Shard {args.shard[0]}/{args.shard[1]} complete: {checkpoint_file}. Combine shards with --merge.")
+        else:
+            print("⏳ Shard incomplete. Please re-run it to continue.")
+    elif done >= TOTAL_TASKS:
         print("🎉 ALL TASKS COMPLETE. Building final cache file...")
-        
-        # Convert JSONL -> Standard compressed JSON dictionary
-        final_cache = {}
-        with open(CHECKPOINT_FILE, "r") as f:
-            for line in f:
-                if line.strip():
-                    entry = json.loads(line)
-                    final_cache[entry["k"]] = entry["v"]
-        
-        with gzip.open(FINAL_FILE, "wt", encoding="UTF-8") as f:
-            json.dump(final_cache, f)
-            
+        export_json_gz(store, FINAL_FILE)
         print(f"✅ Final Artifact Created: {FINAL_FILE}")
+        if write_labels(store, LABELS_FILE, args.private_size):
+            print(f"✅ Test labels written to {LABELS_FILE}")
+        else:
+            print(f"⚠️ Checkpoint has no test labels; {LABELS_FILE} not written (metrics will not be precomputed).")
+        export_data_artifact(DATA_FILE, args.csv)
+        print(f"✅ Prepared data written to {DATA_FILE}")
     else:
-        print("⏳ Time limit reached. Please re-run this job to continue.")
+        print("⏳ Cache incomplete. Please re-run this job to continue.")
+    store.close()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the streaming prediction cache converter (convert_db.py).
+
+Run with: pytest tests/test_convert_db.py -v
+"""
+
+import gzip
+import io
+import json
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import convert_db  # noqa: E402
+from aimodelshare.moral_compass.prediction_cache import PredictionCacheReader, legacy_key_to_int  # noqa: E402
+
+
+SAMPLE = {
+    "The Rule-Maker|1|Small (20%)|age": "0101",
+    "The Rule-Maker|2|Small (20%)|age": "0101",
+    "The Deep Pattern-Finder|10|Full (100%)|age,c_charge_desc,race": "1110",
+    "The 'Nearest Neighbor'|3|Medium (60%)|sex": "0001",
+}
+
+PARSER_SAMPLE = dict(SAMPLE, **{'Weird "key", with: punctuation {}': "1110", "unicode é key": "0001"})
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, 1 << 20])
+def test_iter_json_object_items_matches_json_load(chunk_size):
+    text = json.dumps(PARSER_SAMPLE, indent=1)
+    items = list(convert_db.iter_json_object_items(io.StringIO(text), chunk_size=chunk_size))
+    assert items == list(PARSER_SAMPLE.items())
+
+
+def test_iter_json_object_items_empty_and_malformed():
+    assert list(convert_db.iter_json_object_items(io.StringIO(" { } "))) == []
+    with pytest.raises(ValueError):
+        list(convert_db.iter_json_object_items(io.StringIO('{"a": "1" "b": "0"}')))
+
+
+def test_convert_json_gz(tmp_path):
+    source = tmp_path / "prediction_cache.json.gz"
+    with gzip.open(source, "wt", encoding="UTF-8") as f:
+        json.dump(SAMPLE, f)
+    db_path = str(tmp_path / "prediction_cache.sqlite")
+
+    stats = convert_db.convert(str(source), db_path, batch_size=2)
+    assert stats["entries"] == 4
+    assert stats["unique_vectors"] == 3
+
+    reader = PredictionCacheReader(db_path)
+    for key, value in SAMPLE.items():
+        np.testing.assert_array_equal(reader.get(key), [int(c) for c in value])
+        np.testing.assert_array_equal(reader.get(legacy_key_to_int(key)), [int(c) for c in value])
+    reader.close()
+
+
+def test_convert_precomputes_metrics_from_labels_file(tmp_path):
+    source = tmp_path / "prediction_cache.json.gz"
+    with gzip.open(source, "wt", encoding="UTF-8") as f:
+        json.dump(SAMPLE, f)
+    labels = tmp_path / "prediction_cache_labels.json"
+    labels.write_text(json.dumps({"y_test": "0101", "private_size": 0.0}))
+    db_path = str(tmp_path / "prediction_cache.sqlite")
+
+    convert_db.convert(str(source), db_path, labels_path=str(labels))
+    reader = PredictionCacheReader(db_path)
+    assert reader.get_metrics("The Rule-Maker|1|Small (20%)|age").accuracy == 1.0
+    assert reader.get_metrics("The 'Nearest Neighbor'|3|Medium (60%)|sex").accuracy == 0.75
+    reader.close()
+
+
+def test_convert_records_fingerprints_from_labels_file(tmp_path):
+    source = tmp_path / "prediction_cache.json.gz"
+    with gzip.open(source, "wt", encoding="UTF-8") as f:
+        json.dump(SAMPLE, f)
+    labels = tmp_path / "prediction_cache_labels.json"
+    models = {"The Rule-Maker": "a", "The 'Nearest Neighbor'": "b"}
+    labels.write_text(json.dumps({"y_test": "0101", "data_fingerprint": "d", "model_fingerprints": models}))
+    db_path = str(tmp_path / "prediction_cache.sqlite")
+
+    convert_db.convert(str(source), db_path, labels_path=str(labels))
+    reader = PredictionCacheReader(db_path)
+    reader.expect_fingerprints({**models, "The Rule-Maker": "changed"})
+    assert reader.get("The Rule-Maker|1|Small (20%)|age") is None
+    assert reader.get("The 'Nearest Neighbor'|3|Medium (60%)|sex") is not None
+    reader.close()
+
+
+def test_convert_skips_keys_without_integer_encoding(tmp_path):
+    source = tmp_path / "prediction_cache.json.gz"
+    with gzip.open(source, "wt", encoding="UTF-8") as f:
+        json.dump(PARSER_SAMPLE, f)
+    db_path = str(tmp_path / "prediction_cache.sqlite")
+
+    stats = convert_db.convert(str(source), db_path)
+    assert stats["entries"] == len(SAMPLE)
+    assert stats["skipped_keys"] == 2
+
+
+def test_convert_checkpoint_jsonl(tmp_path):
+    source = tmp_path / "cache_checkpoint.jsonl"
+    with open(source, "w") as f:
+        for k, v in SAMPLE.items():
+            f.write(json.dumps({"k": k, "v": v}) + "\n")
+    db_path = str(tmp_path / "out.sqlite")
+
+    stats = convert_db.convert(str(source), db_path)
+    assert stats["entries"] == len(SAMPLE)
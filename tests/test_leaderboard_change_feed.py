@@ -0,0 +1,414 @@
+#!/usr/bin/env python3
+"""
+Unit tests for versioned leaderboard refreshes.
+
+Tests:
+- get_leaderboard_if_changed() client (versioned, not-modified and legacy responses)
+- Scoped get_leaderboard(username=..., top_k=...) queries (scoped and legacy responses)
+- Columnar wire format (format="columnar")
+- Local merge of a submission into the cached leaderboard in model_building_game
+- Conditional fetch / legacy polling fallback after a submission
+- Single-flight and stale-while-revalidate leaderboard refreshes
+- Background leaderboard prefetcher (adaptive interval, freshness metrics)
+
+Run with: pytest tests/test_leaderboard_change_feed.py -v
+"""
+
+import base64
+import gzip
+import json
+import threading
+import time
+from unittest.mock import Mock, patch
+
+import pandas as pd
+import pytest
+
+
+def _post_returning(body):
+    response = Mock()
+    response.text = json.dumps(body)
+    return Mock(return_value=response)
+
+
+TABLE = {"username": {"0": "a", "1": "b"}, "accuracy": {"0": 0.7, "1": 0.6}, "version": {"0": 1, "1": 2}}
+
+
+def test_get_leaderboard_if_changed_returns_table_and_version():
+    from aimodelshare.leaderboard import get_leaderboard_if_changed
+
+    post = _post_returning({"envelope": 1, "leaderboard_version": 2, "leaderboard": TABLE})
+    with patch("aimodelshare.leaderboard.requests.post", post):
+        df, version = get_leaderboard_if_changed("https://x/m", known_version=None, token="t")
+    assert version == 2
+    assert list(df["username"]) == ["a", "b"]
+    assert json.loads(post.call_args.kwargs["data"])["known_version"] == -1
+
+
+def test_get_leaderboard_if_changed_not_modified():
+    from aimodelshare.leaderboard import get_leaderboard_if_changed
+
+    post = _post_returning({"envelope": 1, "leaderboard_version": 2, "not_modified": True})
+    with patch("aimodelshare.leaderboard.requests.post", post):
+        df, version = get_leaderboard_if_changed("https://x/m", known_version=2, token="t")
+    assert df is None and version == 2
+    assert json.loads(post.call_args.kwargs["data"])["known_version"] == 2
+
+
+def test_get_leaderboard_if_changed_legacy_lambda():
+    from aimodelshare.leaderboard import get_leaderboard_if_changed
+
+    with patch("aimodelshare.leaderboard.requests.post", _post_returning(TABLE)):
+        df, version = get_leaderboard_if_changed("https://x/m", known_version=2, token="t")
+    assert version is None
+    assert len(df) == 2
+
+
+def test_tables_with_envelope_like_column_names_are_not_unwrapped():
+    from aimodelshare.leaderboard import get_leaderboard, get_leaderboard_if_changed
+
+    table = dict(TABLE, user_rank={"0": 1, "1": 2}, leaderboard_version={"0": 7, "1": 7}, format={"0": "x", "1": "y"})
+    with patch("aimodelshare.leaderboard.requests.post", _post_returning(table)):
+        df, version = get_leaderboard_if_changed("https://x/m", known_version=2, token="t")
+        scoped = get_leaderboard("https://x/m", token="t", username="b")
+    assert version is None and list(df["username"]) == ["a", "b"]
+    assert list(scoped["username"]) == ["b"] and scoped.attrs == {"user_rank": 2, "users": 2}
+
+
+RANKED = {
+    "username": {"0": "a", "1": "b", "2": "a", "3": "c", "4": "b"},
+    "accuracy": {"0": 0.9, "1": 0.8, "2": 0.7, "3": 0.6, "4": 0.5},
+    "version": {"0": 5, "1": 4, "2": 1, "3": 3, "4": 2},
+}
+
+
+def test_scoped_get_leaderboard_sends_query_and_reads_rank():
+    from aimodelshare.leaderboard import get_leaderboard
+
+    scoped = {"0": 0.9, "3": 0.6}
+    post = _post_returning({"envelope": 1, "user_rank": 3, "users": 3, "leaderboard": {
+        "username": {"0": "a", "3": "c"}, "accuracy": scoped, "version": {"0": 5, "3": 3}}})
+    with patch("aimodelshare.leaderboard.requests.post", post):
+        df = get_leaderboard("https://x/m", token="t", username="c", top_k=1)
+    sent = json.loads(post.call_args.kwargs["data"])
+    assert (sent["username"], sent["top_k"]) == ("c", 1)
+    assert list(df["username"]) == ["a", "c"]
+    assert df.attrs == {"user_rank": 3, "users": 3}
+
+
+def test_scoped_get_leaderboard_against_legacy_lambda():
+    from aimodelshare.leaderboard import get_leaderboard
+
+    with patch("aimodelshare.leaderboard.requests.post", _post_returning(RANKED)):
+        df = get_leaderboard("https://x/m", token="t", username="b")
+        top = get_leaderboard("https://x/m", token="t", top_k=2)
+    assert list(df["version"]) == [4, 2]
+    assert df.attrs == {"user_rank": 2, "users": 3}
+    assert list(top["username"]) == ["a", "b"]
+    assert top.attrs == {"user_rank": 0, "users": 3}
+
+
+def test_unscoped_get_leaderboard_is_unchanged():
+    from aimodelshare.leaderboard import get_leaderboard
+
+    post = _post_returning(RANKED)
+    with patch("aimodelshare.leaderboard.requests.post", post):
+        df = get_leaderboard("https://x/m", token="t")
+    assert len(df) == 5 and not df.attrs
+    assert "username" not in json.loads(post.call_args.kwargs["data"])
+
+
+def _columnar(df):
+    """Columnar payload as built by encode_leaderboard() in the eval Lambda template."""
+    data = {}
+    for name in df.columns:
+        if pd.api.types.is_numeric_dtype(df[name]):
+            data[name] = {"dtype": str(df[name].dtype), "values": df[name].tolist()}
+        else:
+            codes, categories = pd.factorize(df[name])
+            data[name] = {"categories": [str(c) for c in categories], "codes": codes.tolist()}
+    table = {"index": df.index.tolist(), "columns": list(df.columns), "data": data}
+    return base64.b64encode(gzip.compress(json.dumps(table).encode("utf-8"))).decode("ascii")
+
+
+def test_columnar_leaderboard_round_trips_types():
+    from aimodelshare.leaderboard import get_leaderboard
+
+    table = pd.DataFrame({
+        "accuracy": [0.9, float("nan"), 0.7],
+        "version": [3, 1, 2],
+        "username": ["a", None, "a"],
+        "Team": ["The Ethical Explorers"] * 3,
+    }, index=[4, 0, 2])
+    post = _post_returning({"envelope": 1, "format": "columnar", "leaderboard": _columnar(table)})
+    with patch("aimodelshare.leaderboard.requests.post", post):
+        df = get_leaderboard("https://x/m", token="t", format="columnar")
+    assert json.loads(post.call_args.kwargs["data"])["format"] == "columnar"
+    pd.testing.assert_frame_equal(df, table.astype({"username": object, "Team": object}))
+
+
+def test_columnar_versioned_and_scoped_responses():
+    from aimodelshare.leaderboard import get_leaderboard, get_leaderboard_if_changed
+
+    table = pd.DataFrame(TABLE).reset_index(drop=True)
+    body = {"envelope": 1, "format": "columnar", "leaderboard_version": 2, "leaderboard": _columnar(table)}
+    with patch("aimodelshare.leaderboard.requests.post", _post_returning(body)):
+        df, version = get_leaderboard_if_changed("https://x/m", token="t", format="columnar")
+    assert version == 2 and list(df["username"]) == ["a", "b"]
+
+    body = {"envelope": 1, "format": "columnar", "user_rank": 2, "users": 2, "leaderboard": _columnar(table.iloc[1:])}
+    with patch("aimodelshare.leaderboard.requests.post", _post_returning(body)):
+        df = get_leaderboard("https://x/m", token="t", username="b", format="columnar")
+    assert list(df["username"]) == ["b"] and df.attrs["user_rank"] == 2
+
+
+def test_columnar_request_against_legacy_lambda_and_bad_format():
+    from aimodelshare.leaderboard import get_leaderboard
+
+    with patch("aimodelshare.leaderboard.requests.post", _post_returning(TABLE)):
+        df = get_leaderboard("https://x/m", token="t", format="columnar")
+    assert len(df) == 2
+    with pytest.raises(ValueError):
+        get_leaderboard("https://x/m", token="t", format="arrow")
+
+
+@pytest.fixture
+def game(monkeypatch):
+    import aimodelshare.moral_compass.apps.model_building_game as game
+
+    for entry in game._leaderboard_cache.values():
+        monkeypatch.setitem(entry, "data", None)
+        monkeypatch.setitem(entry, "timestamp", 0.0)
+        monkeypatch.setitem(entry, "version", None)
+        monkeypatch.setitem(entry, "index", None)
+    monkeypatch.setattr(game, "LEADERBOARD_POLL_SLEEP", 0)
+    prefetch = {key: 0 for key in game._leaderboard_prefetch}
+    prefetch.update(thread=None, interval=game.LEADERBOARD_PREFETCH_MIN_SECONDS, last_submission=0.0)
+    monkeypatch.setattr(game, "_leaderboard_prefetch", prefetch)
+    return game
+
+
+def _fake_competition(monkeypatch, game, responses):
+    calls = []
+
+    class FakeCompetition:
+        def __init__(self, url):
+            pass
+
+        def get_leaderboard_if_changed(self, known_version=None, token=None, format="json"):
+            calls.append(known_version)
+            return responses[min(len(calls), len(responses)) - 1]
+
+    monkeypatch.setattr(game, "Competition", FakeCompetition)
+    return calls
+
+
+def _row(version, username="me"):
+    return {"username": username, "accuracy": 0.8, "Team": "T", "timestamp": pd.Timestamp.now(), "version": version}
+
+
+def test_fetch_leaderboard_refresh_is_conditional(game, monkeypatch):
+    calls = _fake_competition(monkeypatch, game, [(pd.DataFrame(TABLE), 2), (None, 2)])
+    first = game._fetch_leaderboard("t", max_age=0)
+    assert game._fetch_leaderboard("t", max_age=0) is first
+    assert calls == [None, 2]
+    assert game._leaderboard_cache["auth"]["version"] == 2
+
+
+def test_submission_directly_after_cached_version_needs_no_fetch(game, monkeypatch):
+    calls = _fake_competition(monkeypatch, game, [(pd.DataFrame(TABLE), 2)])
+    game._fetch_leaderboard("t")
+
+    df, fetches, confirmed = game._leaderboard_after_submission("t", _row(3))
+    assert (fetches, confirmed) == (0, True)
+    assert list(df["version"]) == [1, 2, 3]
+    assert calls == [None]
+    # Every session now reads the merged copy
+    assert game._fetch_leaderboard("t") is df
+    assert game._leaderboard_cache["auth"]["version"] == 3
+
+
+def test_submission_behind_cached_version_fetches_once(game, monkeypatch):
+    table = pd.DataFrame(TABLE)
+    newer = pd.concat([table, pd.DataFrame([_row(3, "other"), _row(4)])], ignore_index=True)
+    calls = _fake_competition(monkeypatch, game, [(table, 2), (newer, 4)])
+    game._fetch_leaderboard("t")
+
+    df, fetches, confirmed = game._leaderboard_after_submission("t", _row(4))
+    assert (fetches, confirmed) == (1, True)
+    assert list(df["version"]) == [1, 2, 3, 4]
+    assert calls == [None, 2]
+
+
+def test_unversioned_api_polls_until_row_appears(game, monkeypatch):
+    table = pd.DataFrame(TABLE)
+    with_row = pd.concat([table, pd.DataFrame([_row(3)])], ignore_index=True)
+    _fake_competition(monkeypatch, game, [(table, None), (table, None), (with_row, None)])
+    game._fetch_leaderboard("t")
+
+    df, fetches, confirmed = game._leaderboard_after_submission("t", _row(3))
+    assert (fetches, confirmed) == (2, True)
+    assert list(df["version"]) == [1, 2, 3]
+
+
+def test_submission_without_version_polls_until_the_users_rows_change(game, monkeypatch):
+    table = pd.DataFrame(TABLE)
+    server_row = dict(_row(3), timestamp=pd.Timestamp.now() - pd.Timedelta(seconds=1))
+    with_row = pd.concat([table, pd.DataFrame([server_row])], ignore_index=True)
+    calls = _fake_competition(monkeypatch, game, [(table, 2), (None, 2), (with_row, 3)])
+    game._fetch_leaderboard("t")
+
+    df, fetches, confirmed = game._leaderboard_after_submission("t", _row(None))
+    assert (fetches, confirmed) == (2, True)
+    assert calls == [None, 2, 2]
+    # The server's row is used, the estimated one is never merged
+    assert list(df["version"]) == [1, 2, 3]
+    assert game._leaderboard_cache["auth"]["version"] == 3
+
+
+def test_submission_without_version_falls_back_to_one_optimistic_row(game, monkeypatch):
+    monkeypatch.setattr(game, "LEADERBOARD_POLL_TRIES", 3)
+    _fake_competition(monkeypatch, game, [(pd.DataFrame(TABLE), 2), (None, 2)])
+    game._fetch_leaderboard("t")
+
+    row = _row(None)
+    df, fetches, confirmed = game._leaderboard_after_submission("t", row)
+    assert (fetches, confirmed) == (3, False)
+    assert len(df) == 3 and df["version"].isna().sum() == 1
+    assert game._merge_leaderboard_row(df, row) is df
+
+
+def test_merge_leaderboard_row_skips_known_version(game):
+    table = pd.DataFrame(TABLE)
+    assert game._merge_leaderboard_row(table, _row(2)) is table
+    assert len(game._merge_leaderboard_row(table, _row(None))) == 3
+    assert len(game._merge_leaderboard_row(None, _row(None))) == 1
+
+
+def _slow_competition(monkeypatch, game, result, release):
+    calls = []
+
+    class SlowCompetition:
+        def __init__(self, url):
+            pass
+
+        def get_leaderboard_if_changed(self, known_version=None, token=None, format="json"):
+            calls.append(known_version)
+            release.wait(5)
+            return result
+
+    monkeypatch.setattr(game, "Competition", SlowCompetition)
+    return calls
+
+
+def test_concurrent_fetches_share_one_request(game, monkeypatch):
+    release = threading.Event()
+    calls = _slow_competition(monkeypatch, game, (pd.DataFrame(TABLE), 2), release)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(game._fetch_leaderboard("t"))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.2)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert calls == [None]
+    assert len(results) == 8
+    assert all(df is results[0] for df in results)
+
+
+def test_expired_copy_is_served_while_refreshing(game, monkeypatch):
+    release = threading.Event()
+    newer = pd.concat([pd.DataFrame(TABLE), pd.DataFrame([_row(3)])], ignore_index=True)
+    calls = _slow_competition(monkeypatch, game, (newer, 3), release)
+    stale = pd.DataFrame(TABLE)
+    expired = time.time() - game.LEADERBOARD_CACHE_SECONDS - 1
+    monkeypatch.setitem(game._leaderboard_cache, "auth", {"data": stale, "timestamp": expired, "version": 2, "index": None})
+
+    assert game._fetch_leaderboard("t") is stale
+    assert game._fetch_leaderboard("t") is stale
+    release.set()
+    deadline = time.time() + 5
+    while game._leaderboard_cache["auth"]["version"] != 3 and time.time() < deadline:
+        time.sleep(0.01)
+
+    assert calls == [2]
+    assert game._fetch_leaderboard("t") is game._leaderboard_cache["auth"]["data"]
+    assert len(game._fetch_leaderboard("t")) == 3
+
+
+def test_failed_refresh_keeps_previous_copy(game, monkeypatch):
+    class FailingCompetition:
+        def __init__(self, url):
+            pass
+
+        def get_leaderboard_if_changed(self, known_version=None, token=None, format="json"):
+            raise RuntimeError("eval API down")
+
+    monkeypatch.setattr(game, "Competition", FailingCompetition)
+    monkeypatch.setattr(game, "_retry_with_backoff", lambda fn, description="": fn())
+    stale = pd.DataFrame(TABLE)
+    monkeypatch.setitem(game._leaderboard_cache, "auth", {"data": stale, "timestamp": 0.0, "version": 2, "index": None})
+
+    assert game._fetch_leaderboard("t", max_age=0) is None
+    assert game._leaderboard_cache["auth"]["data"] is stale
+    assert not game._leaderboard_refreshes
+
+
+def test_prefetch_interval_adapts_to_activity(game, monkeypatch):
+    monkeypatch.setattr(game, "LEADERBOARD_PREFETCH_MIN_SECONDS", 10)
+    monkeypatch.setattr(game, "LEADERBOARD_PREFETCH_MAX_SECONDS", 120)
+    intervals = [10]
+    for _ in range(5):
+        intervals.append(game._next_prefetch_interval(intervals[-1], active=False))
+    assert intervals == [10, 20, 40, 80, 120, 120]
+    assert game._next_prefetch_interval(120, active=True) == 10
+
+
+def test_prefetch_round_refreshes_anon_scope_and_backs_off(game, monkeypatch):
+    monkeypatch.setattr(game, "LEADERBOARD_PREFETCH_MIN_SECONDS", 10)
+    monkeypatch.setattr(game, "LEADERBOARD_PREFETCH_MAX_SECONDS", 120)
+    newer = pd.concat([pd.DataFrame(TABLE), pd.DataFrame([_row(3)])], ignore_index=True)
+    calls = _fake_competition(monkeypatch, game, [(pd.DataFrame(TABLE), 2), (None, 2), (pd.DataFrame(TABLE), 2), (newer, 3)])
+
+    # First round: anon scope downloaded (changed)
+    assert game._leaderboard_prefetch_round(40) == 10
+    assert calls == [None]
+    # Nothing new: back off
+    assert game._leaderboard_prefetch_round(10) == 20
+    # A user request fills the auth scope with the user's token, but the
+    # prefetcher never reuses that token; a new version keeps it fast
+    game._fetch_leaderboard("user-token")
+    assert game._leaderboard_prefetch_round(20) == 10
+    assert calls == [None, 2, None, 2]
+    assert game._leaderboard_cache["anon"]["version"] == 3
+    assert game._leaderboard_cache["auth"]["version"] == 2
+    assert "user-token" not in repr(game._leaderboard_prefetch)
+
+    stats = game.leaderboard_freshness()
+    assert (stats["rounds"], stats["refreshes"], stats["changes"], stats["failures"]) == (3, 3, 2, 0)
+    assert stats["anon_version"] == 3 and stats["auth_version"] == 2
+
+
+def test_prefetch_round_counts_local_submissions_as_activity(game, monkeypatch):
+    _fake_competition(monkeypatch, game, [(pd.DataFrame(TABLE), 2), (None, 2)])
+    game._leaderboard_prefetch_round(10)
+    game._record_submission(None, _row(3))
+    assert game._leaderboard_prefetch_round(80) == game.LEADERBOARD_PREFETCH_MIN_SECONDS
+
+
+def test_fetch_counts_freshness_and_prefetcher_can_be_disabled(game, monkeypatch):
+    _fake_competition(monkeypatch, game, [(pd.DataFrame(TABLE), 2)])
+    game._fetch_leaderboard("t")
+    game._fetch_leaderboard("t")
+    stats = game.leaderboard_freshness()
+    assert (stats["served_after_wait"], stats["served_fresh"]) == (1, 1)
+
+    monkeypatch.setattr(game, "LEADERBOARD_PREFETCH", False)
+    assert game.start_leaderboard_prefetcher() is False
+    assert game._leaderboard_prefetch["thread"] is None
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the incremental leaderboard index used by model_building_game.
+
+Tests:
+- Aggregates, ranks and summary tables match the pandas groupby computations
+- Incremental add_rows() / refreshed() give the same results as a full build
+- The game keeps the cached leaderboard's index in sync with merged submissions
+
+Run with: pytest tests/test_leaderboard_index.py -v
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from aimodelshare.moral_compass.apps.leaderboard_index import LeaderboardIndex
+
+
+def _leaderboard(n=200, seed=0):
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp("2025-01-01")
+    return pd.DataFrame({
+        "username": rng.choice([f"user{i}" for i in range(30)], n),
+        "Team": rng.choice(["The Ethical Explorers", "The Data Detectives", "The Model Makers"], n),
+        "accuracy": rng.random(n).round(6),
+        "timestamp": [str(start + pd.Timedelta(minutes=int(m))) for m in rng.permutation(n)],
+        "version": np.arange(1, n + 1),
+    })
+
+
+def _assert_matches_pandas(index, df):
+    user_bests = df.groupby("username")["accuracy"].max()
+    user_counts = df.groupby("username")["accuracy"].count()
+    expected = pd.DataFrame(
+        {"Engineer": user_bests.index, "Best_Score": user_bests.values, "Submissions": user_counts.values}
+    ).sort_values(["Best_Score", "Engineer"], ascending=[False, True]).reset_index(drop=True)
+    expected.index = expected.index + 1
+    pd.testing.assert_frame_equal(index.individual_summary(), expected)
+
+    expected_teams = (
+        df.groupby("Team")["accuracy"]
+        .agg(Best_Score="max", Avg_Score="mean", Submissions="count")
+        .reset_index()
+        .sort_values("Best_Score", ascending=False)
+        .reset_index(drop=True)
+    )
+    expected_teams.index = expected_teams.index + 1
+    pd.testing.assert_frame_equal(index.team_summary(), expected_teams)
+
+    parsed = df.assign(ts=pd.to_datetime(df["timestamp"]))
+    for username, rows in parsed.groupby("username"):
+        latest = rows.sort_values("ts").iloc[-1]
+        stats = index.user_stats(username)
+        assert stats["last_score"] == latest["accuracy"]
+        assert stats["team"] == latest["Team"]
+        assert stats["submission_count"] == len(rows)
+        assert stats["rank"] == expected.index[expected["Engineer"] == username][0]
+
+
+def test_index_matches_pandas_aggregates():
+    df = _leaderboard()
+    _assert_matches_pandas(LeaderboardIndex.from_frame(df), df)
+
+
+def test_incremental_rows_match_full_build():
+    df = _leaderboard()
+    index = LeaderboardIndex.from_frame(df.iloc[:50])
+    for start in range(50, len(df), 7):
+        index.add_rows(df.iloc[start:start + 7])
+    _assert_matches_pandas(index, df)
+
+
+def test_refreshed_adds_only_new_versions():
+    df = _leaderboard()
+    index = LeaderboardIndex.from_frame(df.iloc[:120])
+    # Servers may return rows in any order
+    refreshed = index.refreshed(df.sample(frac=1.0, random_state=1))
+    assert refreshed is index
+    _assert_matches_pandas(index, df)
+
+
+def test_refreshed_rebuilds_when_rows_are_missing():
+    df = _leaderboard()
+    index = LeaderboardIndex.from_frame(df)
+    index.add_rows(pd.DataFrame([{"username": "me", "accuracy": 0.99, "Team": "T", "version": "latest"}]))
+    refreshed = index.refreshed(df)
+    assert refreshed is not index
+    assert refreshed.user_stats("me") is None
+    _assert_matches_pandas(refreshed, df)
+
+
+def test_latest_falls_back_to_leaderboard_order_without_timestamps():
+    df = pd.DataFrame({
+        "username": ["a", "a", "a"],
+        "accuracy": [0.5, 0.9, 0.6],
+        "timestamp": ["bad", None, "also bad"],
+    })
+    stats = LeaderboardIndex.from_frame(df).user_stats("a")
+    assert (stats["best_score"], stats["last_score"], stats["rank"]) == (0.9, 0.6, 1)
+
+
+def test_unknown_user_is_unranked():
+    index = LeaderboardIndex.from_frame(_leaderboard())
+    assert index.user_stats("nobody") is None
+    assert index.user_rank("nobody") == 0
+    assert index.user_team("nobody") is None
+
+
+def test_game_updates_cached_index_with_merged_submission(monkeypatch):
+    import aimodelshare.moral_compass.apps.model_building_game as game
+
+    df = _leaderboard(n=20)
+    monkeypatch.setitem(game._leaderboard_cache, "auth", {"data": df, "timestamp": 0.0, "version": 20, "index": None})
+
+    index = game._leaderboard_index(df)
+    assert game._leaderboard_index(df) is index
+    row = {"username": "newcomer", "accuracy": 1.0, "Team": "The Model Makers",
+           "timestamp": pd.Timestamp("2030-01-01"), "version": 21}
+    merged, current = game._record_submission("token", row)
+
+    assert current
+    assert game._leaderboard_index(merged) is index
+    assert index.user_stats("newcomer")["rank"] == 1
+    _, _, _, best, rank, this_score = game.generate_competitive_summary(
+        merged, "The Model Makers", "newcomer", 0.0, 0, 1
+    )
+    assert (best, rank, this_score) == (1.0, 1, 1.0)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
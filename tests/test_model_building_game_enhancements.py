@@ -200,6 +200,22 @@ def test_safe_int_function():
     assert safe_int("invalid", 2) == 2
 
 
+def test_complexity_sweep_is_clipped_to_the_slider_cap(monkeypatch):
+    """Test that the sweep chart only shows the levels the rank unlocks."""
+    import aimodelshare.moral_compass.apps.model_building_game as game
+
+    monkeypatch.setattr(game, "Y_TEST", [0, 1])
+    monkeypatch.setattr(game, "complexity_sweep", lambda *args, **kwargs: {level: 0.5 + level / 100 for level in range(1, 11)})
+
+    trainee = game.render_complexity_sweep(game.DEFAULT_MODEL, 2, ["age"], game.DEFAULT_DATA_SIZE, 0)
+    assert "Complexity 3:" in trainee and "Complexity 4:" not in trainee
+    # A submission raises the cap (slider max) and the chart follows it
+    junior = game.render_complexity_sweep(game.DEFAULT_MODEL, 2, ["age"], game.DEFAULT_DATA_SIZE, 1)
+    assert "Complexity 6:" in junior and "Complexity 7:" not in junior
+    lead = game.render_complexity_sweep(game.DEFAULT_MODEL, 2, ["age"], game.DEFAULT_DATA_SIZE, 3)
+    assert "Complexity 10:" in lead
+
+
 def test_data_size_map():
     """Test DATA_SIZE_MAP has correct values."""
     from aimodelshare.moral_compass.apps.model_building_game import DATA_SIZE_MAP
@@ -0,0 +1,392 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the prediction cache precompute engine (precompute_cache.py).
+
+Run with: pytest tests/test_precompute_cache.py -v
+"""
+
+import gzip
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.compose import ColumnTransformer
+from sklearn.impute import SimpleImputer
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder, StandardScaler
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import precompute_cache  # noqa: E402
+
+
+def _frame(n, seed):
+    rng = np.random.RandomState(seed)
+    df = pd.DataFrame({col: rng.poisson(3, n).astype(float) for col in precompute_cache.ALL_NUMERIC_COLS})
+    df["race"] = rng.choice(["African-American", "Caucasian", "Hispanic"], n)
+    df["sex"] = rng.choice(["Male", "Female"], n)
+    df["c_charge_degree"] = rng.choice(["F", "M"], n)
+    df["c_charge_desc"] = rng.choice(["Battery", "Theft", None], n)
+    df.loc[rng.rand(n) < 0.1, "age"] = np.nan
+    return df[precompute_cache.ALL_FEATURES]
+
+
+def _column_transformer(features):
+    # The per-task preprocessor the engine replaces
+    num = [f for f in features if f in precompute_cache.ALL_NUMERIC_COLS]
+    cat = [f for f in features if f in precompute_cache.ALL_CATEGORICAL_COLS]
+    steps = []
+    if num:
+        steps.append(("num", Pipeline([("imputer", SimpleImputer(strategy="median")), ("scaler", StandardScaler())]), num))
+    if cat:
+        steps.append(("cat", Pipeline([("imputer", SimpleImputer(strategy="constant", fill_value="missing")), ("onehot", OneHotEncoder(handle_unknown="ignore", sparse_output=False))]), cat))
+    return ColumnTransformer(steps, remainder="drop")
+
+
+@pytest.mark.parametrize(
+    "features",
+    [("age",), ("age", "race"), ("juv_fel_count", "priors_count", "sex", "c_charge_desc"), tuple(precompute_cache.ALL_FEATURES)],
+)
+def test_sliced_matrix_matches_column_transformer(features):
+    X_train, X_test = _frame(200, 0), _frame(50, 1)
+    train, test, slices = precompute_cache.build_feature_matrices(X_train, X_test)
+    cols = precompute_cache.feature_columns(features, slices)
+
+    ct = _column_transformer(features)
+    np.testing.assert_allclose(train[:, cols], ct.fit_transform(X_train))
+    np.testing.assert_allclose(test[:, cols], ct.transform(X_test))
+
+
+def test_run_chunk_returns_task_ids_and_packed_predictions():
+    X_train, X_test = _frame(200, 0), _frame(50, 1)
+    y_train = (X_train["priors_count"] > 3).astype(int).to_numpy()
+    train, test, slices = precompute_cache.build_feature_matrices(X_train, X_test)
+
+    groups = [(m, (10,), ("age", "race")) for m in precompute_cache.MODEL_TYPES]
+    results = precompute_cache.run_chunk(train, y_train, test, slices, "Small (20%)", groups)
+
+    assert [precompute_cache.task_from_index(i) for i, _ in results] == [
+        (m, 10, "Small (20%)", ("age", "race")) for m in precompute_cache.MODEL_TYPES
+    ]
+    for _, value in results:
+        preds = precompute_cache.unpack_predictions(value, 50)
+        assert len(preds) == 50 and set(preds) <= {0, 1}
+
+
+def _fitted_inputs(features=("age", "priors_count", "race", "sex")):
+    X_train, X_test = _frame(300, 0), _frame(60, 1)
+    y_train = ((X_train["priors_count"] > 3) ^ (np.random.RandomState(2).rand(300) < 0.2)).astype(int).to_numpy()
+    train, test, slices = precompute_cache.build_feature_matrices(X_train, X_test)
+    cols = precompute_cache.feature_columns(features, slices)
+    return train[:, cols], y_train, test[:, cols]
+
+
+@pytest.mark.parametrize("features", [("sex", "race"), ("age", "priors_count", "race", "sex"), tuple(precompute_cache.ALL_FEATURES)])
+@pytest.mark.parametrize("model_name", list(precompute_cache.MODEL_TYPES))
+def test_sweep_matches_independent_fits_at_every_level(model_name, features):
+    # ("sex", "race") has many duplicate rows / KNN distance ties
+    X_tr, y_tr, X_te = _fitted_inputs(features)
+    swept = precompute_cache.sweep_predict(model_name, range(1, 11), X_tr, y_tr, X_te)
+    assert sorted(swept) == list(range(1, 11))
+    for level in range(1, 11):
+        np.testing.assert_array_equal(swept[level], precompute_cache.fit_predict(model_name, level, X_tr, y_tr, X_te))
+
+
+def test_forest_sweep_grows_levels_of_equal_depth_once(monkeypatch):
+    from sklearn.ensemble import _forest
+
+    built = []
+    build = _forest._parallel_build_trees
+    monkeypatch.setattr(_forest, "_parallel_build_trees", lambda tree, *a, **kw: built.append(tree) or build(tree, *a, **kw))
+    X_tr, y_tr, X_te = _fitted_inputs()
+    precompute_cache.sweep_predict("The Deep Pattern-Finder", range(1, 11), X_tr, y_tr, X_te)
+    # Levels 9 and 10 share max_depth=None: 220 trees instead of 180 + 220
+    model = precompute_cache.MODEL_TYPES["The Deep Pattern-Finder"]()
+    assert len(built) == sum(precompute_cache.tune_model(model, level).n_estimators for level in range(1, 11)) - precompute_cache.tune_model(model, 9).n_estimators
+
+
+# Share of test rows on which a truncated tree/forest level may disagree with
+# its cold fit (about 17% worst case on these inputs)
+APPROXIMATE_SWEEP_MAX_DISAGREEMENT = 0.2
+
+
+@pytest.mark.parametrize("features", [("age", "priors_count", "race", "sex"), tuple(precompute_cache.ALL_FEATURES)])
+@pytest.mark.parametrize("model_name", ["The Rule-Maker", "The Deep Pattern-Finder"])
+def test_approximate_sweep_stays_close_to_independent_fits(model_name, features):
+    X_tr, y_tr, X_te = _fitted_inputs(features)
+    swept = precompute_cache.sweep_predict(model_name, range(1, 11), X_tr, y_tr, X_te, approximate=True)
+    assert sorted(swept) == list(range(1, 11))
+    for level in range(1, 11):
+        cold = precompute_cache.fit_predict(model_name, level, X_tr, y_tr, X_te)
+        assert (swept[level] != cold).mean() <= APPROXIMATE_SWEEP_MAX_DISAGREEMENT, level
+
+
+def test_tree_truncation_matches_depth_limited_fit():
+    X_tr, y_tr, X_te = _fitted_inputs()
+    full = precompute_cache.DecisionTreeClassifier(random_state=0).fit(X_tr, y_tr)
+    paths = precompute_cache._tree_node_paths(full, X_te)
+    np.testing.assert_array_equal(paths[-1], full.apply(X_te.astype(np.float32)))
+    # The root split never depends on RNG order, so depth 1 is always exact
+    stump = precompute_cache.DecisionTreeClassifier(random_state=0, max_depth=1).fit(X_tr, y_tr)
+    np.testing.assert_allclose(precompute_cache._truncated_proba(full, paths, 1), stump.predict_proba(X_te))
+
+
+def test_sweep_mode_matches_reference_mode():
+    X_train, X_test = _frame(300, 0), _frame(60, 1)
+    y_train = (X_train["priors_count"] > 3).astype(int).to_numpy()
+    train, test, slices = precompute_cache.build_feature_matrices(X_train, X_test)
+    groups = [(m, tuple(range(1, 11)), ("age", "race")) for m in precompute_cache.MODEL_TYPES]
+
+    swept = dict(precompute_cache.run_chunk(train, y_train, test, slices, "Full (100%)", groups, sweep=True))
+    reference = dict(precompute_cache.run_chunk(train, y_train, test, slices, "Full (100%)", groups, sweep=False))
+    assert len(swept) == 4 * 10
+    assert swept == reference
+
+
+# ---------------------------------------------------------------------------
+# Task index and checkpoint store
+# ---------------------------------------------------------------------------
+
+
+def test_task_index_round_trip_and_order():
+    assert precompute_cache.TOTAL_TASKS == 327520
+    for task_id in (0, 9, 10, 20469, 20470, 327519):
+        assert precompute_cache.task_index(*precompute_cache.task_from_index(task_id)) == task_id
+    # Complexity is innermost: one sweep is ten consecutive ids
+    first = [precompute_cache.task_from_index(i) for i in range(10)]
+    assert [t[1] for t in first] == list(range(1, 11))
+    assert len({(t[0], t[2], t[3]) for t in first}) == 1
+
+
+def test_checkpoint_store_resume_and_export(tmp_path):
+    path = str(tmp_path / "checkpoint.sqlite")
+    store = precompute_cache.CheckpointStore(path)
+    store.set_meta("n_predictions", 5)
+    store.add_many([(12, precompute_cache.pack_predictions([1, 0, 1, 1, 0])), (3, precompute_cache.pack_predictions([0, 0, 0, 0, 1]))])
+    store.close()
+
+    store = precompute_cache.CheckpointStore(path)
+    mask = store.completed_mask()
+    assert mask.sum() == 2 and mask[3] and mask[12]
+
+    out = str(tmp_path / "prediction_cache.json.gz")
+    precompute_cache.export_json_gz(store, out)
+    with gzip.open(out, "rt", encoding="UTF-8") as f:
+        exported = json.load(f)
+    assert list(exported.values()) == ["00001", "10110"]
+    assert list(exported) == [precompute_cache.cache_key(*precompute_cache.task_from_index(i)) for i in (3, 12)]
+    store.close()
+
+
+def test_import_legacy_checkpoint(tmp_path):
+    legacy = tmp_path / "cache_checkpoint.jsonl"
+    task = precompute_cache.task_from_index(42)
+    legacy.write_text(
+        json.dumps({"k": precompute_cache.cache_key(*task), "v": "0110"}) + "\n"
+        + json.dumps({"k": "unknown|1|x|y", "v": "1111"}) + "\n"
+    )
+    store = precompute_cache.CheckpointStore(str(tmp_path / "checkpoint.sqlite"))
+    precompute_cache.import_legacy_checkpoint(store, str(legacy))
+    assert store.count() == 1
+    assert dict(store.items()) == {precompute_cache.cache_key(*task): "0110"}
+    store.close()
+
+
+def test_fingerprints_change_only_for_affected_models(monkeypatch):
+    data, models = precompute_cache.build_fingerprints()
+    assert precompute_cache.build_fingerprints() == (data, models)
+    assert list(models) == list(precompute_cache.MODEL_TYPES)
+
+    original = precompute_cache.tune_model
+
+    def tune_model(model, level):
+        model = original(model, level)
+        if isinstance(model, precompute_cache.KNeighborsClassifier):
+            model.n_neighbors += 1
+        return model
+
+    monkeypatch.setattr(precompute_cache, "tune_model", tune_model)
+    monkeypatch.setattr(precompute_cache, "TOP_CHARGES", 40)
+    new_data, new_models = precompute_cache.build_fingerprints()
+    assert new_data != data
+    assert [m for m in models if models[m] != new_models[m]] == ["The 'Nearest Neighbor'"]
+
+
+def test_builder_fingerprints_match_what_the_apps_expect():
+    from aimodelshare.moral_compass.prediction_cache import MODEL_TYPES, model_fingerprints, tune_model
+
+    assert precompute_cache.MODEL_TYPES is MODEL_TYPES and precompute_cache.tune_model is tune_model
+    _, models = precompute_cache.build_fingerprints()
+    assert models == model_fingerprints(MODEL_TYPES, tune_model)
+    # Approximate tree/forest sweeps are not served to apps expecting independent fits
+    _, approximate = precompute_cache.build_fingerprints(approximate=True)
+    assert [m for m in models if approximate[m] != models[m]] == ["The Rule-Maker", "The Deep Pattern-Finder"]
+
+
+def test_checkpoint_drops_results_of_changed_models(tmp_path):
+    path = str(tmp_path / "checkpoint.sqlite")
+    per_model = precompute_cache.TOTAL_TASKS // len(precompute_cache.MODEL_TYPES)
+    ids = [i * per_model + 5 for i in range(len(precompute_cache.MODEL_TYPES))]
+    assert [precompute_cache.task_from_index(i)[0] for i in ids] == list(precompute_cache.MODEL_TYPES)
+    models = {name: "a" for name in precompute_cache.MODEL_TYPES}
+
+    store = precompute_cache.CheckpointStore(path)
+    store.add_many((i, precompute_cache.pack_predictions([1, 0])) for i in ids)
+    assert store.sync_fingerprints("data", models) == []  # store from before fingerprints
+    assert store.sync_fingerprints("data", models) == []
+    assert store.sync_fingerprints("data", {**models, "The Rule-Maker": "b"}) == ["The Rule-Maker"]
+    assert list(np.flatnonzero(store.completed_mask())) == [ids[0], ids[2], ids[3]]
+    assert store.fingerprints() == ("data", {**models, "The Rule-Maker": "b"})
+    assert store.sync_fingerprints("other", models) == list(precompute_cache.MODEL_TYPES)
+    assert store.count() == 0
+    store.close()
+
+
+# ---------------------------------------------------------------------------
+# Sharding and merge
+# ---------------------------------------------------------------------------
+
+
+def test_shards_partition_whole_sweeps():
+    masks = [precompute_cache.shard_mask(i, 3) for i in range(3)]
+    assert (sum(m.astype(int) for m in masks) == 1).all()
+    for mask in masks:
+        sweeps = mask.reshape(-1, 10)
+        assert (sweeps.all(axis=1) | ~sweeps.any(axis=1)).all()
+    assert precompute_cache.parse_shard("2/8") == (2, 8)
+    with pytest.raises(Exception):
+        precompute_cache.parse_shard("8/8")
+
+
+def _write_shard(path, ids, shard):
+    store = precompute_cache.CheckpointStore(str(path), shard=shard)
+    store.set_meta("n_predictions", 4)
+    store.add_many((i, precompute_cache.pack_predictions([i % 2, 1, 0, i % 3 == 0])) for i in ids)
+    store.close()
+
+
+def test_merge_checkpoints_builds_prediction_cache(tmp_path, monkeypatch):
+    from aimodelshare.moral_compass.prediction_cache import PredictionCacheReader
+
+    monkeypatch.setattr(precompute_cache, "TOTAL_TASKS", 40)
+    paths = []
+    for i in range(2):
+        paths.append(tmp_path / f"shard-{i}.sqlite")
+        _write_shard(paths[-1], np.flatnonzero(precompute_cache.shard_mask(i, 2)), (i, 2))
+
+    out = str(tmp_path / "prediction_cache.sqlite")
+    stats = precompute_cache.merge_checkpoints([str(p) for p in paths], out)
+    assert stats["entries"] == 40
+
+    reader = PredictionCacheReader(out)
+    key = precompute_cache.cache_key(*precompute_cache.task_from_index(33))
+    np.testing.assert_array_equal(reader.get(key), [1, 1, 0, 1])
+    assert reader.get_metrics(key) is None  # shards recorded no test labels
+    reader.close()
+
+
+def test_merge_precomputes_metrics_from_recorded_labels(tmp_path, monkeypatch):
+    from aimodelshare.moral_compass.prediction_cache import PredictionCacheReader
+
+    monkeypatch.setattr(precompute_cache, "TOTAL_TASKS", 40)
+    path = tmp_path / "all.sqlite"
+    _write_shard(path, range(40), None)
+    store = precompute_cache.CheckpointStore(str(path))
+    store.set_meta("y_test", "1101")
+    groups = {"race": ["A", "B", "A", "B"], "sex": ["F", "F", "M", "M"]}
+    store.set_meta("test_groups", json.dumps(groups))
+    labels = tmp_path / "labels.json"
+    assert precompute_cache.write_labels(store, str(labels), 0.0)
+    store.close()
+    assert json.loads(labels.read_text()) == {"y_test": "1101", "private_size": 0.0, "groups": groups}
+
+    out = str(tmp_path / "prediction_cache.sqlite")
+    precompute_cache.merge_checkpoints([str(path)], out, private_size=0.0)
+    reader = PredictionCacheReader(out)
+    key = precompute_cache.cache_key(*precompute_cache.task_from_index(33))
+    assert reader.get_metrics(key).accuracy == 1.0
+    assert reader.get_group_metrics(key)["race"]["B"].tp == 2
+    reader.close()
+
+
+def test_merge_records_fingerprints_and_rejects_mixed_ones(tmp_path, monkeypatch):
+    import sqlite3
+
+    monkeypatch.setattr(precompute_cache, "TOTAL_TASKS", 40)
+    models = {name: "m" for name in precompute_cache.MODEL_TYPES}
+    paths = []
+    for i in range(2):
+        paths.append(str(tmp_path / f"shard-{i}.sqlite"))
+        _write_shard(paths[-1], np.flatnonzero(precompute_cache.shard_mask(i, 2)), (i, 2))
+        store = precompute_cache.CheckpointStore(paths[-1])
+        store.sync_fingerprints("d", models)
+        store.close()
+
+    out = str(tmp_path / "prediction_cache.sqlite")
+    precompute_cache.merge_checkpoints(paths, out)
+    conn = sqlite3.connect(out)
+    meta = dict(conn.execute("SELECT name, value FROM meta"))
+    conn.close()
+    assert meta["data_fingerprint"] == "d" and json.loads(meta["model_fingerprints"]) == models
+
+    store = precompute_cache.CheckpointStore(paths[1])
+    store.sync_fingerprints("changed", models)
+    store.close()
+    with pytest.raises(ValueError, match="different configurations"):
+        precompute_cache.merge_checkpoints(paths, out)
+
+
+def test_merge_rejects_incomplete_shards(tmp_path, monkeypatch):
+    monkeypatch.setattr(precompute_cache, "TOTAL_TASKS", 40)
+    path = tmp_path / "shard-0.sqlite"
+    _write_shard(path, np.flatnonzero(precompute_cache.shard_mask(0, 2)), (0, 2))
+
+    out = tmp_path / "prediction_cache.sqlite"
+    with pytest.raises(ValueError, match="20 missing"):
+        precompute_cache.merge_checkpoints([str(path)], str(out))
+    assert not out.exists()
+
+
+def test_task_space_matches_cache_key_codec():
+    from aimodelshare.moral_compass.prediction_cache import ALL_FEATURES, DATA_SIZES, GROUP_ATTRIBUTES, MODEL_NAMES, encode_key, legacy_key_to_int
+
+    assert tuple(precompute_cache.ALL_FEATURES) == ALL_FEATURES
+    assert tuple(precompute_cache.MODEL_TYPES) == MODEL_NAMES
+    assert tuple(precompute_cache.DATA_SIZE_MAP) == DATA_SIZES
+    assert tuple(precompute_cache.GROUP_COLS) == GROUP_ATTRIBUTES
+    for task_id in (0, 1234, 327519):
+        task = precompute_cache.task_from_index(task_id)
+        assert legacy_key_to_int(precompute_cache.cache_key(*task)) == encode_key(*task)
+
+
+# ---------------------------------------------------------------------------
+# Prepared data artifact
+# ---------------------------------------------------------------------------
+
+
+def test_export_data_artifact_matches_engine_data(tmp_path):
+    from aimodelshare.moral_compass.prediction_cache import load_prepared_data
+
+    df = _frame(200, 5).drop(columns="length_of_stay")
+    df["c_jail_in"] = pd.Timestamp("2013-01-01") + pd.to_timedelta(np.arange(200), unit="h")
+    df["c_jail_out"] = df["c_jail_in"] + pd.to_timedelta(np.arange(200) % 9, unit="D")
+    df["two_year_recid"] = np.random.RandomState(5).randint(0, 2, 200)
+    csv = tmp_path / "compas.csv"
+    df.to_csv(csv, index=False)
+
+    path = str(tmp_path / "compas_prepared.npz")
+    precompute_cache.export_data_artifact(path, str(csv))
+    prepared = load_prepared_data(path)
+
+    X_train, X_test, y_train, y_test = precompute_cache.load_data(str(csv))
+    for got, expected in zip(prepared.split(), (X_train, X_test)):
+        pd.testing.assert_frame_equal(got, expected)
+    X_samples, y_samples = precompute_cache.sample_data_sizes(X_train, y_train)
+    for label, frac in precompute_cache.DATA_SIZE_MAP.items():
+        X, y = prepared.sample(frac)
+        pd.testing.assert_frame_equal(X, X_samples[label])
+        pd.testing.assert_series_equal(y, y_samples[label])
+    assert prepared.data_fingerprint == precompute_cache.build_fingerprints()[0]
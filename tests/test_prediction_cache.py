@@ -0,0 +1,867 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the shared prediction cache subsystem
+(aimodelshare.moral_compass.prediction_cache).
+
+Run with: pytest tests/test_prediction_cache.py -v
+"""
+
+import json
+import sqlite3
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from aimodelshare.moral_compass.prediction_cache import (
+    ALL_FEATURES,
+    ByteLRUCache,
+    CacheConfig,
+    DATA_SIZES,
+    FIT_APPROXIMATE_SWEEP,
+    FIT_INDEPENDENT,
+    MODEL_NAMES,
+    CacheKeyError,
+    GroupConfusion,
+    LazyTrainer,
+    MetricScorer,
+    OverlayCache,
+    MetricsError,
+    PackedPredictionMatrix,
+    PredictionCacheReader,
+    PredictionCacheWriter,
+    PredictionCodecError,
+    PreparedDataError,
+    decode_key,
+    decode_predictions,
+    encode_key,
+    encode_predictions,
+    complexity_sweep,
+    get_cached_prediction,
+    get_cached_predictions,
+    get_lazy_trainer,
+    get_reader,
+    int_to_legacy_key,
+    key_model,
+    legacy_key_to_int,
+    load_prepared_data,
+    model_fingerprints,
+    model_sweep,
+    overlay_path,
+    write_prepared_data,
+)
+from aimodelshare.moral_compass.prediction_cache.metrics import decode_metrics, encode_metrics, split_masks
+
+
+def _make_legacy_db(path, entries):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE cache (key TEXT PRIMARY KEY, value TEXT)")
+    conn.executemany("INSERT INTO cache (key, value) VALUES (?, ?)", list(entries.items()))
+    conn.commit()
+    conn.close()
+
+
+@pytest.fixture
+def legacy_db(tmp_path):
+    path = tmp_path / "prediction_cache.sqlite"
+    _make_legacy_db(path, {"A|1|Small (20%)|age": "0101", "B|2|Small (20%)|race": "1100"})
+    return str(path)
+
+
+def test_reader_hit_and_miss_counters(legacy_db):
+    reader = PredictionCacheReader(legacy_db, pool_size=2)
+    np.testing.assert_array_equal(reader.get("A|1|Small (20%)|age"), [0, 1, 0, 1])
+    assert reader.get("missing") is None
+
+    stats = reader.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["lookups"] == 2
+    assert stats["hit_rate"] == pytest.approx(0.5)
+    assert stats["max_lookup_ms"] >= 0.0
+    reader.close()
+
+
+def test_reader_reuses_pooled_connection(legacy_db):
+    reader = PredictionCacheReader(legacy_db, pool_size=2)
+    for _ in range(20):
+        reader.get("B|2|Small (20%)|race")
+    assert reader.stats()["connections_opened"] == 1
+    reader.close()
+
+
+def test_reader_is_read_only(legacy_db):
+    reader = PredictionCacheReader(legacy_db)
+    with reader.connection() as conn:
+        with pytest.raises(sqlite3.Error):
+            conn.execute("DELETE FROM cache")
+    reader.close()
+
+
+def test_reader_missing_file_returns_none(tmp_path):
+    reader = PredictionCacheReader(str(tmp_path / "nope.sqlite"))
+    assert not reader.available
+    assert reader.get("anything") is None
+
+
+def test_reader_concurrent_lookups(legacy_db):
+    reader = PredictionCacheReader(legacy_db, pool_size=4)
+    results = []
+
+    def worker():
+        for _ in range(50):
+            results.append(reader.get("A|1|Small (20%)|age").tolist())
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert results == [[0, 1, 0, 1]] * 400
+    stats = reader.stats()
+    assert stats["hits"] == 400
+    assert stats["idle_connections"] <= 4
+    reader.close()
+
+
+def test_get_reader_is_shared_per_path(legacy_db):
+    assert get_reader(legacy_db) is get_reader(legacy_db)
+
+
+def test_get_many_matches_get_in_order(tmp_path, legacy_db):
+    keys = [encode_key(MODEL_NAMES[0], level, DATA_SIZES[0], ["age"]) for level in range(1, 11)]
+    path = str(tmp_path / "many.sqlite")
+    writer = PredictionCacheWriter(path)
+    for i, key in enumerate(keys):
+        writer.add(key, [i % 2, 1, i % 3 == 0])
+    writer.finalize()
+
+    reader = PredictionCacheReader(path, log_every=0)
+    reader.get(keys[3])  # one LRU hit
+    wanted = [keys[5], max(keys) + 1, keys[3], "not|a|key", int_to_legacy_key(keys[0]), keys[5]] + keys
+    many = reader.get_many(wanted)
+    assert many[1] is None and many[3] is None
+    for key, value in zip(wanted, many):
+        if value is not None:
+            np.testing.assert_array_equal(value, PredictionCacheReader(path, lru_bytes=0).get(key))
+    stats = reader.stats()
+    assert (stats["hits"], stats["misses"], stats["connections_opened"]) == (1 + len(wanted) - 2, 2, 1)
+    assert reader.get_many([]) == []
+    reader.close()
+
+    legacy = PredictionCacheReader(legacy_db, lru_bytes=0)
+    many = legacy.get_many(["B|2|Small (20%)|race", "missing", "A|1|Small (20%)|age"])
+    np.testing.assert_array_equal(many[0], [1, 1, 0, 0])
+    assert many[1] is None
+    np.testing.assert_array_equal(many[2], [0, 1, 0, 1])
+    legacy.close()
+
+
+def test_configuration_lookups_use_the_shared_reader(tmp_path, monkeypatch):
+    from aimodelshare.moral_compass.prediction_cache import reader as reader_module
+
+    path = str(tmp_path / "shared.sqlite")
+    writer = PredictionCacheWriter(path)
+    writer.add(encode_key(MODEL_NAMES[1], 4, DATA_SIZES[2], ["race", "age"]), "0110")
+    writer.finalize()
+    monkeypatch.setattr(reader_module, "DEFAULT_DB_PATH", path)
+
+    np.testing.assert_array_equal(get_cached_prediction(MODEL_NAMES[1], 4, DATA_SIZES[2], ["age", "race"]), [0, 1, 1, 0])
+    assert get_cached_prediction("Unknown", 4, DATA_SIZES[2], ["age"]) is None
+    configs = [
+        CacheConfig(MODEL_NAMES[1], 5, DATA_SIZES[2], ("age", "race")),
+        CacheConfig("Unknown", 4, DATA_SIZES[2], ("age",)),
+        CacheConfig(MODEL_NAMES[1], 4, DATA_SIZES[2], ("race", "age")),
+    ]
+    many = get_cached_predictions(configs)
+    assert many[0] is None and many[1] is None
+    np.testing.assert_array_equal(many[2], [0, 1, 1, 0])
+    assert get_reader().stats()["lookups"] == 3
+    get_reader().close()
+
+
+def test_get_range_scans_consecutive_keys(tmp_path, legacy_db):
+    keys = [encode_key(MODEL_NAMES[2], level, DATA_SIZES[1], ["sex"]) for level in (1, 2, 3, 5)]
+    other = encode_key(MODEL_NAMES[2], 1, DATA_SIZES[1], ["age"])
+    path = str(tmp_path / "range.sqlite")
+    writer = PredictionCacheWriter(path)
+    for i, key in enumerate(keys + [other]):
+        writer.add(key, [i & 1, (i >> 1) & 1, 1])
+    writer.finalize()
+
+    reader = PredictionCacheReader(path, log_every=0)
+    found = reader.get_range(keys[0], keys[0] + 9)
+    assert list(found) == keys
+    np.testing.assert_array_equal(found[keys[3]], [1, 1, 1])
+    assert reader.stats()["lookups"] == 10 and reader.stats()["hits"] == 4
+    assert reader.get(keys[1]) is found[keys[1]]  # results were put in the LRU
+    assert reader.get_range(keys[3], keys[0]) == {}
+    assert reader.preload()
+    assert list(reader.get_range(keys[0], keys[0] + 9)) == keys
+    reader.close()
+
+    # String-keyed databases fall back to point lookups
+    assert PredictionCacheReader(legacy_db).get_range(keys[0], keys[0] + 9) == {}
+
+
+def test_sweeps_score_every_level_and_model(tmp_path, monkeypatch):
+    from aimodelshare.moral_compass.prediction_cache import reader as reader_module
+
+    y_true = np.array([1, 0, 1, 0])
+    path = str(tmp_path / "sweep.sqlite")
+    writer = PredictionCacheWriter(path)
+    for level in range(1, 11):
+        writer.add(encode_key(MODEL_NAMES[0], level, DATA_SIZES[0], ["age"]), [1, 0, 1, 0] if level > 5 else [1, 1, 1, 1])
+    writer.add(encode_key(MODEL_NAMES[3], 4, DATA_SIZES[0], ["age"]), [0, 1, 0, 1])
+    writer.finalize()
+    monkeypatch.setattr(reader_module, "DEFAULT_DB_PATH", path)
+
+    curve = complexity_sweep(MODEL_NAMES[0], DATA_SIZES[0], ["age"], y_true)
+    assert curve == {level: (1.0 if level > 5 else 0.5) for level in range(1, 11)}
+    assert complexity_sweep("Unknown", DATA_SIZES[0], ["age"], y_true) == {}
+    assert model_sweep(4, DATA_SIZES[0], ["age"], y_true) == {MODEL_NAMES[0]: 0.5, MODEL_NAMES[3]: 0.0}
+    get_reader().close()
+
+
+# ---------------------------------------------------------------------------
+# LRU front cache
+# ---------------------------------------------------------------------------
+
+
+def test_lru_evicts_least_recently_used_by_bytes():
+    lru = ByteLRUCache(max_bytes=30)
+    for key in "abc":
+        lru.put(key, np.zeros(10, dtype=np.uint8))
+    assert lru.get("a") is not None  # "b" is now the oldest
+    lru.put("d", np.zeros(10, dtype=np.uint8))
+
+    assert lru.get("b") is None
+    assert [k for k in "acd" if lru.get(k) is not None] == ["a", "c", "d"]
+    lru.put("huge", np.zeros(31, dtype=np.uint8))  # larger than the budget: not cached
+    stats = lru.stats()
+    assert stats["evictions"] == 1
+    assert stats["entries"] == 3 and stats["bytes"] == 30
+    assert stats["hits"] == 4 and stats["misses"] == 1
+
+
+def test_reader_serves_repeats_from_lru(legacy_db):
+    reader = PredictionCacheReader(legacy_db, lru_bytes=1024)
+    first = reader.get("A|1|Small (20%)|age")
+    for _ in range(5):
+        assert reader.get("A|1|Small (20%)|age") is first
+    assert not first.flags.writeable
+
+    stats = reader.stats()
+    assert stats["hits"] == 6
+    assert stats["lru_hits"] == 5 and stats["lru_misses"] == 1
+    assert stats["lru_entries"] == 1
+    reader.close()
+
+
+def test_reader_without_lru_still_returns_read_only_arrays(legacy_db):
+    reader = PredictionCacheReader(legacy_db, lru_bytes=0)
+    a, b = reader.get("A|1|Small (20%)|age"), reader.get("A|1|Small (20%)|age")
+    assert a is not b and not a.flags.writeable
+    assert reader.stats()["lru_max_bytes"] == 0
+    reader.close()
+
+
+def test_reader_logs_stats_periodically(legacy_db, caplog):
+    reader = PredictionCacheReader(legacy_db, log_every=3)
+    with caplog.at_level("INFO", logger="aimodelshare.moral_compass"):
+        for _ in range(6):
+            reader.get("A|1|Small (20%)|age")
+    lines = [r.getMessage() for r in caplog.records if "Prediction cache" in r.getMessage()]
+    assert len(lines) == 2
+    assert "LRU 5 hits / 1 misses / 0 evictions" in lines[-1]
+    reader.close()
+
+
+# ---------------------------------------------------------------------------
+# Bit-packed codec
+# ---------------------------------------------------------------------------
+
+
+def test_codec_round_trip_and_size():
+    preds = np.random.RandomState(0).randint(0, 2, size=1001)
+    blob = encode_predictions(preds)
+    assert len(blob) < len(preds) // 8 + 16
+    decoded = decode_predictions(blob)
+    assert decoded.dtype == np.uint8
+    np.testing.assert_array_equal(decoded, preds)
+
+
+def test_codec_accepts_legacy_strings():
+    np.testing.assert_array_equal(decode_predictions("0110"), [0, 1, 1, 0])
+    np.testing.assert_array_equal(decode_predictions("[1, 0, 1]"), [1, 0, 1])
+    np.testing.assert_array_equal(decode_predictions(encode_predictions("0110")), [0, 1, 1, 0])
+
+
+def test_codec_rejects_bad_input():
+    with pytest.raises(PredictionCodecError):
+        encode_predictions([0, 2, 1])
+    with pytest.raises(PredictionCodecError):
+        decode_predictions(b"XX\x01\x00\x00\x00\x00")
+
+
+def test_reader_decodes_blob_values(tmp_path):
+    path = tmp_path / "packed.sqlite"
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE cache (key TEXT PRIMARY KEY, value BLOB)")
+    conn.execute("INSERT INTO cache VALUES (?, ?)", ("k", encode_predictions([1, 0, 0, 1, 1])))
+    conn.commit()
+    conn.close()
+
+    reader = PredictionCacheReader(str(path))
+    np.testing.assert_array_equal(reader.get("k"), [1, 0, 0, 1, 1])
+    reader.close()
+
+
+# ---------------------------------------------------------------------------
+# Deduplicated store
+# ---------------------------------------------------------------------------
+
+
+KEY_A = "The Balanced Generalist|1|Small (20%)|age"
+KEY_B = "The Rule-Maker|10|Full (100%)|c_charge_desc,race"
+KEY_C = "The Deep Pattern-Finder|5|Medium (60%)|priors_count,sex"
+
+
+def test_writer_deduplicates_vectors(tmp_path):
+    path = str(tmp_path / "dedup.sqlite")
+    writer = PredictionCacheWriter(path)
+    writer.add(KEY_A, "0101")
+    writer.add(legacy_key_to_int(KEY_B), [0, 1, 0, 1])
+    writer.add(KEY_C, "1111")
+    writer.add(KEY_A, "0000")  # duplicate key keeps the first value
+    stats = writer.finalize()
+
+    assert stats["entries"] == 3
+    assert stats["unique_vectors"] == 2
+    assert stats["dedup_ratio"] == pytest.approx(1.5)
+
+    reader = PredictionCacheReader(path)
+    np.testing.assert_array_equal(reader.get(KEY_A), [0, 1, 0, 1])
+    np.testing.assert_array_equal(reader.get(KEY_B), [0, 1, 0, 1])
+    np.testing.assert_array_equal(reader.get(legacy_key_to_int(KEY_C)), [1, 1, 1, 1])
+    assert reader.get("The Rule-Maker|1|Small (20%)|age") is None
+    assert reader.get("not a key") is None
+    assert reader.stats()["misses"] == 2
+    reader.close()
+
+
+def test_writer_uses_integer_primary_key(tmp_path):
+    path = str(tmp_path / "int.sqlite")
+    writer = PredictionCacheWriter(path)
+    writer.add(KEY_A, "01")
+    writer.finalize()
+
+    conn = sqlite3.connect(path)
+    assert conn.execute("SELECT key FROM cache").fetchall() == [(legacy_key_to_int(KEY_A),)]
+    # key is the rowid: no separate primary key index
+    assert conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE type='index' AND tbl_name='cache'").fetchone()[0] == 0
+    conn.close()
+
+    with pytest.raises(CacheKeyError):
+        PredictionCacheWriter(str(tmp_path / "bad.sqlite")).add("a", "01")
+
+
+def test_legacy_string_db_accepts_integer_keys(legacy_db):
+    reader = PredictionCacheReader(legacy_db)
+    key = encode_key("The Balanced Generalist", 1, "Small (20%)", ["age"])
+    assert reader.get(key) is None  # "A|..." is not a real model name; just no crash
+    reader.close()
+
+
+# ---------------------------------------------------------------------------
+# Precomputed metrics
+# ---------------------------------------------------------------------------
+
+
+def _sklearn_metrics(y_true, y_pred):
+    from sklearn.metrics import accuracy_score, f1_score, precision_score, recall_score
+
+    return [
+        accuracy_score(y_true, y_pred),
+        f1_score(y_true, y_pred, average="macro", zero_division=0),
+        precision_score(y_true, y_pred, average="macro", zero_division=0),
+        recall_score(y_true, y_pred, average="macro", zero_division=0),
+    ]
+
+
+@pytest.mark.parametrize("private_size", [0.0, 0.3, 0.5, 1.0])
+def test_scorer_matches_eval_lambda_metrics(private_size):
+    from sklearn.model_selection import train_test_split
+
+    rng = np.random.default_rng(0)
+    y_true = rng.integers(0, 2, 200)
+    scorer = MetricScorer(y_true, private_size)
+    for y_pred in (rng.integers(0, 2, 200), np.zeros(200, dtype=int), y_true.copy()):
+        full, public, private = scorer.score(y_pred)
+        np.testing.assert_allclose(full, _sklearn_metrics(y_true, y_pred))
+
+        # Same split as public_private_split() in the eval Lambda
+        if private_size in (0.0, 1.0):
+            void, scored = (private, public) if private_size == 0 else (public, private)
+            assert np.isnan(void).all()
+            np.testing.assert_allclose(scored, full)
+        else:
+            t_priv, t_pub, p_priv, p_pub = train_test_split(
+                y_true, y_pred, test_size=1 - private_size, shuffle=True, stratify=y_true, random_state=1
+            )
+            np.testing.assert_allclose(public, _sklearn_metrics(t_pub, p_pub))
+            np.testing.assert_allclose(private, _sklearn_metrics(t_priv, p_priv))
+
+
+def test_metrics_round_trip_and_validation():
+    scorer = MetricScorer([0, 1, 1, 0], private_size=0.0)
+    metrics = decode_metrics(encode_metrics(scorer.score([0, 1, 0, 0])))
+    assert metrics.accuracy == pytest.approx(0.75)
+    assert metrics.public == metrics.full
+    assert set(metrics.private.values()) == {None}
+
+    with pytest.raises(MetricsError):
+        scorer.score([0, 1])
+    with pytest.raises(MetricsError):
+        decode_metrics(b"short")
+    with pytest.raises(MetricsError):
+        split_masks([0, 1], 1.5)
+
+
+def test_writer_stores_metrics_per_vector(tmp_path):
+    path = str(tmp_path / "metrics.sqlite")
+    writer = PredictionCacheWriter(path, scorer=MetricScorer([0, 1, 0, 1]))
+    writer.add(KEY_A, "0101")
+    writer.add(KEY_B, "0101")
+    writer.add(KEY_C, "1111")
+    writer.finalize()
+
+    reader = PredictionCacheReader(path)
+    assert reader.get_metrics(KEY_A).accuracy == 1.0
+    assert reader.get_metrics(KEY_B) == reader.get_metrics(KEY_A)
+    metrics = reader.get_metrics(legacy_key_to_int(KEY_C))
+    assert metrics.accuracy == 0.5
+    assert metrics.full["precision"] == pytest.approx(0.25)
+    assert reader.get_metrics("The Rule-Maker|1|Small (20%)|age") is None
+    # Repeats are served from the LRU
+    assert reader.get_metrics(legacy_key_to_int(KEY_C)) == metrics
+    assert reader.stats()["lru_hits"] == 2
+    reader.close()
+
+
+def test_scorer_group_confusion_counts():
+    y_true = np.array([1, 0, 1, 0, 0, 1])
+    y_pred = np.array([1, 1, 0, 0, 1, 1])
+    groups = {"race": ["A", "A", "B", "B", None, "B"], "sex": ["F", "M", "F", "M", "M", "F"]}
+    scorer = MetricScorer(y_true, groups=groups)
+    assert scorer.group_names == [("race", "A"), ("race", "B"), ("sex", "F"), ("sex", "M")]
+
+    counts = scorer.score_groups(y_pred)
+    for (attribute, value), row in zip(scorer.group_names, counts):
+        rows = np.array([g == value for g in groups[attribute]])
+        t, p = y_true[rows].astype(bool), y_pred[rows].astype(bool)
+        assert list(row) == [(t & p).sum(), (~t & p).sum(), (t & ~p).sum(), (~t & ~p).sum()]
+
+    with pytest.raises(MetricsError):
+        MetricScorer(y_true, groups={"race": ["A"] * 5})
+
+
+def test_group_confusion_rates():
+    c = GroupConfusion(tp=3, fp=1, fn=1, tn=3)
+    assert (c.size, c.fpr, c.fnr) == (8, 0.25, 0.25)
+    assert GroupConfusion(tp=2, fp=0, fn=0, tn=0).fpr is None
+
+
+def test_writer_stores_group_counts_per_vector(tmp_path):
+    path = str(tmp_path / "groups.sqlite")
+    groups = {"race": ["A", "A", "B", "B"], "sex": ["F", "M", "F", "M"]}
+    writer = PredictionCacheWriter(path, scorer=MetricScorer([0, 1, 0, 1], groups=groups))
+    writer.add(KEY_A, "0101")
+    writer.add(KEY_C, "1111")
+    writer.finalize()
+
+    reader = PredictionCacheReader(path)
+    perfect = reader.get_group_metrics(KEY_A)
+    assert set(perfect) == {"race", "sex"}
+    assert perfect["race"]["A"] == GroupConfusion(tp=1, fp=0, fn=0, tn=1)
+    all_positive = reader.get_group_metrics(KEY_C)
+    assert all_positive["sex"]["F"].fpr == 1.0
+    assert all_positive["sex"]["M"].fnr == 0.0
+    assert reader.get_group_metrics(KEY_B) is None
+    reader.close()
+
+
+def test_get_metrics_without_labels_returns_none(tmp_path, legacy_db):
+    path = str(tmp_path / "plain.sqlite")
+    writer = PredictionCacheWriter(path)
+    writer.add(KEY_A, "0101")
+    writer.finalize()
+
+    for db in (path, legacy_db):
+        reader = PredictionCacheReader(db)
+        assert reader.get_metrics(KEY_A) is None
+        assert reader.get_group_metrics(KEY_A) is None
+        reader.close()
+
+
+# ---------------------------------------------------------------------------
+# In-memory (PREDICTION_CACHE_MODE=ram) lookups
+# ---------------------------------------------------------------------------
+
+
+def test_preloaded_reader_matches_sqlite_without_touching_it(tmp_path):
+    rng = np.random.default_rng(0)
+    y_true = rng.integers(0, 2, 37)
+    vectors = rng.integers(0, 2, (5, 37))
+    keys = sorted({
+        encode_key(MODEL_NAMES[i % len(MODEL_NAMES)], c, DATA_SIZES[i % len(DATA_SIZES)], [ALL_FEATURES[i]])
+        for i in range(len(ALL_FEATURES)) for c in (1, 5, 10)
+    })
+    groups = {"race": rng.choice(["A", "B", "C"], 37).tolist(), "sex": rng.choice(["F", "M"], 37).tolist()}
+    path = str(tmp_path / "ram.sqlite")
+    writer = PredictionCacheWriter(path, scorer=MetricScorer(y_true, groups=groups, private_size=0.4))
+    for i, key in enumerate(keys):
+        writer.add(key, vectors[i % len(vectors)])
+    writer.finalize()
+
+    sqlite_reader = PredictionCacheReader(path, lru_bytes=0, log_every=0)
+    ram_reader = PredictionCacheReader(path, log_every=0, mode="ram")
+    assert ram_reader.preload() and ram_reader.in_memory
+    assert ram_reader.preload()  # idempotent
+    # Lookups no longer need the file
+    ram_reader.db_path = str(tmp_path / "gone.sqlite")
+
+    for key in keys:
+        np.testing.assert_array_equal(ram_reader.get(key), sqlite_reader.get(key))
+        assert ram_reader.get_metrics(key) == sqlite_reader.get_metrics(key)
+        assert ram_reader.get_group_metrics(key) == sqlite_reader.get_group_metrics(key) is not None
+    assert ram_reader.get(int_to_legacy_key(keys[0])) is not None
+    assert ram_reader.get(max(keys) + 1) is None
+    assert ram_reader.get("not|a|key") is None
+    assert ram_reader.get_metrics(max(keys) + 1) is None
+    assert ram_reader.get_group_metrics(max(keys) + 1) is None
+    with pytest.raises(ValueError):
+        ram_reader.get(keys[0])[0] = 1
+
+    stats = ram_reader.stats()
+    assert (stats["hits"], stats["misses"], stats["connections_opened"]) == (len(keys) + 2, 2, 1)
+    assert stats["in_memory"] and 0 < stats["memory_bytes"] < 10_000
+    sqlite_reader.close()
+
+
+def test_packed_matrix_layout(tmp_path):
+    path = str(tmp_path / "plain.sqlite")
+    writer = PredictionCacheWriter(path)
+    writer.add(KEY_C, "1111000011")
+    writer.add(KEY_A, "0000000001")
+    writer.add(KEY_B, "0000000001")
+    writer.finalize()
+
+    conn = sqlite3.connect(path)
+    matrix = PackedPredictionMatrix.load(conn)
+    conn.close()
+    assert matrix.packed.shape == (2, 2) and matrix.length == 10
+    assert list(matrix.keys) == sorted(legacy_key_to_int(k) for k in (KEY_A, KEY_B, KEY_C))
+    assert matrix.find(legacy_key_to_int(KEY_A)) == matrix.find(legacy_key_to_int(KEY_B))
+    np.testing.assert_array_equal(matrix.predictions(matrix.find(legacy_key_to_int(KEY_C))), [1, 1, 1, 1, 0, 0, 0, 0, 1, 1])
+    assert matrix.metrics is None and matrix.metrics_blob(0) is None
+    assert matrix.groups is None and matrix.groups_blob(0) is None
+
+
+def test_preload_falls_back_to_sqlite_for_legacy_databases(legacy_db, caplog):
+    reader = PredictionCacheReader(legacy_db, mode="ram")
+    with caplog.at_level("WARNING", logger="aimodelshare.moral_compass"):
+        assert not reader.preload()
+    assert "could not be loaded into memory" in caplog.text
+    assert not reader.in_memory
+    np.testing.assert_array_equal(reader.get("A|1|Small (20%)|age"), [0, 1, 0, 1])
+    assert not PredictionCacheReader(str(legacy_db) + ".missing").preload()
+    reader.close()
+
+
+# ---------------------------------------------------------------------------
+# Build fingerprints
+# ---------------------------------------------------------------------------
+
+
+class _Model:
+    def __init__(self, depth=1):
+        self.depth = depth
+
+    def get_params(self):
+        return {"depth": self.depth}
+
+
+def _tune(model, level):
+    model.depth = level
+    return model
+
+
+def test_model_fingerprints_track_tuned_hyperparameters():
+    base = model_fingerprints({"A": _Model, "B": _Model}, _tune)
+    assert base["A"] == base["B"]
+    assert model_fingerprints({"A": lambda: _Model(depth=7)}, _tune)["A"] == base["A"]  # tuning overrides it
+    assert model_fingerprints({"A": _Model}, lambda m, lvl: _tune(m, lvl + 1))["A"] != base["A"]
+    assert model_fingerprints({"A": _Model}, _tune, range(1, 5))["A"] != base["A"]
+
+
+def test_model_fingerprints_record_sklearn_version_and_fit_mode(monkeypatch):
+    import sklearn
+
+    base = model_fingerprints({"A": _Model, "B": _Model}, _tune)
+    approximate = model_fingerprints({"A": _Model, "B": _Model}, _tune, fit_modes={"B": FIT_APPROXIMATE_SWEEP})
+    assert approximate["A"] == base["A"] and approximate["B"] != base["B"]
+    assert model_fingerprints({"A": _Model}, _tune, fit_modes={"A": FIT_INDEPENDENT})["A"] == base["A"]
+    monkeypatch.setattr(sklearn, "__version__", "0.0.0")
+    assert model_fingerprints({"A": _Model}, _tune)["A"] != base["A"]
+
+
+def test_reader_refuses_models_with_other_fingerprints(tmp_path, legacy_db, caplog):
+    keys = [encode_key(name, 1, DATA_SIZES[0], ["age"]) for name in MODEL_NAMES]
+    assert [key_model(k) for k in keys] == list(MODEL_NAMES)
+    stored = {name: f"fp{i}" for i, name in enumerate(MODEL_NAMES)}
+    path = str(tmp_path / "fp.sqlite")
+    writer = PredictionCacheWriter(path, meta={"model_fingerprints": json.dumps(stored)})
+    for key in keys:
+        writer.add(key, "0110")
+    writer.finalize()
+
+    reader = PredictionCacheReader(path, log_every=0)
+    assert reader.get(keys[1]) is not None  # warm the LRU before expectations are set
+    with caplog.at_level("WARNING", logger="aimodelshare.moral_compass"):
+        reader.expect_fingerprints({**stored, MODEL_NAMES[1]: "changed"})
+    assert "The Rule-Maker" in caplog.text
+    assert reader.refused_models == [MODEL_NAMES[1]]
+    assert reader.get(keys[1]) is None
+    assert reader.get(int_to_legacy_key(keys[1])) is None
+    assert all(reader.get(k) is not None for k in keys if k != keys[1])
+    assert reader.preload() and reader.get(keys[1]) is None and reader.get(keys[0]) is not None
+    assert reader.stats()["refused_models"] == [MODEL_NAMES[1]]
+    reader.close()
+
+    # Expectations are per app: another app's models do not change what this one is served
+    other = PredictionCacheReader(path, log_every=0)
+    other.expect_fingerprints(stored, app="app_a")
+    assert other.get(keys[1]) is not None  # warm the LRU for the default app
+    other.expect_fingerprints({**stored, MODEL_NAMES[3]: "changed"}, app="app_b")
+    assert other.refused_for("app_a") == [] and other.refused_for("app_b") == [MODEL_NAMES[3]]
+    assert other.get(keys[3], app="app_a") is not None and other.get(keys[3], app="app_b") is None
+    assert other.get_many(keys, app="app_b")[3] is None and other.get_many(keys, app="app_a")[3] is not None
+    assert other.get(keys[3]) is not None  # no expectation for the default app
+    assert other.stats()["refused_by_app"] == {"app_b": [MODEL_NAMES[3]]}
+    other.close()
+
+    # Databases built before fingerprints are still served
+    legacy = PredictionCacheReader(legacy_db)
+    with caplog.at_level("WARNING", logger="aimodelshare.moral_compass"):
+        legacy.expect_fingerprints({"A": "x"})
+    assert "no model fingerprints" in caplog.text
+    np.testing.assert_array_equal(legacy.get("A|1|Small (20%)|age"), [0, 1, 0, 1])
+    legacy.close()
+
+
+# ---------------------------------------------------------------------------
+# Prepared data artifact
+# ---------------------------------------------------------------------------
+
+
+def _prepared_split():
+    rng = np.random.RandomState(0)
+    df = pd.DataFrame({
+        "age": rng.randint(18, 70, 40),
+        "length_of_stay": rng.rand(40),
+        "race": rng.choice(["African-American", "Caucasian"], 40).astype(object),
+    }, index=rng.permutation(1000)[:40])
+    df.loc[df.index[::7], "length_of_stay"] = np.nan
+    df.loc[df.index[::5], "race"] = np.nan
+    y = pd.Series(rng.randint(0, 2, 40), index=df.index, name="two_year_recid")
+    return df.iloc[:30], df.iloc[30:], y.iloc[:30], y.iloc[30:]
+
+
+def test_prepared_data_round_trips_split_and_samples(tmp_path):
+    path = str(tmp_path / "compas_prepared.npz")
+    X_train, X_test, y_train, y_test = _prepared_split()
+    small = X_train.sample(frac=0.2, random_state=42)
+    write_prepared_data(path, X_train, X_test, y_train, y_test, {0.2: small.index}, "fp")
+
+    prepared = load_prepared_data(path)
+    assert prepared.data_fingerprint == "fp"
+    assert prepared.fractions == (0.2,)
+    got_X_train, got_X_test, got_y_train, got_y_test = prepared.split()
+    pd.testing.assert_frame_equal(got_X_train, X_train)
+    pd.testing.assert_frame_equal(got_X_test, X_test)
+    pd.testing.assert_series_equal(got_y_train, y_train)
+    pd.testing.assert_series_equal(got_y_test, y_test)
+
+    X_small, y_small = prepared.sample(0.2, ["race", "sex", "age"])
+    pd.testing.assert_index_equal(X_small.index, small.index)
+    assert list(X_small.columns) == ["race", "sex", "age"]
+    assert X_small["sex"].isna().all()
+    pd.testing.assert_series_equal(y_small, y_train.loc[small.index])
+    pd.testing.assert_frame_equal(prepared.sample(1.0)[0], X_train)
+    with pytest.raises(PreparedDataError):
+        prepared.sample(0.6)
+
+
+def test_prepared_data_missing_or_outdated_falls_back(tmp_path, caplog):
+    path = str(tmp_path / "compas_prepared.npz")
+    assert load_prepared_data(path) is None
+
+    np.savez(path, version=np.array(0))
+    with caplog.at_level("WARNING", logger="aimodelshare.moral_compass"):
+        assert load_prepared_data(path) is None
+    assert "version 0" in caplog.text
+
+
+def test_prepared_data_rejects_samples_outside_training_set(tmp_path):
+    X_train, X_test, y_train, y_test = _prepared_split()
+    with pytest.raises(PreparedDataError):
+        write_prepared_data(str(tmp_path / "d.npz"), X_train, X_test, y_train, y_test, {0.2: X_test.index[:2]})
+
+
+# ---------------------------------------------------------------------------
+# Lazy training of misses
+# ---------------------------------------------------------------------------
+
+
+def _train_constant(value, length, delay=0.0):
+    time.sleep(delay)
+    return [value] * length
+
+
+def _train_forever():
+    while True:
+        pass
+
+
+def _make_trainer(tmp_path, train_fn, **kwargs):
+    overlay = OverlayCache(overlay_path(str(tmp_path / "prediction_cache.sqlite")))
+    return LazyTrainer(train_fn, overlay, mp_context="fork", **kwargs)
+
+
+def test_lazy_trainer_trains_once_and_serves_overlay(tmp_path):
+    trainer = _make_trainer(tmp_path, _train_constant)
+    assert trainer.overlay.path == str(tmp_path / "prediction_cache.overlay.sqlite")
+
+    futures = [trainer.submit(KEY_A, 1, 4, 0.5) for _ in range(3)]
+    assert futures[0] is futures[1] is futures[2]
+    np.testing.assert_array_equal(trainer.get_or_train(KEY_A, 1, 4), [1, 1, 1, 1])
+    np.testing.assert_array_equal(trainer.get_or_train(legacy_key_to_int(KEY_A), 0, 4), [1, 1, 1, 1])
+
+    stats = trainer.stats()
+    assert (stats["submitted"], stats["deduplicated"], stats["completed"]) == (1, 3, 1)
+    assert stats["overlay_hits"] == 1
+    assert stats["overlay_entries"] == 1
+    trainer.shutdown()
+
+
+def test_lazy_trainer_rejects_when_saturated(tmp_path):
+    trainer = _make_trainer(tmp_path, _train_constant, max_pending=1)
+    assert trainer.submit(KEY_A, 1, 4, 0.5) is not None
+    assert trainer.submit(KEY_B, 1, 4) is None
+    assert trainer.get_or_train(KEY_B, 1, 4) is None
+    assert trainer.stats()["rejected"] == 2
+    trainer.shutdown()
+
+
+def test_lazy_trainer_caps_cpu_time_and_retries_after_backoff(tmp_path):
+    trainer = _make_trainer(tmp_path, _train_forever, cpu_seconds=1, wait_seconds=30, retry_seconds=1.0)
+    assert trainer.get_or_train(KEY_A) is None
+    stats = trainer.stats()
+    assert (stats["failed"], stats["in_flight"], stats["overlay_entries"]) == (1, 0, 0)
+    assert trainer.submit(KEY_A) is None  # backing off after the failure
+    time.sleep(1.1)
+    trainer.train_fn = _train_constant
+    np.testing.assert_array_equal(trainer.get_or_train(KEY_A, 1, 2), [1, 1])
+    trainer.shutdown()
+
+
+def test_lazy_trainer_returns_early_and_keeps_training(tmp_path):
+    trainer = _make_trainer(tmp_path, _train_constant, wait_seconds=0.1)
+    assert trainer.get_or_train(KEY_A, 1, 4, 1.0) is None
+    assert trainer.is_pending(KEY_A)
+    for _ in range(100):
+        value = trainer.get_or_train(KEY_A, 1, 4, 1.0)
+        if value is not None:
+            break
+    np.testing.assert_array_equal(value, [1, 1, 1, 1])
+    assert trainer.stats()["submitted"] == 1
+    trainer.shutdown()
+
+
+def test_lazy_trainer_replaces_a_pool_already_dropped_as_broken(tmp_path):
+    from concurrent.futures.process import BrokenProcessPool
+
+    trainer = _make_trainer(tmp_path, _train_constant)
+    real_pool = trainer._pool
+
+    def broken_once():
+        trainer._pool = real_pool
+        trainer._executor = None  # as _finish does after a worker crash
+        raise BrokenProcessPool("worker died")
+
+    trainer._pool = broken_once
+    np.testing.assert_array_equal(trainer.get_or_train(KEY_A, 0, 3), [0, 0, 0])
+    trainer.shutdown()
+
+
+def test_lazy_trainers_are_per_app(tmp_path):
+    db = str(tmp_path / "prediction_cache.sqlite")
+    a, b = get_lazy_trainer(db, _train_constant, "app_a"), get_lazy_trainer(db, _train_forever, "app_b")
+    assert a is get_lazy_trainer(db, _train_forever, "app_a")
+    assert a is not b and (a.train_fn, b.train_fn) == (_train_constant, _train_forever)
+    assert a.overlay.path != b.overlay.path
+    a.shutdown()
+    b.shutdown()
+
+
+# ---------------------------------------------------------------------------
+# Integer key codec
+# ---------------------------------------------------------------------------
+
+
+def test_key_codec_round_trip():
+    features = ["race", "age", "c_charge_desc"]
+    key = encode_key("The Deep Pattern-Finder", 7, "Medium (60%)", features)
+    assert 0 <= key < 2 ** 32
+    assert decode_key(key) == ("The Deep Pattern-Finder", 7, "Medium (60%)", ("age", "race", "c_charge_desc"))
+    assert int_to_legacy_key(key) == "The Deep Pattern-Finder|7|Medium (60%)|age,c_charge_desc,race"
+    assert legacy_key_to_int(int_to_legacy_key(key)) == key
+    # Feature order does not matter
+    assert encode_key("The Deep Pattern-Finder", 7, "Medium (60%)", reversed(features)) == key
+
+
+def test_key_codec_levels_are_consecutive():
+    keys = [encode_key("The Rule-Maker", level, "Full (100%)", ["sex"]) for level in range(1, 11)]
+    assert keys == list(range(keys[0], keys[0] + 10))
+
+
+def test_key_codec_is_injective_over_all_configurations():
+    import itertools
+
+    seen = set()
+    for model in MODEL_NAMES:
+        for size in DATA_SIZES:
+            for r in (1, 2, 11):
+                for combo in itertools.combinations(ALL_FEATURES, r):
+                    for level in range(1, 11):
+                        seen.add(encode_key(model, level, size, combo))
+    expected = len(MODEL_NAMES) * len(DATA_SIZES) * 10 * (11 + 55 + 1)
+    assert len(seen) == expected
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        ("Unknown", 1, "Small (20%)", ["age"]),
+        ("The Rule-Maker", 11, "Small (20%)", ["age"]),
+        ("The Rule-Maker", 1, "Pequeño (20%)", ["age"]),
+        ("The Rule-Maker", 1, "Small (20%)", ["nope"]),
+    ],
+)
+def test_key_codec_rejects_unknown_values(args):
+    with pytest.raises(CacheKeyError):
+        encode_key(*args)
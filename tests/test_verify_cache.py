@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the offline prediction cache verifier (verify_cache.py).
+
+Builds a small cache from the COMPAS fixture in tests/fixtures, so no network
+access is needed.
+
+Run with: pytest tests/test_verify_cache.py -v
+"""
+
+import os
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import precompute_cache  # noqa: E402
+import verify_cache  # noqa: E402
+from aimodelshare.moral_compass.prediction_cache import PredictionCacheWriter, encode_key  # noqa: E402
+
+COMPAS_FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "compas_sample.csv")
+N_TASKS = 40  # four Logistic Regression sweeps
+
+
+@pytest.fixture
+def small_cache(tmp_path, monkeypatch):
+    """Cache of the first N_TASKS tasks, built with the sweep engine from the fixture."""
+    monkeypatch.setattr(precompute_cache, "TOTAL_TASKS", N_TASKS)
+    monkeypatch.setattr(precompute_cache, "_ENGINE", None)
+    engine = precompute_cache.PrecomputeEngine(COMPAS_FIXTURE)
+    tasks = [precompute_cache.task_from_index(i) for i in range(N_TASKS)]
+    rows = [row for chunk in precompute_cache.iter_chunks(tasks, engine) for row in chunk[0](*chunk[1], **chunk[2])]
+
+    path = str(tmp_path / "prediction_cache.sqlite")
+    writer = PredictionCacheWriter(path)
+    for task_id, packed in rows:
+        task = precompute_cache.task_from_index(task_id)
+        writer.add(encode_key(*task), precompute_cache.unpack_predictions(packed, len(engine.y_test)))
+    writer.finalize()
+    return path, len(engine.y_test)
+
+
+def test_verify_passes_on_complete_cache(small_cache):
+    path, n_test = small_cache
+    report, ok = verify_cache.verify(path, COMPAS_FIXTURE, sample=10, lookups=200)
+
+    assert ok
+    assert report["keys"] == {
+        "expected": N_TASKS, "present": N_TASKS, "missing": 0, "extra": 0,
+        "missing_sample": [], "extra_sample": [],
+    }
+    assert report["lengths"]["expected_length"] == n_test
+    assert report["lengths"]["wrong_length"] == 0
+    assert report["retrain"]["checked"] == 10
+    assert report["retrain"]["differing"] == 0
+    assert report["timing"]["lookups"] == 200
+    assert 0 < report["timing"]["p50_ms"] <= report["timing"]["p99_ms"]
+
+
+def test_verify_reports_missing_extra_and_bad_vectors(small_cache, capsys):
+    path, n_test = small_cache
+    missing = precompute_cache.task_from_index(7)
+    extra = encode_key("The Rule-Maker", 1, "Full (100%)", ["age"])
+    conn = sqlite3.connect(path)
+    conn.execute("DELETE FROM cache WHERE key=?", (encode_key(*missing),))
+    conn.execute("INSERT INTO vectors (digest, value) VALUES (x'00', ?)", (b"PB\x01\x03\x00\x00\x00\x00",))
+    conn.execute("INSERT INTO cache (key, vector_id) VALUES (?, last_insert_rowid())", (extra,))
+    conn.commit()
+    conn.close()
+
+    report, ok = verify_cache.verify(path, None, sample=0, lookups=0)
+    assert not ok
+    assert (report["keys"]["missing"], report["keys"]["extra"]) == (1, 1)
+    assert report["keys"]["missing_sample"] == [missing]
+    assert report["keys"]["extra_sample"] == [extra]
+    assert report["lengths"]["expected_length"] == n_test
+    assert report["lengths"]["wrong_length"] == 1
+    assert "retrain" not in report and "timing" not in report
+
+    verify_cache.print_report(report, ok)
+    assert "VERIFICATION FAILED" in capsys.readouterr().out
+
+
+def test_retrain_flags_tampered_predictions(small_cache):
+    path, _ = small_cache
+    conn = sqlite3.connect(path)
+    (value,) = conn.execute(
+        "SELECT v.value FROM cache c JOIN vectors v ON v.id = c.vector_id WHERE c.key=?",
+        (encode_key(*precompute_cache.task_from_index(3)),),
+    ).fetchone()
+    flipped = value[:7] + bytes(255 - b for b in value[7:])
+    conn.execute("INSERT INTO vectors (digest, value) VALUES (x'01', ?)", (flipped,))
+    conn.execute(
+        "UPDATE cache SET vector_id=last_insert_rowid() WHERE key=?",
+        (encode_key(*precompute_cache.task_from_index(3)),),
+    )
+    conn.commit()
+    conn.close()
+
+    report, ok = verify_cache.verify(path, COMPAS_FIXTURE, sample=N_TASKS, lookups=0)
+    assert not ok
+    assert report["retrain"]["over_tolerance"] == 1
+    assert report["retrain"]["max_diff"] > 0.9
@@ -7,6 +7,7 @@ import pandas as pd
 
 # --- NEW IMPORT: For Session -> Token Conversion ---
 from aimodelshare.aws import get_token_from_session
+from aimodelshare.moral_compass.prediction_cache import PredictionCacheReader, encode_key
 
 # --- 1. CONFIGURATION ---
 DB_PATH = "prediction_cache.sqlite"
@@ -21,44 +22,28 @@ FEATURE_SET_GROUP_1_VALS = [
     "c_charge_degree", "days_b_screening_arrest"
 ]
 
-def get_db_connection():
+def get_db_reader():
     if not os.path.exists(DB_PATH):
         print(f"❌ Error: Database file '{DB_PATH}' not found.")
         sys.exit(1)
-    return sqlite3.connect(DB_PATH)
+    return PredictionCacheReader(DB_PATH)
 
-def test_cache_retrieval(conn):
+def test_cache_retrieval(reader):
     """Retrieves prediction list from SQLite using App logic."""
     print("\n🔬 TEST 1: Cache Retrieval")
     
-    sanitized_features = sorted([str(f) for f in FEATURE_SET_GROUP_1_VALS])
-    feature_key = ",".join(sanitized_features)
-    cache_key = f"{MODEL_NAME}|{COMPLEXITY}|{DATA_SIZE}|{feature_key}"
-    print(f"   ℹ️  Lookup Key: '{cache_key}'")
+    cache_key = encode_key(MODEL_NAME, COMPLEXITY, DATA_SIZE, FEATURE_SET_GROUP_1_VALS)
+    print(f"   ℹ️  Lookup Key: {cache_key}")
 
-    cursor = conn.cursor()
-    cursor.execute("SELECT value FROM cache WHERE key=?", (cache_key,))
-    row = cursor.fetchone()
-
-    if not row:
-        print("   ❌ FAIL: Key not found in DB.")
+    # Same pooled reader the apps use (decodes bit-packed BLOBs and legacy strings)
+    predictions = reader.get(cache_key)
+    if predictions is None:
+        print(f"   ❌ FAIL: Key not found in DB (reader stats: {reader.stats()}).")
         sys.exit(1)
 
-    raw_val = row[0]
-    try:
-        if isinstance(raw_val, str):
-            if raw_val.startswith("["):
-                predictions = json.loads(raw_val)
-            else:
-                predictions = [int(c) for c in raw_val]
-        else:
-            predictions = raw_val
-            
-        print(f"   ✅ SUCCESS: Retrieved {len(predictions)} predictions.")
-        return predictions
-    except Exception as e:
-        print(f"   ❌ FAIL: Parsing error: {e}")
-        sys.exit(1)
+    predictions = predictions.tolist()
+    print(f"   ✅ SUCCESS: Retrieved {len(predictions)} predictions.")
+    return predictions
 
 def test_live_submission(predictions):
     """Submits the retrieved predictions to the actual AIModelShare playground."""
@@ -149,8 +134,8 @@ def test_live_submission(predictions):
         sys.exit(1)
 
 if __name__ == "__main__":
-    conn = get_db_connection()
-    predictions = test_cache_retrieval(conn)
-    conn.close()
+    reader = get_db_reader()
+    predictions = test_cache_retrieval(reader)
+    reader.close()
     test_live_submission(predictions)
     print("\n--- ✅ ALL SYSTEM CHECKS PASSED ---")
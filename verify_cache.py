@@ -0,0 +1,248 @@
+"""
+Offline coverage and integrity check for prediction_cache.sqlite.
+
+Checks, without any network access:
+1. Key coverage: every task of precompute_cache.py's key space is present and
+   nothing else is (missing / extra keys).
+2. Vector lengths: every stored vector decodes to the test-set length.
+3. Sampled re-training: a random sample of entries is re-trained with
+   precompute_cache.process, in the build's sweep mode, and the predictions
+   are diffed (they should match exactly).
+4. Lookup latency: p50 / p99 of PredictionCacheReader.get over random keys.
+
+Usage:
+    python verify_cache.py prediction_cache.sqlite --csv compas.csv --sample 50
+
+Without --csv the re-training step is skipped and the test-set length comes
+from the database metadata. Pass --no-sweep for caches built with
+precompute_cache.py --no-sweep. Databases must use integer keys (schema 3+;
+rebuild older ones with convert_db.py). Exits non-zero if any check fails.
+"""
+
+import argparse
+import sqlite3
+import sys
+import time
+from collections import Counter
+
+import numpy as np
+
+import precompute_cache
+from aimodelshare.moral_compass.prediction_cache import (
+    PredictionCacheReader,
+    PredictionCodecError,
+    decode_key,
+    decode_predictions,
+    encode_key,
+)
+
+DB_FILE = "prediction_cache.sqlite"
+# Fraction of predictions a re-trained entry may differ by. Re-training uses the
+# build's own mode (sweep or not), which is deterministic, so the default is exact.
+MAX_DIFF_FRACTION = 0.0
+SAMPLE_SIZE = 50
+LOOKUP_COUNT = 2000
+
+
+def expected_keys():
+    """Integer keys of every precompute task, in task id order."""
+    return np.fromiter(
+        (encode_key(*precompute_cache.task_from_index(i)) for i in range(precompute_cache.TOTAL_TASKS)),
+        dtype=np.int64,
+        count=precompute_cache.TOTAL_TASKS,
+    )
+
+
+def _open(db_path):
+    return sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+
+
+def _meta(conn, name):
+    try:
+        row = conn.execute("SELECT value FROM meta WHERE name=?", (name,)).fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return row[0] if row else None
+
+
+def check_keys(conn, expected):
+    """Missing and extra keys against the expected key space."""
+    actual = np.fromiter((row[0] for row in conn.execute("SELECT key FROM cache")), dtype=np.int64)
+    missing = np.setdiff1d(expected, actual, assume_unique=True)
+    extra = np.setdiff1d(actual, expected)
+    return {
+        "expected": len(expected),
+        "present": len(actual),
+        "missing": len(missing),
+        "extra": len(extra),
+        "missing_sample": [decode_key(k) for k in missing[:5]],
+        "extra_sample": [int(k) for k in extra[:5]],
+    }
+
+
+def check_lengths(conn, expected_length=None):
+    """
+    Decode every stored vector and count those without the test-set length.
+
+    expected_length defaults to the test_rows / most common length.
+    """
+    lengths, undecodable = Counter(), 0
+    for (value,) in conn.execute("SELECT value FROM vectors"):
+        try:
+            lengths[len(decode_predictions(value))] += 1
+        except PredictionCodecError:
+            undecodable += 1
+    if expected_length is None:
+        test_rows = _meta(conn, "test_rows")
+        expected_length = int(test_rows) if test_rows else (lengths.most_common(1)[0][0] if lengths else 0)
+    return {
+        "vectors": sum(lengths.values()) + undecodable,
+        "expected_length": expected_length,
+        "wrong_length": sum(n for length, n in lengths.items() if length != expected_length),
+        "undecodable": undecodable,
+    }
+
+
+def check_retrain(reader, task_ids, max_diff=MAX_DIFF_FRACTION, sweep=True):
+    """
+    Re-train task_ids with precompute_cache.process and diff against the cache.
+
+    precompute_cache's engine must already hold the data the cache was built
+    from, and sweep must match the build (a sweep truncates one fit per level,
+    which differs from independent fits where tree splits tie).
+    """
+    rows = []
+    for task_id in task_ids:
+        task = precompute_cache.task_from_index(task_id)
+        cached = reader.get(encode_key(*task))
+        result = precompute_cache.process(task, sweep=sweep)
+        if cached is None or result is None:
+            rows.append((task[0], None))
+            continue
+        fresh = np.frombuffer(result[1].encode("ascii"), dtype=np.uint8) - 48
+        rows.append((task[0], float(np.mean(fresh != cached)) if len(fresh) == len(cached) else 1.0))
+
+    by_model = {}
+    for model, diff in rows:
+        entry = by_model.setdefault(model, {"checked": 0, "differing": 0, "max_diff": 0.0, "failed": 0})
+        entry["checked"] += 1
+        if diff is None:
+            entry["failed"] += 1
+        elif diff > 0:
+            entry["differing"] += 1
+            entry["max_diff"] = max(entry["max_diff"], diff)
+    diffs = [d for _, d in rows if d is not None]
+    return {
+        "checked": len(rows),
+        "failed": sum(d is None for _, d in rows),
+        "differing": sum(d > 0 for d in diffs),
+        "over_tolerance": sum(d > max_diff for d in diffs),
+        "max_diff": max(diffs, default=0.0),
+        "by_model": by_model,
+    }
+
+
+def time_lookups(db_path, keys):
+    """p50 / p99 latency of uncached reader lookups (LRU disabled)."""
+    reader = PredictionCacheReader(db_path, lru_bytes=0, log_every=0)
+    reader.get(int(keys[0]))  # open the pooled connection outside the timings
+    timings = []
+    for key in keys:
+        start = time.perf_counter()
+        reader.get(int(key))
+        timings.append(time.perf_counter() - start)
+    reader.close()
+    timings_ms = np.array(timings) * 1000.0
+    return {
+        "lookups": len(timings),
+        "p50_ms": float(np.percentile(timings_ms, 50)),
+        "p99_ms": float(np.percentile(timings_ms, 99)),
+        "max_ms": float(timings_ms.max()),
+    }
+
+
+def verify(db_path=DB_FILE, csv_path=None, sample=SAMPLE_SIZE, lookups=LOOKUP_COUNT, seed=0, max_diff=MAX_DIFF_FRACTION, sweep=True):
+    """Run every check; returns (report, ok)."""
+    rng = np.random.default_rng(seed)
+    expected = expected_keys()
+    report = {}
+
+    conn = _open(db_path)
+    try:
+        report["keys"] = check_keys(conn, expected)
+        expected_length = None
+        if csv_path:
+            precompute_cache._ENGINE = precompute_cache.PrecomputeEngine(csv_path)
+            expected_length = len(precompute_cache._ENGINE.y_test)
+        report["lengths"] = check_lengths(conn, expected_length)
+    finally:
+        conn.close()
+
+    if csv_path and sample > 0:
+        reader = PredictionCacheReader(db_path, log_every=0)
+        task_ids = rng.choice(precompute_cache.TOTAL_TASKS, size=min(sample, precompute_cache.TOTAL_TASKS), replace=False)
+        report["retrain"] = check_retrain(reader, np.sort(task_ids), max_diff, sweep)
+        reader.close()
+
+    if lookups > 0:
+        report["timing"] = time_lookups(db_path, rng.choice(expected, size=lookups))
+
+    ok = (
+        report["keys"]["missing"] == 0
+        and report["keys"]["extra"] == 0
+        and report["lengths"]["wrong_length"] == 0
+        and report["lengths"]["undecodable"] == 0
+        and ("retrain" not in report or (report["retrain"]["over_tolerance"] == 0 and report["retrain"]["failed"] == 0))
+    )
+    return report, ok
+
+
+def print_report(report, ok):
+    keys = report["keys"]
+    mark = "✅" if keys["missing"] == 0 and keys["extra"] == 0 else "❌"
+    print(f"{mark} Keys: {keys['present']} / {keys['expected']} present, {keys['missing']} missing, {keys['extra']} extra")
+    for task in keys["missing_sample"]:
+        print(f"   missing: {task}")
+    for key in keys["extra_sample"]:
+        print(f"   extra: {key}")
+
+    lengths = report["lengths"]
+    mark = "✅" if lengths["wrong_length"] == 0 and lengths["undecodable"] == 0 else "❌"
+    print(
+        f"{mark} Vectors: {lengths['vectors']} checked against length {lengths['expected_length']}, "
+        f"{lengths['wrong_length']} wrong length, {lengths['undecodable']} undecodable"
+    )
+
+    if "retrain" in report:
+        r = report["retrain"]
+        mark = "✅" if r["over_tolerance"] == 0 and r["failed"] == 0 else "❌"
+        print(
+            f"{mark} Re-train: {r['checked']} sampled, {r['differing']} differ "
+            f"(max {r['max_diff']:.2%}), {r['over_tolerance']} over tolerance, {r['failed']} missing/failed"
+        )
+        for model, m in r["by_model"].items():
+            print(f"   {model}: {m['checked']} checked, {m['differing']} differ (max {m['max_diff']:.2%})")
+    else:
+        print("⏭️  Re-train: skipped (no --csv)")
+
+    if "timing" in report:
+        t = report["timing"]
+        print(f"⏱️  Lookups: {t['lookups']} uncached, p50 {t['p50_ms']:.3f} ms, p99 {t['p99_ms']:.3f} ms, max {t['max_ms']:.1f} ms")
+
+    print("--- ✅ CACHE VERIFIED ---" if ok else "--- ❌ CACHE VERIFICATION FAILED ---")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Verify prediction_cache.sqlite coverage, vectors and latency offline.")
+    parser.add_argument("db", nargs="?", default=DB_FILE, help=f"Cache database (default: {DB_FILE})")
+    parser.add_argument("--csv", default=None, help="Local COMPAS CSV the cache was built from (enables re-training)")
+    parser.add_argument("--sample", type=int, default=SAMPLE_SIZE, help="Entries to re-train (0 = skip)")
+    parser.add_argument("--lookups", type=int, default=LOOKUP_COUNT, help="Timed lookups (0 = skip)")
+    parser.add_argument("--seed", type=int, default=0, help="Sampling seed")
+    parser.add_argument("--max-diff", type=float, default=MAX_DIFF_FRACTION, help="Allowed fraction of differing predictions per re-trained entry")
+    parser.add_argument("--no-sweep", dest="sweep", action="store_false", help="The cache was built with precompute_cache.py --no-sweep")
+    args = parser.parse_args()
+
+    report, ok = verify(args.db, args.csv, args.sample, args.lookups, args.seed, args.max_diff, args.sweep)
+    print_report(report, ok)
+    sys.exit(0 if ok else 1)